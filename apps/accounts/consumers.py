@@ -2,15 +2,16 @@
 WebSocket Consumers for waiter notifications.
 Real-time waiter alerts and task updates.
 """
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from config import broadcast, event_log, ws_auth, ws_codec
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
-class WaiterConsumer(AsyncWebsocketConsumer):
+class WaiterConsumer(broadcast.BroadcastConsumerMixin, event_log.ResumableConsumerMixin,
+                     ws_codec.CodecConsumerMixin, AsyncWebsocketConsumer):
     """
     Consumer for waiter notifications.
     Handles real-time alerts and task updates for waiters.
@@ -24,8 +25,14 @@ class WaiterConsumer(AsyncWebsocketConsumer):
         # Use restaurant group if waiter_id not provided
         if not self.waiter_id and self.restaurant_id:
             self.group_name = f'restaurant_{self.restaurant_id}_waiters'
+            allowed = ws_auth.is_staff_of(self.scope, self.restaurant_id)
         else:
             self.group_name = f'waiter_{self.waiter_id}'
+            allowed = ws_auth.can_join_waiter(self.scope, self.waiter_id)
+        
+        if not allowed:
+            await self.close(code=ws_auth.FORBIDDEN)
+            return
         
         await self.channel_layer.group_add(
             self.group_name,
@@ -34,12 +41,13 @@ class WaiterConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # Send welcome message
-        await self.send(text_data=json.dumps({
+        # Send welcome message; seq - номер последнего события ресторана
+        await self.send_message({
             'type': 'connection',
             'message': 'Connected to waiter notifications',
-            'group': self.group_name
-        }))
+            'group': self.group_name,
+            'seq': await self.current_seq()
+        })
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
@@ -48,55 +56,52 @@ class WaiterConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
     
-    async def receive(self, text_data):
+    def resume_restaurant_id(self):
+        # Ресторан официанта берется из токена
+        return self.restaurant_id or self.scope.get('restaurant_id')
+    
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages."""
         try:
-            data = json.loads(text_data)
+            data = ws_codec.loads(text_data, bytes_data)
             action = data.get('action')
             
             if action == 'acknowledge':
                 notification_id = data.get('notification_id')
                 await self.acknowledge_notification(notification_id)
+            elif action == 'resume':
+                await self.resume(data.get('last_seq'))
             elif action == 'get_tasks':
                 tasks = await self.get_waiter_tasks()
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'tasks_list',
                     'tasks': tasks
-                }))
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'error': 'Invalid JSON'
-            }))
+                })
+        except ValueError:
+            await self.send_message({
+                'error': 'Invalid message'
+            })
     
     # Receive message from waiter group
     async def order_notification(self, event):
         """Send order notification to waiter."""
-        await self.send(text_data=json.dumps({
-            'type': 'order_notification',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def payment_notification(self, event):
         """Send payment notification to waiter."""
-        await self.send(text_data=json.dumps({
-            'type': 'payment_notification',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def task_notification(self, event):
         """Send task notification to waiter."""
-        await self.send(text_data=json.dumps({
-            'type': 'task_notification',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def alert(self, event):
         """Send alert to waiter."""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'alert',
             'message': event['message'],
             'priority': event.get('priority', 'normal')
-        }))
+        })
     
     @database_sync_to_async
     def get_waiter_tasks(self):
@@ -124,7 +129,8 @@ class WaiterConsumer(AsyncWebsocketConsumer):
         pass
 
 
-class RestaurantNotificationConsumer(AsyncWebsocketConsumer):
+class RestaurantNotificationConsumer(broadcast.BroadcastConsumerMixin, event_log.ResumableConsumerMixin,
+                                     ws_codec.CodecConsumerMixin, AsyncWebsocketConsumer):
     """
     Consumer for restaurant-wide notifications.
     Sends notifications to all staff in a restaurant.
@@ -135,6 +141,10 @@ class RestaurantNotificationConsumer(AsyncWebsocketConsumer):
         self.restaurant_id = self.scope['url_route']['kwargs']['restaurant_id']
         self.group_name = f'restaurant_{self.restaurant_id}'
         
+        if not ws_auth.is_staff_of(self.scope, self.restaurant_id):
+            await self.close(code=ws_auth.FORBIDDEN)
+            return
+        
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
@@ -149,51 +159,45 @@ class RestaurantNotificationConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages."""
         try:
-            data = json.loads(text_data)
+            data = ws_codec.loads(text_data, bytes_data)
             action = data.get('action')
             
-            if action == 'get_status':
+            if action == 'resume':
+                await self.resume(data.get('last_seq'))
+            elif action == 'get_status':
                 status = await self.get_restaurant_status()
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'restaurant_status',
                     'data': status
-                }))
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'error': 'Invalid JSON'
-            }))
+                })
+        except ValueError:
+            await self.send_message({
+                'error': 'Invalid message'
+            })
     
     # Receive messages from restaurant group
     async def new_order(self, event):
         """Notify about new order."""
-        await self.send(text_data=json.dumps({
-            'type': 'new_order',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def order_ready(self, event):
         """Notify when order is ready."""
-        await self.send(text_data=json.dumps({
-            'type': 'order_ready',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def payment_completed(self, event):
         """Notify about payment completion."""
-        await self.send(text_data=json.dumps({
-            'type': 'payment_completed',
-            'data': event['data']
-        }))
+        await self.forward(event)
+    
+    async def table_update(self, event):
+        """Notify about table occupancy change."""
+        await self.forward(event)
     
     async def restaurant_broadcast(self, event):
         """Send broadcast message to restaurant."""
-        await self.send(text_data=json.dumps({
-            'type': 'broadcast',
-            'message': event['message']
-        }))
+        await self.forward(event)
     
     @database_sync_to_async
     def get_restaurant_status(self):
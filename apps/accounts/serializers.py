@@ -2,6 +2,7 @@
 Serializers for accounts app.
 """
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
 from drf_spectacular.utils import extend_schema_field
 from django.contrib.auth import get_user_model
 from .models import GuestSession
@@ -99,3 +100,18 @@ class ChangePasswordSerializer(serializers.Serializer):
         if data['new_password'] != data['new_password_confirm']:
             raise serializers.ValidationError({'new_password': 'Пароли не совпадают.'})
         return data
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """
+    JWT pair with role and restaurant claims, so WebSocket connections
+    can be authorized without loading the user.
+    """
+    
+    @classmethod
+    def get_token(cls, user):
+        from config.ws_auth import identity_claims
+        token = super().get_token(user)
+        for claim, value in identity_claims(user).items():
+            token[claim] = value
+        return token
@@ -0,0 +1,206 @@
+"""
+Tests for the waiter dashboard API and WebSocket authorization.
+Run: python manage.py test apps (or pytest)
+"""
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.orders import sync
+from apps.orders.models import Order
+from apps.orders.tests import LOCAL_BACKENDS, OrderTestCase
+from apps.restaurants.models import Restaurant
+from apps.tables.models import Table
+from config import broadcast, event_log
+from config.asgi_routing import websocket_urlpatterns
+from config.ws_auth import TokenAuthMiddleware, authenticate, guest_token, staff_token
+from . import views_waiter
+from .models import User
+
+ORDERS_URL = '/waiter/api/orders/?status=pending,confirmed'
+
+
+@LOCAL_BACKENDS
+class WaiterOrdersSyncTests(OrderTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.waiter)
+
+    def age(self, *orders, seconds=60):
+        # Изменения старше окна оседания попадают под водяной знак
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+            updated_at=timezone.now() - timedelta(seconds=seconds)
+        )
+
+    def since(self, watermark, **headers):
+        return self.client.get(f'{ORDERS_URL}&since={watermark}', **headers)
+
+    def test_changes_since_watermark(self):
+        stays, leaves = self.create_order(), self.create_order()
+        self.age(stays, leaves)
+        response = self.client.get(ORDERS_URL)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.client.get(ORDERS_URL, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        watermark = response.data['watermark']
+
+        unchanged = self.since(watermark)
+        self.assertEqual((unchanged.data['results'], unchanged.data['removed']), ([], []))
+        self.assertEqual(self.since(watermark, HTTP_IF_NONE_MATCH=unchanged['ETag']).status_code, 304)
+
+        # Один заказ вышел из фильтра (tombstone), другой появился
+        leaves.mark_as_ready()
+        added = self.create_order()
+        changed = self.since(watermark, HTTP_IF_NONE_MATCH=unchanged['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([order['id'] for order in changed.data['results']], [added.pk])
+        self.assertEqual(changed.data['removed'], [leaves.pk])
+
+    def test_batches_follow_watermark(self):
+        watermark = sync.encode_watermark((timezone.now() - timedelta(hours=1), 0))
+        orders = [self.create_order() for _ in range(5)]
+        for i, order in enumerate(orders):
+            self.age(order, seconds=30 - i)
+
+        seen = []
+        with mock.patch.object(views_waiter, 'SYNC_BATCH_SIZE', 2):
+            while True:
+                response = self.since(watermark)
+                seen += [order['id'] for order in response.data['results']]
+                watermark = response.data['watermark']
+                if not response.data['has_more']:
+                    break
+        self.assertEqual(seen, [order.pk for order in orders])
+
+    def test_bad_watermark(self):
+        self.assertEqual(self.since('zzz').status_code, 400)
+
+
+@LOCAL_BACKENDS
+class WebSocketAuthTests(OrderTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        other_owner = User.objects.create(username='other-owner', role=User.Role.OWNER)
+        other = Restaurant.objects.create(
+            name='Other', slug='other', owner=other_owner, phone='0', address='-', city='-'
+        )
+        cls.stranger = User.objects.create(
+            username='stranger', role=User.Role.WAITER, restaurant=other
+        )
+        cls.other_table = Table.objects.create(restaurant=other, number='9', qr_code='qr.png')
+
+    def setUp(self):
+        self.app = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        self.waiter_token = str(staff_token(self.waiter))
+        self.stranger_token = str(staff_token(self.stranger))
+        self.guest_token = guest_token(self.session)
+
+    async def joins(self, path, token=None):
+        if token:
+            path = f'{path}?token={token}'
+        communicator = WebsocketCommunicator(self.app, path)
+        connected, _ = await communicator.connect()
+        await communicator.disconnect()
+        return connected
+
+    def test_tokens_carry_identity_without_queries(self):
+        with self.assertNumQueries(0):
+            staff, guest = authenticate(self.waiter_token), authenticate(self.guest_token)
+        self.assertEqual(
+            (staff['role'], staff['user_id'], staff['restaurant_id']),
+            (User.Role.WAITER, self.waiter.pk, self.restaurant.pk),
+        )
+        self.assertEqual(
+            (guest['table_session_id'], guest['restaurant_id']),
+            (self.session.pk, self.restaurant.pk),
+        )
+        self.assertIsNone(authenticate('garbage')['role'])
+
+    def test_login_token_has_restaurant_claim(self):
+        self.waiter.set_password('password123')
+        self.waiter.save()
+        response = APIClient().post('/api/auth/token/', {
+            'username': 'waiter', 'password': 'password123',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(authenticate(response.json()['access'])['restaurant_id'], self.restaurant.pk)
+
+    async def test_staff_joins_only_own_restaurant(self):
+        restaurant = f'/ws/restaurants/{self.restaurant.pk}/'
+        self.assertTrue(await self.joins(restaurant, self.waiter_token))
+        self.assertTrue(await self.joins(f'{restaurant}kitchen/', self.waiter_token))
+        self.assertFalse(await self.joins(restaurant, self.stranger_token))
+        self.assertFalse(await self.joins(restaurant, self.guest_token))
+        self.assertFalse(await self.joins(restaurant))
+        self.assertTrue(await self.joins(f'/ws/waiters/{self.waiter.pk}/', self.waiter_token))
+        self.assertFalse(await self.joins(f'/ws/waiters/{self.waiter.pk}/', self.stranger_token))
+
+    async def test_guest_joins_only_own_table(self):
+        session = f'/ws/tables/sessions/{self.session.pk}/'
+        self.assertTrue(await self.joins(session, self.guest_token))
+        self.assertTrue(await self.joins(session, self.waiter_token))
+        self.assertFalse(await self.joins(session, self.stranger_token))
+        self.assertTrue(await self.joins(f'/ws/tables/{self.table.pk}/', self.guest_token))
+        self.assertFalse(await self.joins(f'/ws/tables/{self.other_table.pk}/', self.guest_token))
+
+
+@LOCAL_BACKENDS
+class ResumeTests(OrderTestCase):
+
+    def setUp(self):
+        self.app = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        self.token = staff_token(self.waiter)
+        event_log._log = event_log.LocalEventLog()
+        self.addCleanup(setattr, event_log, '_log', None)
+        self.restaurant_group = f'restaurant_{self.restaurant.pk}'
+        for group, message in (
+            (self.restaurant_group, {'type': 'restaurant_broadcast', 'message': 'a'}),
+            (f'waiter_{self.waiter.pk}', {'type': 'order_notification', 'data': {}}),
+            (self.restaurant_group, {'type': 'restaurant_broadcast', 'message': 'b'}),
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                broadcast.send(group, message, restaurant_id=self.restaurant.pk)
+
+    @async_to_sync
+    async def resume(self, path, *last_seqs, greeting=False):
+        communicator = WebsocketCommunicator(self.app, f'{path}?token={self.token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        if greeting:
+            await communicator.receive_json_from()
+        replies = []
+        for last_seq in last_seqs:
+            await communicator.send_json_to({'action': 'resume', 'last_seq': last_seq})
+            while True:
+                reply = await communicator.receive_json_from()
+                replies.append(reply)
+                if reply['type'] in ('resumed', 'resync'):
+                    break
+        await communicator.disconnect()
+        return replies
+
+    def test_replays_only_own_groups(self):
+        restaurant = self.resume(f'/ws/restaurants/{self.restaurant.pk}/', 0)
+        self.assertEqual(
+            [(reply.get('message'), reply['seq']) for reply in restaurant],
+            [('a', 1), ('b', 3), (None, 3)],
+        )
+        self.assertEqual(restaurant[-1], {'type': 'resumed', 'seq': 3, 'replayed': 2})
+
+        waiter = self.resume(f'/ws/waiters/{self.waiter.pk}/', 1, greeting=True)
+        self.assertEqual([(reply['type'], reply['seq']) for reply in waiter], [
+            ('order_notification', 2), ('resumed', 3),
+        ])
+
+    def test_bad_or_lost_position_asks_for_resync(self):
+        replies = self.resume(f'/ws/waiters/{self.waiter.pk}/', [1], -1, True, 9, greeting=True)
+        self.assertEqual([reply['type'] for reply in replies], ['resync'] * 4)
+        # Клиент перезагружает снимок и продолжает с текущего номера
+        self.assertEqual(len({reply['seq'] for reply in replies}), 1)
@@ -7,7 +7,8 @@ from .views_waiter import (
     waiter_orders,
     waiter_tasks,
     update_order,
-    restaurant_statistics
+    restaurant_statistics,
+    waiter_ws_token
 )
 
 app_name = 'waiter'
@@ -20,5 +21,6 @@ urlpatterns = [
     path('api/orders/', waiter_orders, name='orders'),
     path('api/tasks/', waiter_tasks, name='tasks'),
     path('api/statistics/', restaurant_statistics, name='statistics'),
+    path('api/ws-token/', waiter_ws_token, name='ws-token'),
     path('api/orders/<str:order_id>/', update_order, name='update-order'),
 ]
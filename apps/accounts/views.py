@@ -6,6 +6,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import get_user_model
+from config.ws_auth import guest_token
 from .serializers import (
     UserSerializer, UserCreateSerializer, UserProfileSerializer,
     GuestSessionSerializer, ChangePasswordSerializer
@@ -115,6 +116,9 @@ class GuestSessionViewSet(viewsets.ModelViewSet):
         """Create new guest session"""
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            guest_session = serializer.save()
+            data = dict(serializer.data)
+            # Token for the table session WebSocket (ws/tables/sessions/<id>/?token=...)
+            data['ws_token'] = guest_token(guest_session.table_session)
+            return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -1,18 +1,29 @@
 """
 Views for waiter panel.
 """
+import hashlib
+
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from apps.orders.models import Order
+from apps.orders.models import Order, ArchivedOrder
+from apps.orders import sync
 from apps.orders.serializers import OrderDetailSerializer
 from apps.accounts.permissions import IsWaiter
+from config.pagination import KeysetPagination
+from config.ws_auth import staff_token
+
+
+# Maximum number of changed orders returned by one ?since= poll
+SYNC_BATCH_SIZE = 200
 
 
 class WaiterLoginView(LoginView):
@@ -37,34 +48,85 @@ def waiter_dashboard(request):
     if not request.user.is_waiter:
         return render(request, 'waiter/unauthorized.html', {'error': 'Access denied. Waiter role required.'}, status=403)
     
+    token = staff_token(request.user)
     context = {
         'user': request.user,
+        'ws_token': str(token),
+        'ws_token_expires': token['exp'],
     }
     return render(request, 'waiter/dashboard.html', context)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsWaiter])
+def waiter_ws_token(request):
+    """Fresh WebSocket token for the dashboard (the page token expires)."""
+    token = staff_token(request.user)
+    return Response({'token': str(token), 'expires_at': token['exp']})
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsWaiter])
 def waiter_orders(request):
-    """Get orders for waiter."""
+    """
+    Get orders for waiter.
+
+    Without ``since`` returns a cursor-paginated list. With ``since`` (the
+    ``watermark`` of a previous response) returns only orders changed after
+    it, plus ``removed`` ids of orders that no longer match the filter.
+    Responses carry an ETag; a matching If-None-Match gets 304.
+    """
     restaurant = request.user.restaurant
     
     # Get query parameters for filtering
     status = request.query_params.get('status')
-    
-    queryset = Order.objects.filter(
-        table_session__table__restaurant=restaurant
-    ).select_related('table_session', 'guest_session')
-    
-    if status:
-        statuses = status.split(',')
+    statuses = status.split(',') if status else None
+    
+    restaurant_orders = Order.objects.filter(table_session__table__restaurant=restaurant)
+    
+    # Cheap version check: one index lookup for the latest change
+    now = timezone.now()
+    version = sync.latest_change(restaurant_orders)
+    etag = quote_etag(hashlib.md5(
+        f'{version}|{request.query_params.urlencode()}'.encode()
+    ).hexdigest())
+    if sync.is_settled(version, now) and etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=304, headers={'ETag': etag})
+    
+    queryset = restaurant_orders.select_related(
+        'table_session__table__restaurant', 'guest_session', 'waiter'
+    ).prefetch_related('items__menu_item')
+    
+    since = request.query_params.get('since')
+    if since:
+        try:
+            since = sync.decode_watermark(since)
+        except ValueError:
+            return Response({'error': 'Invalid since watermark'}, status=400)
+        
+        rows, has_more = sync.changes_since(restaurant_orders, since, SYNC_BATCH_SIZE)
+        changed = [pk for pk, updated_at, order_status in rows if not statuses or order_status in statuses]
+        removed = [pk for pk, updated_at, order_status in rows if statuses and order_status not in statuses]
+        results = queryset.filter(pk__in=changed).order_by('updated_at', 'id') if changed else []
+        return Response({
+            'watermark': sync.encode_watermark(sync.next_watermark(since, rows, has_more, now)),
+            'has_more': has_more,
+            'results': OrderDetailSerializer(results, many=True).data,
+            'removed': removed,
+        }, headers={'ETag': etag})
+    
+    if statuses:
         queryset = queryset.filter(status__in=statuses)
     
-    serializer = OrderDetailSerializer(queryset, many=True)
-    return Response({
-        'count': queryset.count(),
-        'results': serializer.data
-    })
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = OrderDetailSerializer(page, many=True)
+    response = paginator.get_paginated_response(serializer.data)
+    # Watermark is taken before the listing, so later changes are synced next time
+    watermark = min(version, sync.settle_floor(now)) if version else sync.settle_floor(now)
+    response.data['watermark'] = sync.encode_watermark(watermark)
+    response['ETag'] = etag
+    return response
 
 
 @api_view(['GET'])
@@ -107,8 +169,9 @@ def update_order(request, order_id):
         
         # Update status
         if 'status' in request.data:
-            order.status = request.data['status']
-            order.save()
+            transition = Order.transition_for_status(request.data['status'])
+            if transition is None or not order.transition(transition, changed_by=request.user):
+                return Response({'error': 'Invalid status transition'}, status=400)
         
         serializer = OrderDetailSerializer(order)
         return Response(serializer.data)
@@ -123,9 +186,10 @@ def restaurant_statistics(request):
     """Get restaurant statistics for waiter."""
     restaurant = request.user.restaurant
     
+    # Paid and cancelled orders are eventually moved to the archive
     total_orders = Order.objects.filter(
         table_session__table__restaurant=restaurant
-    ).count()
+    ).count() + ArchivedOrder.objects.filter(restaurant=restaurant).count()
     
     pending_orders = Order.objects.filter(
         table_session__table__restaurant=restaurant,
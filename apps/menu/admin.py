@@ -54,6 +54,7 @@ class MenuCategoryAdmin(admin.ModelAdmin):
             count
         )
     items_count_display.short_description = _('Items')
+    items_count_display.admin_order_field = 'available_items_count'
     
     def is_active_badge(self, obj):
         """Display active status badge."""
@@ -63,7 +64,7 @@ class MenuCategoryAdmin(admin.ModelAdmin):
     is_active_badge.short_description = _('Status')
     
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
+        qs = super().get_queryset(request).with_item_counts()
         if request.user.is_superuser:
             return qs
         if request.user.is_owner:
@@ -1,7 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MenuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.menu'
     verbose_name = 'Menu'
+
+    def ready(self):
+        """Import signals when app is ready."""
+        import apps.menu.signals
+        # После каждого migrate, в том числе отката
+        post_migrate.connect(apps.menu.signals.ensure_search_index, sender=self)
@@ -0,0 +1,255 @@
+"""
+Derived images for menu item photos, restaurant logos and covers.
+
+Uploads are served as they were uploaded, often several megabytes. After an
+upload is committed, the pipeline renders the image at fixed widths (never
+wider than the original) as WebP and JPEG, without EXIF (orientation is
+applied first), plus a blurred 16px placeholder as a data URI. Files are
+stored under the SHA-256 of the source (``derived/ab/abcd.../320.webp``), so
+their URLs never change content and a re-uploaded photo reuses them.
+
+The result is kept in a JSON field next to the image field
+(``MenuItem.image_variants`` etc.) and exposed by serializers as srcset data
+(``ResponsiveImageField``):
+
+    {"source": "menu/items/soup.jpg", "hash": "...", "width": 1600, "height": 1200,
+     "placeholder": "data:image/jpeg;base64,...",
+     "webp": [[160, "derived/.../160.webp"], ...], "jpeg": [[160, "..."], ...]}
+
+``IMAGE_PIPELINE`` selects where rendering runs: 'celery' (the
+generate_image_variants task), 'local' (a thread pool in this process;
+Pillow releases the GIL while resizing and encoding) or 'inline' (right
+after commit, on the saving thread).
+"""
+import base64
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageFilter, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Меняется при изменении формата производных: все изображения пересобираются
+PIPELINE_VERSION = b'1'
+QUALITY = 80
+PLACEHOLDER_WIDTH = 16
+
+
+class ImageSpec:
+    """
+    Поле изображения модели, поле его производных и ширины копий.
+    """
+
+    def __init__(self, variants_field, widths, restaurant_path=''):
+        self.variants_field = variants_field
+        self.widths = widths
+        # Путь от модели к ресторану ('' - это сам ресторан)
+        self.restaurant_path = restaurant_path
+    
+    def restaurant_lookup(self, field):
+        """Lookup поля ресторана, например 'id' -> 'category__restaurant__id'."""
+        return f'{self.restaurant_path}__{field}' if self.restaurant_path else field
+
+
+SPECS = {
+    ('menu.MenuItem', 'image'): ImageSpec(
+        'image_variants', (160, 320, 640, 960), 'category__restaurant'
+    ),
+    ('restaurants.Restaurant', 'logo'): ImageSpec('logo_variants', (80, 160, 320)),
+    ('restaurants.Restaurant', 'cover_image'): ImageSpec('cover_image_variants', (640, 960, 1280, 1920)),
+}
+
+
+def pipeline_mode():
+    return getattr(settings, 'IMAGE_PIPELINE', 'celery')
+
+
+def specs_for(model):
+    """(поле изображения, ImageSpec) модели."""
+    label = model._meta.label
+    return [(field, spec) for (model_label, field), spec in SPECS.items() if model_label == label]
+
+
+def derived_name(digest, width, extension):
+    return f'derived/{digest[:2]}/{digest}/{width}.{extension}'
+
+
+# Обработка
+def _flatten(image):
+    """RGB-копия изображения (прозрачность - на белом фоне) для JPEG."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, extension):
+    output = io.BytesIO()
+    if extension == 'webp':
+        image.save(output, 'WEBP', quality=QUALITY, method=4)
+    else:
+        _flatten(image).save(output, 'JPEG', quality=QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def target_widths(original_width, widths):
+    """Ширины копий: не шире оригинала; меньший оригинал - одной копией своей ширины."""
+    fitting = [width for width in widths if width <= original_width]
+    return fitting or [original_width]
+
+
+def render_variants(data, widths):
+    """
+    Копии изображения из байтов data.
+
+    Возвращает (ширина, высота, placeholder, [(формат, ширина, байты), ...]).
+    EXIF не копируется; поворот из EXIF применяется до уменьшения.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'P', 'PA') else 'RGB')
+        width, height = image.size
+
+        files = []
+        for target in target_widths(width, widths):
+            resized = image if target == width else image.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS
+            )
+            for extension in ('webp', 'jpeg'):
+                files.append((extension, target, _encode(resized, extension)))
+
+        tiny = image.resize(
+            (PLACEHOLDER_WIDTH, max(1, round(height * PLACEHOLDER_WIDTH / width))), Image.BILINEAR
+        )
+        output = io.BytesIO()
+        _flatten(tiny).filter(ImageFilter.GaussianBlur(1)).save(output, 'JPEG', quality=50)
+        placeholder = 'data:image/jpeg;base64,' + base64.b64encode(output.getvalue()).decode()
+    return width, height, placeholder, files
+
+
+def build_variants(name, data, widths):
+    """Отрисовать и сохранить копии; данные для поля производных."""
+    digest = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()
+    variants = {'source': name, 'hash': digest}
+    try:
+        width, height, placeholder, files = render_variants(data, widths)
+    except Exception:
+        # Не изображение или слишком большое: отдается оригинал
+        logger.warning('Cannot derive images from %s', name, exc_info=True)
+        return variants
+
+    variants.update(width=width, height=height, placeholder=placeholder, webp=[], jpeg=[])
+    for extension, target, content in files:
+        path = derived_name(digest, target, extension)
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(content))
+        variants[extension].append([target, path])
+    return variants
+
+
+def generate_variants(model_label, pk, field_name, force=False):
+    """
+    Собрать производные изображения field_name объекта pk.
+
+    Возвращает True, если поле производных обновлено.
+    """
+    spec = SPECS[(model_label, field_name)]
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return False
+    image = getattr(instance, field_name)
+    current = getattr(instance, spec.variants_field) or {}
+
+    if not image:
+        variants = {}
+    else:
+        with image.open('rb') as source:
+            data = source.read()
+        digest = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()
+        if not force and current.get('hash') == digest and current.get('source') == image.name:
+            return False
+        variants = build_variants(image.name, data, spec.widths)
+    if variants == current:
+        return False
+
+    # Изображение могли заменить, пока шла обработка: тогда запись не трогается
+    if image.name:
+        unchanged = Q(**{field_name: image.name})
+    else:
+        unchanged = Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+    updated = model.objects.filter(unchanged, pk=pk).update(**{spec.variants_field: variants})
+    if updated:
+        # Меню ресторана показывает новые копии со следующей версии
+        from . import snapshot
+        restaurant_id = model.objects.filter(pk=pk).values_list(
+            spec.restaurant_lookup('id'), flat=True
+        ).first()
+        if restaurant_id is not None:
+            snapshot.bump_version(restaurant_id)
+    return bool(updated)
+
+
+# Запуск после загрузки
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2),
+                    thread_name_prefix='image-pipeline'
+                )
+    return _executor
+
+
+def _run_local(model_label, pk, field_name):
+    close_old_connections()
+    try:
+        generate_variants(model_label, pk, field_name)
+    except Exception:
+        logger.exception('Image pipeline failed for %s %s.%s', model_label, pk, field_name)
+    finally:
+        close_old_connections()
+
+
+def _dispatch(model_label, pk, field_name):
+    mode = pipeline_mode()
+    if mode == 'local':
+        _get_executor().submit(_run_local, model_label, pk, field_name)
+    elif mode == 'inline':
+        generate_variants(model_label, pk, field_name)
+    else:
+        from .tasks import generate_image_variants
+        generate_image_variants.delay(model_label, pk, field_name)
+
+
+def schedule_variants(instance):
+    """Запланировать обработку изображений объекта, загруженных или удаленных с прошлого раза."""
+    label = instance._meta.label
+    for field_name, spec in specs_for(type(instance)):
+        name = getattr(instance, field_name).name or ''
+        current = getattr(instance, spec.variants_field) or {}
+        if name != current.get('source', ''):
+            # Обработка читает зафиксированный объект; ошибка запуска (нет брокера)
+            # не должна превращать сохраненную запись в ошибку запроса
+            transaction.on_commit(
+                lambda pk=instance.pk, field_name=field_name: _dispatch(label, pk, field_name),
+                robust=True
+            )
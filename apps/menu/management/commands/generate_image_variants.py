@@ -0,0 +1,42 @@
+"""
+Management command to derive resized copies of existing images.
+Usage: python manage.py generate_image_variants [--restaurant slug] [--force]
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from apps.menu.images import SPECS, generate_variants
+
+
+class Command(BaseCommand):
+    help = 'Собрать уменьшенные копии фото блюд, логотипов и обложек'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--restaurant',
+            help='Slug ресторана (по умолчанию все рестораны)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересобрать копии, даже если они уже есть'
+        )
+    
+    def handle(self, *args, **options):
+        processed = 0
+        updated = 0
+        for (model_label, field_name), spec in SPECS.items():
+            model = apps.get_model(model_label)
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).order_by('pk')
+            if options['restaurant']:
+                queryset = queryset.filter(**{spec.restaurant_lookup('slug'): options['restaurant']})
+            
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                processed += 1
+                if generate_variants(model_label, pk, field_name, force=options['force']):
+                    updated += 1
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} images, updated {updated}.'
+        ))
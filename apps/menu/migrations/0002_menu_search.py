@@ -0,0 +1,96 @@
+from django.db import migrations
+
+# PostgreSQL: колонка tsvector вычисляется из названия и описания при каждой
+# записи строки; pg_trgm ищет по названию с опечатками
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE menu_menuitem ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian'::regconfig, coalesce(name, '')), 'A')
+        || setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian'::regconfig, coalesce(description, '')), 'B')
+        || setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX menu_menuitem_search_idx ON menu_menuitem USING gin (search_vector)",
+    "CREATE INDEX menu_menuitem_name_trgm_idx ON menu_menuitem USING gin (name gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS menu_menuitem_name_trgm_idx",
+    "DROP INDEX IF EXISTS menu_menuitem_search_idx",
+    "ALTER TABLE menu_menuitem DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite: FTS5-таблица (rowid = id позиции) заполняется триггерами. SQLite
+# пересоздает таблицу при AlterField, и триггеры удаляются вместе со старой -
+# такая миграция MenuItem должна создать их заново
+_SQLITE_ROW = (
+    "replace(replace({row}.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace({row}.description, 'ё', 'е'), 'Ё', 'Е')"
+)
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE menu_menuitem_search USING fts5(name, description, tokenize = 'trigram')",
+    f"""
+    INSERT INTO menu_menuitem_search (rowid, name, description)
+    SELECT id, {_SQLITE_ROW.format(row='menu_menuitem')} FROM menu_menuitem
+    """,
+    f"""
+    CREATE TRIGGER menu_menuitem_search_insert AFTER INSERT ON menu_menuitem BEGIN
+        INSERT INTO menu_menuitem_search (rowid, name, description)
+        VALUES (new.id, {_SQLITE_ROW.format(row='new')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER menu_menuitem_search_update AFTER UPDATE OF name, description ON menu_menuitem BEGIN
+        DELETE FROM menu_menuitem_search WHERE rowid = old.id;
+        INSERT INTO menu_menuitem_search (rowid, name, description)
+        VALUES (new.id, {_SQLITE_ROW.format(row='new')});
+    END
+    """,
+    """
+    CREATE TRIGGER menu_menuitem_search_delete AFTER DELETE ON menu_menuitem BEGIN
+        DELETE FROM menu_menuitem_search WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS menu_menuitem_search_delete",
+    "DROP TRIGGER IF EXISTS menu_menuitem_search_update",
+    "DROP TRIGGER IF EXISTS menu_menuitem_search_insert",
+    "DROP TABLE IF EXISTS menu_menuitem_search",
+]
+
+STATEMENTS = {
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def _run(schema_editor, index):
+    # На остальных базах поиск идет подстрокой, индекса нет
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements:
+        for sql in statements[index]:
+            schema_editor.execute(sql, params=None)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, 0)
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("menu", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("menu", "0002_menu_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="menuitem",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Заполняется после загрузки фото (apps.menu.images)",
+                verbose_name="Уменьшенные копии фото",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("menu", "0003_image_variants"),
+        ("restaurants", "0002_image_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MenuVersion",
+            fields=[
+                (
+                    "restaurant",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="menu_version",
+                        serialize=False,
+                        to="restaurants.restaurant",
+                        verbose_name="Ресторан",
+                    ),
+                ),
+                (
+                    "version",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Версия меню"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Версия меню",
+                "verbose_name_plural": "Версии меню",
+            },
+        ),
+    ]
@@ -2,11 +2,24 @@
 Menu models.
 """
 from django.db import models
+from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
 
+class MenuCategoryQuerySet(models.QuerySet):
+    """
+    QuerySet категорий меню.
+    """
+    
+    def with_item_counts(self):
+        """Число доступных блюд каждой категории в том же запросе."""
+        return self.annotate(
+            available_items_count=Count('items', filter=Q(items__is_available=True))
+        )
+
+
 class MenuCategory(models.Model):
     """
     Категория меню (Супы, Салаты, Основные блюда и т.д.)
@@ -57,6 +70,8 @@ class MenuCategory(models.Model):
         verbose_name=_('Дата обновления')
     )
     
+    objects = MenuCategoryQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Категория меню')
         verbose_name_plural = _('Категории меню')
@@ -68,8 +83,11 @@ class MenuCategory(models.Model):
     
     @property
     def items_count(self):
-        """Количество блюд в категории"""
-        return self.items.filter(is_available=True).count()
+        """Количество блюд в категории (из with_item_counts(), если есть)"""
+        count = getattr(self, 'available_items_count', None)
+        if count is None:
+            count = self.items.filter(is_available=True).count()
+        return count
 
 
 class MenuItem(models.Model):
@@ -101,6 +119,14 @@ class MenuItem(models.Model):
         verbose_name=_('Фото блюда')
     )
     
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_('Уменьшенные копии фото'),
+        help_text=_('Заполняется после загрузки фото (apps.menu.images)')
+    )
+    
     price = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -222,13 +248,34 @@ class MenuItem(models.Model):
             return True
         return self.stock_quantity > 0
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Остаток при загрузке: save() сбрасывает счетчик, только если он изменен
+        if 'stock_quantity' in field_names:
+            instance._loaded_stock_quantity = instance.stock_quantity
+        return instance
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        stock_written = update_fields is None or 'stock_quantity' in update_fields
+        stock_changed = self.stock_quantity != getattr(self, '_loaded_stock_quantity', object())
+        super().save(*args, **kwargs)
+        
+        # Остаток изменен вручную - сбросить горячий счетчик
+        if stock_written and stock_changed:
+            from .stock import reset_stock_counter
+            reset_stock_counter(self.pk)
+            self._loaded_stock_quantity = self.stock_quantity
+    
     def decrease_stock(self, quantity=1):
-        """Уменьшить остаток при заказе"""
-        if self.stock_quantity is not None:
-            self.stock_quantity -= quantity
-            if self.stock_quantity < 0:
-                self.stock_quantity = 0
-            self.save(update_fields=['stock_quantity'])
+        """Уменьшить остаток при заказе. Возвращает False, если остатка не хватило."""
+        from .stock import reserve_stock
+        
+        reservation = reserve_stock({self.pk: quantity})
+        if reservation:
+            self.refresh_from_db(fields=['stock_quantity'])
+        return bool(reservation)
     
     def get_tags(self):
         """Получить список тегов для блюда"""
@@ -282,3 +329,30 @@ class MenuItemOption(models.Model):
     
     def __str__(self):
         return f"{self.menu_item.name} - {self.name}"
+
+
+class MenuVersion(models.Model):
+    """
+    Версия меню ресторана для снимка меню (apps.menu.snapshot), когда
+    кэш Django локальный для процесса: версию видят все процессы.
+    """
+    
+    restaurant = models.OneToOneField(
+        'restaurants.Restaurant',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='menu_version',
+        verbose_name=_('Ресторан')
+    )
+    
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name=_('Версия меню')
+    )
+    
+    class Meta:
+        verbose_name = _('Версия меню')
+        verbose_name_plural = _('Версии меню')
+    
+    def __str__(self):
+        return f"{self.restaurant_id}: {self.version}"
@@ -0,0 +1,264 @@
+"""
+Full-text menu search.
+
+``GET /api/menu/items/search/?restaurant_slug=<slug>&q=<text>`` returns a
+restaurant's menu items ranked by relevance. The index lives in the
+database and is kept in sync by the database itself, so saves, bulk updates
+and raw SQL all reach it (migration ``0002_menu_search``):
+
+- PostgreSQL: a generated ``search_vector`` tsvector column (name weighted
+  above description, Russian and English stemming) with a GIN index, and a
+  ``pg_trgm`` GIN index on the name. An item matches the stemmed query or is
+  similar to it by trigrams (misspellings, unfinished words); rank is
+  ``ts_rank_cd`` plus name word similarity.
+- SQLite: an FTS5 table with the trigram tokenizer, filled by triggers.
+  SQLite drops the triggers when a migration rebuilds ``menu_menuitem``, so
+  they are re-created after every ``migrate`` (``ensure_search_triggers``).
+  Candidates share trigrams with the query and are ranked by bm25, then
+  scored by trigram word similarity like ``pg_trgm``. SQLite has no Russian
+  stemmer; trigram similarity also covers word endings.
+- Other databases: ``icontains`` on name and description, name matches first.
+
+``MENU_SEARCH_SIMILARITY`` is the minimal trigram word similarity (0..1).
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+
+MAX_RESULTS = 50
+CANDIDATES = 100
+FTS_TABLE = 'menu_menuitem_search'
+
+_WORD_RE = re.compile(r'\w+')
+
+
+# SQLite: триггеры FTS-таблицы (rowid = id позиции), как в миграции 0002
+_SQLITE_ROW = (
+    "replace(replace({row}.name, 'ё', 'е'), 'Ё', 'Е'), "
+    "replace(replace({row}.description, 'ё', 'е'), 'Ё', 'Е')"
+)
+
+SQLITE_TRIGGERS = {
+    'menu_menuitem_search_insert': f"""
+    CREATE TRIGGER IF NOT EXISTS menu_menuitem_search_insert AFTER INSERT ON menu_menuitem BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, description)
+        VALUES (new.id, {_SQLITE_ROW.format(row='new')});
+    END
+    """,
+    'menu_menuitem_search_update': f"""
+    CREATE TRIGGER IF NOT EXISTS menu_menuitem_search_update
+    AFTER UPDATE OF name, description ON menu_menuitem BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE} (rowid, name, description)
+        VALUES (new.id, {_SQLITE_ROW.format(row='new')});
+    END
+    """,
+    'menu_menuitem_search_delete': f"""
+    CREATE TRIGGER IF NOT EXISTS menu_menuitem_search_delete AFTER DELETE ON menu_menuitem BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+}
+
+
+def ensure_search_triggers(connection):
+    """
+    Создать триггеры индекса SQLite, если миграция удалила их вместе с
+    пересозданной таблицей menu_menuitem, и заново заполнить индекс.
+
+    Возвращает True, если триггеры создавались.
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if FTS_TABLE not in tables or 'menu_menuitem' not in tables:
+            # Миграция 0002 не применена (или откачена)
+            return False
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'menu_menuitem'"
+        )
+        missing = set(SQLITE_TRIGGERS) - {row[0] for row in cursor.fetchall()}
+        if not missing:
+            return False
+        for name in sorted(missing):
+            cursor.execute(SQLITE_TRIGGERS[name])
+        # Пока триггеров не было, индекс мог отстать от таблицы
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+            f"SELECT id, {_SQLITE_ROW.format(row='menu_menuitem')} FROM menu_menuitem"
+        )
+    return True
+
+
+def similarity_threshold():
+    return getattr(settings, 'MENU_SEARCH_SIMILARITY', 0.4)
+
+
+def normalize(text):
+    """Нижний регистр, ё -> е."""
+    return (text or '').lower().replace('ё', 'е')
+
+
+def words(text):
+    return _WORD_RE.findall(normalize(text))
+
+
+@lru_cache(maxsize=8192)
+def trigrams(word):
+    """Триграммы слова, как в pg_trgm: с двумя пробелами в начале и одним в конце."""
+    padded = f'  {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+@lru_cache(maxsize=8192)
+def text_trigrams(text):
+    """Триграммы каждого слова текста (тексты меню повторяются от запроса к запросу)."""
+    return tuple(trigrams(word) for word in set(words(text)))
+
+
+def query_trigrams(query):
+    return [trigrams(word) for word in words(query)]
+
+
+def word_similarity(query, text):
+    """
+    Близость запроса к тексту (0..1): для каждого слова запроса - доля его
+    триграмм в самом похожем слове текста, среднее по словам запроса.
+
+    query - строка или результат query_trigrams() (при сравнении одного
+    запроса со многими текстами).
+    """
+    wanted = query_trigrams(query) if isinstance(query, str) else query
+    if not wanted:
+        return 0.0
+    candidates = text_trigrams(text or '')
+    if not candidates:
+        return 0.0
+    total = 0.0
+    for query_word in wanted:
+        total += max(len(query_word & candidate) for candidate in candidates) / len(query_word)
+    return total / len(wanted)
+
+
+class PostgresMenuSearch:
+    """
+    Поиск по tsvector-колонке и триграммам pg_trgm.
+    """
+
+    SQL = """
+        SELECT i.id,
+               ts_rank_cd(i.search_vector, q.query) + word_similarity(%(q)s, i.name) AS rank
+        FROM menu_menuitem i
+        JOIN menu_menucategory c ON c.id = i.category_id
+        CROSS JOIN (
+            SELECT websearch_to_tsquery('russian', %(q)s)
+                || websearch_to_tsquery('english', %(q)s) AS query
+        ) q
+        WHERE c.restaurant_id = %(restaurant_id)s
+          AND (i.search_vector @@ q.query OR %(q)s <%% i.name)
+          {available}
+        ORDER BY rank DESC, i.id
+        LIMIT %(limit)s
+    """
+
+    def search(self, restaurant_id, query, limit, available_only):
+        sql = self.SQL.format(available='AND i.is_available' if available_only else '')
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Порог оператора <% действует до конца транзакции
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                [str(similarity_threshold())]
+            )
+            cursor.execute(sql, {'q': query, 'restaurant_id': restaurant_id, 'limit': limit})
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SqliteMenuSearch:
+    """
+    Поиск по FTS5-таблице с триграммным токенизатором.
+    """
+
+    SQL = f"""
+        SELECT i.id, i.name, i.description
+        FROM {FTS_TABLE}
+        JOIN menu_menuitem i ON i.id = {FTS_TABLE}.rowid
+        JOIN menu_menucategory c ON c.id = i.category_id
+        WHERE {FTS_TABLE} MATCH %s AND c.restaurant_id = %s {{available}}
+        ORDER BY bm25({FTS_TABLE}, 10.0, 1.0)
+        LIMIT %s
+    """
+
+    def match_expression(self, query):
+        """Выражение MATCH: любая триграмма любого слова запроса."""
+        terms = set()
+        for word in words(query):
+            terms.update(word[i:i + 3] for i in range(len(word) - 2))
+        return ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in sorted(terms))
+
+    def search(self, restaurant_id, query, limit, available_only):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        sql = self.SQL.format(available='AND i.is_available' if available_only else '')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [expression, restaurant_id, CANDIDATES])
+            rows = cursor.fetchall()
+
+        threshold = similarity_threshold()
+        wanted = query_trigrams(query)
+        scored = []
+        for position, (item_id, name, description) in enumerate(rows):
+            name_score = word_similarity(wanted, name)
+            description_score = word_similarity(wanted, description)
+            if name_score >= threshold or description_score >= threshold:
+                # Порядок bm25 решает при равной близости
+                scored.append((-(name_score + description_score / 2), position, item_id))
+        scored.sort()
+        return [item_id for _, _, item_id in scored[:limit]]
+
+
+class BasicMenuSearch:
+    """
+    Поиск подстрокой для остальных баз данных.
+    """
+
+    def search(self, restaurant_id, query, limit, available_only):
+        from django.db.models import Case, IntegerField, Q, Value, When
+        from .models import MenuItem
+
+        items = MenuItem.objects.filter(category__restaurant_id=restaurant_id).filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        )
+        if available_only:
+            items = items.filter(is_available=True)
+        items = items.annotate(
+            name_match=Case(
+                When(name__icontains=query, then=Value(0)),
+                default=Value(1), output_field=IntegerField()
+            )
+        ).order_by('name_match', 'order', 'name')
+        return list(items.values_list('pk', flat=True)[:limit])
+
+
+_BACKENDS = {
+    'postgresql': PostgresMenuSearch,
+    'sqlite': SqliteMenuSearch,
+}
+
+
+def get_search_backend():
+    """Поиск для базы данных по умолчанию."""
+    return _BACKENDS.get(connection.vendor, BasicMenuSearch)()
+
+
+def search_items(restaurant_id, query, limit=20, available_only=True):
+    """id позиций меню ресторана по запросу, от самых подходящих."""
+    query = (query or '').strip()
+    if not query:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+    return get_search_backend().search(restaurant_id, query, limit, available_only)
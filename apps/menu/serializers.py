@@ -1,8 +1,45 @@
 """
 Serializers for menu app.
 """
+from django.core.files.storage import default_storage
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
-from .models import MenuCategory, MenuItem
+from apps.restaurants.models import Restaurant
+from .models import MenuCategory, MenuItem, MenuItemOption
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class ResponsiveImageField(serializers.Field):
+    """
+    srcset data of an image's derived copies (apps.menu.images), or None
+    until they are generated.
+    """
+    
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+    
+    def to_representation(self, variants):
+        if not variants or not variants.get('jpeg'):
+            return None
+        request = self.context.get('request')
+        
+        def url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        
+        def srcset(entries):
+            return ', '.join(f'{url(name)} {width}w' for width, name in entries)
+        
+        return {
+            'src': url(variants['jpeg'][-1][1]),
+            'srcset': srcset(variants['jpeg']),
+            'webp_srcset': srcset(variants['webp']),
+            'width': variants['width'],
+            'height': variants['height'],
+            'placeholder': variants['placeholder'],
+        }
 
 
 class MenuCategorySerializer(serializers.ModelSerializer):
@@ -25,11 +62,12 @@ class MenuItemListSerializer(serializers.ModelSerializer):
     Serializer for listing menu items.
     """
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_srcset = ResponsiveImageField(source='image_variants')
     
     class Meta:
         model = MenuItem
         fields = (
-            'id', 'category', 'category_name', 'name', 'price', 'image',
+            'id', 'category', 'category_name', 'name', 'price', 'image', 'image_srcset',
             'is_vegetarian', 'is_vegan', 'is_spicy', 'spicy_level',
             'is_chef_special', 'is_popular', 'is_available', 'order'
         )
@@ -41,11 +79,12 @@ class MenuItemDetailSerializer(serializers.ModelSerializer):
     Serializer for menu item details.
     """
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_srcset = ResponsiveImageField(source='image_variants')
     
     class Meta:
         model = MenuItem
         fields = (
-            'id', 'category', 'category_name', 'name', 'description', 'image',
+            'id', 'category', 'category_name', 'name', 'description', 'image', 'image_srcset',
             'price', 'cooking_time', 'calories', 'weight', 'is_vegetarian',
             'is_vegan', 'is_spicy', 'spicy_level', 'is_chef_special',
             'is_popular', 'allergens', 'is_available', 'stock_quantity',
@@ -66,3 +105,58 @@ class MenuItemCreateUpdateSerializer(serializers.ModelSerializer):
             'is_vegan', 'is_spicy', 'spicy_level', 'is_chef_special',
             'is_popular', 'allergens', 'is_available', 'stock_quantity', 'order'
         )
+
+
+
+class MenuItemOptionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for menu item options.
+    """
+    class Meta:
+        model = MenuItemOption
+        fields = ('id', 'name', 'choices', 'is_required')
+
+
+class MenuSnapshotRestaurantSerializer(serializers.ModelSerializer):
+    """
+    Restaurant part of the menu snapshot.
+    """
+    logo_srcset = ResponsiveImageField(source='logo_variants')
+    cover_image_srcset = ResponsiveImageField(source='cover_image_variants')
+    
+    class Meta:
+        model = Restaurant
+        fields = (
+            'id', 'name', 'slug', 'description', 'logo', 'logo_srcset',
+            'cover_image', 'cover_image_srcset',
+            'phone', 'address', 'city', 'currency', 'language', 'tax_rate',
+            'service_charge', 'opening_time', 'closing_time',
+            'allow_cash_payment', 'allow_qr_payment', 'require_waiter_confirmation'
+        )
+
+
+class MenuSnapshotCategorySerializer(serializers.ModelSerializer):
+    """
+    Category of the menu snapshot (items are added by the snapshot builder).
+    """
+    class Meta:
+        model = MenuCategory
+        fields = ('id', 'name', 'description', 'icon', 'order')
+
+
+class MenuSnapshotItemSerializer(serializers.ModelSerializer):
+    """
+    Menu item of the menu snapshot with options and tags.
+    """
+    options = MenuItemOptionSerializer(many=True, read_only=True)
+    tags = serializers.ListField(source='get_tags', child=serializers.CharField(), read_only=True)
+    image_srcset = ResponsiveImageField(source='image_variants')
+    
+    class Meta:
+        model = MenuItem
+        fields = (
+            'id', 'category', 'name', 'description', 'image', 'image_srcset', 'price',
+            'cooking_time', 'calories', 'weight', 'is_vegetarian', 'is_vegan',
+            'is_spicy', 'spicy_level', 'is_chef_special', 'is_popular',
+            'allergens', 'order', 'tags', 'options'
+        )
@@ -0,0 +1,103 @@
+"""
+Signals for menu app.
+Bump the menu snapshot version when anything shown on the guest menu changes
+and derive resized copies of uploaded images; restore the SQLite search
+triggers after migrations.
+"""
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from . import images, snapshot
+from .models import MenuCategory, MenuItem, MenuItemOption
+
+
+def _bump_on_commit(restaurant_id):
+    # Документ собирается заново только из зафиксированных данных
+    if restaurant_id is not None:
+        transaction.on_commit(lambda: snapshot.bump_version(restaurant_id))
+
+
+@receiver(post_save, sender=MenuCategory)
+@receiver(post_delete, sender=MenuCategory)
+def menu_category_changed(sender, instance, raw=False, **kwargs):
+    """Сменить версию меню после изменения категории."""
+    if raw:
+        return
+    _bump_on_commit(instance.restaurant_id)
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def menu_item_changed(sender, instance, raw=False, **kwargs):
+    """Сменить версию меню после изменения позиции."""
+    if raw:
+        return
+    _bump_on_commit(
+        MenuCategory.objects.filter(pk=instance.category_id).values_list(
+            'restaurant_id', flat=True
+        ).first()
+    )
+
+
+@receiver(post_save, sender=MenuItemOption)
+@receiver(post_delete, sender=MenuItemOption)
+def menu_item_option_changed(sender, instance, raw=False, **kwargs):
+    """Сменить версию меню после изменения опции позиции."""
+    if raw:
+        return
+    _bump_on_commit(
+        MenuItem.objects.filter(pk=instance.menu_item_id).values_list(
+            'category__restaurant_id', flat=True
+        ).first()
+    )
+
+
+@receiver(pre_save, sender='restaurants.Restaurant')
+def restaurant_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Запомнить прежний slug: после переименования забыть нужно и его."""
+    instance._previous_slug = None
+    if raw or instance.pk is None or (update_fields is not None and 'slug' not in update_fields):
+        return
+    instance._previous_slug = sender.objects.filter(pk=instance.pk).values_list(
+        'slug', flat=True
+    ).first()
+
+
+@receiver(post_save, sender='restaurants.Restaurant')
+@receiver(post_delete, sender='restaurants.Restaurant')
+def restaurant_changed(sender, instance, raw=False, **kwargs):
+    """Сменить версию меню и забыть slug после изменения ресторана."""
+    if raw:
+        return
+    snapshot.forget_slug(instance.slug)
+    previous = getattr(instance, '_previous_slug', None)
+    if previous and previous != instance.slug:
+        snapshot.forget_slug(previous)
+    _bump_on_commit(instance.pk)
+
+
+@receiver(post_save, sender='restaurants.RestaurantSettings')
+@receiver(post_delete, sender='restaurants.RestaurantSettings')
+def restaurant_settings_changed(sender, instance, raw=False, **kwargs):
+    """Сменить версию меню после изменения настроек ресторана."""
+    if raw:
+        return
+    _bump_on_commit(instance.restaurant_id)
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_save, sender='restaurants.Restaurant')
+def image_uploaded(sender, instance, raw=False, **kwargs):
+    """Собрать уменьшенные копии загруженных или замененных изображений."""
+    if raw:
+        return
+    images.schedule_variants(instance)
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """
+    post_migrate меню: вернуть триггеры поискового индекса SQLite.
+    """
+    from . import search
+
+    search.ensure_search_triggers(connections[using])
@@ -0,0 +1,189 @@
+"""
+Versioned menu documents for the guest page.
+
+``GET /api/menu/snapshot/<slug>/`` returns a restaurant's whole menu
+(restaurant, settings, active categories with their available items, item
+options and tags) as one JSON document. The document is rendered once per
+menu version and kept in the cache as ready JSON; its strong ETag is the
+restaurant id and the version, so a conditional request is answered with
+304 from the version alone.
+
+After a version change one request rebuilds the document
+(``config.single_flight``); requests arriving meanwhile get the previous
+version with its own ETag.
+
+Saving or deleting a MenuCategory, MenuItem, MenuItemOption, Restaurant or
+RestaurantSettings bumps the restaurant's version after commit
+(``apps.menu.signals``). Stock counters are not part of the document, so
+orders do not invalidate it.
+
+Versions and the slug -> id map live in the shared Django cache. When no
+shared cache is configured (the default ``LocMemCache`` is per process) a
+bump in one process would not reach the others, so the version is kept in
+the ``MenuVersion`` table and slugs are looked up in the database.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from config import single_flight
+
+
+def cache_ttl():
+    return getattr(settings, 'MENU_SNAPSHOT_TTL', 24 * 60 * 60)
+
+
+def versions_in_database():
+    """Кэш Django у каждого процесса свой: версии хранятся в базе."""
+    from apps.orders.idempotency import PER_PROCESS_CACHES
+
+    return settings.CACHES.get('default', {}).get('BACKEND', '') in PER_PROCESS_CACHES
+
+
+def version_key(restaurant_id):
+    return f'menu:snapshot:version:{restaurant_id}'
+
+
+def document_key(restaurant_id):
+    return f'menu:snapshot:{restaurant_id}'
+
+
+def slug_key(slug):
+    return f'menu:snapshot:slug:{slug}'
+
+
+def restaurant_id_for_slug(slug):
+    """id активного ресторана по slug (из кэша) или None."""
+    from apps.restaurants.models import Restaurant
+
+    lookup = Restaurant.objects.filter(slug=slug, is_active=True).values_list('pk', flat=True)
+    if versions_in_database():
+        # Переименование в другом процессе локальный кэш не очистит
+        return lookup.first()
+
+    key = slug_key(slug)
+    restaurant_id = cache.get(key)
+    if restaurant_id is None:
+        restaurant_id = lookup.first()
+        if restaurant_id is None:
+            return None
+        cache.set(key, restaurant_id, cache_ttl())
+    return restaurant_id
+
+
+def current_version(restaurant_id):
+    """
+    Текущая версия меню ресторана.
+
+    Новая версия начинается со времени в миллисекундах: если ключ версии
+    вытеснен из кэша, она не совпадет ни с одной из прежних. В базе версия
+    не вытесняется и считается от нуля.
+    """
+    if versions_in_database():
+        from .models import MenuVersion
+
+        return MenuVersion.objects.filter(restaurant_id=restaurant_id).values_list(
+            'version', flat=True
+        ).first() or 0
+
+    key = version_key(restaurant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(restaurant_id):
+    """Сменить версию меню: следующий запрос соберет документ заново."""
+    if versions_in_database():
+        from .models import MenuVersion
+
+        versions = MenuVersion.objects.filter(restaurant_id=restaurant_id)
+        if versions.update(version=F('version') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MenuVersion.objects.create(restaurant_id=restaurant_id, version=1)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            versions.update(version=F('version') + 1)
+        return
+
+    key = version_key(restaurant_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def forget_slug(slug):
+    cache.delete(slug_key(slug))
+
+
+def etag(restaurant_id, version):
+    return f'"{restaurant_id}-{version}"'
+
+
+def build_document(restaurant_id):
+    """Документ меню ресторана: три запроса к базе."""
+    from apps.restaurants.models import Restaurant, RestaurantSettings
+    from .models import MenuCategory, MenuItem
+    from .serializers import (
+        MenuSnapshotCategorySerializer, MenuSnapshotItemSerializer,
+        MenuSnapshotRestaurantSerializer
+    )
+
+    restaurant = Restaurant.objects.select_related('settings').get(pk=restaurant_id)
+    try:
+        restaurant_settings = restaurant.settings
+    except RestaurantSettings.DoesNotExist:
+        restaurant_settings = None
+
+    categories = list(MenuCategory.objects.filter(restaurant_id=restaurant_id, is_active=True))
+    items = MenuItem.objects.filter(
+        category__restaurant_id=restaurant_id, category__is_active=True, is_available=True
+    ).prefetch_related('options')
+
+    items_by_category = {}
+    for item in MenuSnapshotItemSerializer(items, many=True).data:
+        items_by_category.setdefault(item['category'], []).append(item)
+    document_categories = []
+    for category in MenuSnapshotCategorySerializer(categories, many=True).data:
+        category_items = items_by_category.get(category['id'], [])
+        category['items_count'] = len(category_items)
+        category['items'] = category_items
+        document_categories.append(category)
+
+    return {
+        'restaurant': MenuSnapshotRestaurantSerializer(restaurant).data,
+        'settings': {
+            'primary_color': restaurant_settings.primary_color,
+            'secondary_color': restaurant_settings.secondary_color,
+            'welcome_message': restaurant_settings.welcome_message,
+            'footer_text': restaurant_settings.footer_text,
+        } if restaurant_settings else None,
+        'categories': document_categories,
+    }
+
+
+def get_document(restaurant_id, version):
+    """
+    (версия, JSON) документа меню не старше version.
+
+    Пока документ новой версии собирает другой запрос, возвращается
+    предыдущий документ со своей версией.
+    """
+    def build():
+        document = dict(build_document(restaurant_id), version=version)
+        return version, json.dumps(document, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+    return single_flight.get_or_build(
+        document_key(restaurant_id), build, cache_ttl(),
+        fresh=lambda cached: cached[0] >= version
+    )
@@ -0,0 +1,399 @@
+"""
+Stock reservation for menu items.
+
+Reservations for a whole order are taken with one conditional
+``UPDATE ... WHERE stock_quantity >= n`` per item inside a single
+transaction, so two concurrent orders can never both take the last portion.
+Items are always locked in primary key order to avoid deadlocks between
+concurrent orders that share items.
+
+Optionally (``STOCK_RESERVATION_BACKEND = 'redis'`` or ``'local'``) the hot
+counters live in Redis or in process memory and are written back to
+``MenuItem.stock_quantity`` periodically by ``flush_stock_counters``.
+"""
+import abc
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+
+class StockReservation:
+    """
+    Результат резервирования остатков.
+    """
+
+    def __init__(self, reserved=None, failed=None):
+        self.reserved = dict(reserved or {})
+        self.failed = list(failed or [])
+
+    def __bool__(self):
+        return not self.failed
+
+    def __repr__(self):
+        return f"<StockReservation reserved={self.reserved} failed={self.failed}>"
+
+
+def _normalize(quantities):
+    """Свести позиции к {menu_item_id: количество} в порядке возрастания id."""
+    totals = Counter()
+    for menu_item_id, quantity in dict(quantities).items():
+        if quantity:
+            totals[int(menu_item_id)] += int(quantity)
+    return dict(sorted(totals.items()))
+
+
+def quantities_for_order(order):
+    """Количество каждой позиции меню в заказе."""
+    totals = Counter()
+    for menu_item_id, quantity in order.items.values_list('menu_item_id', 'quantity'):
+        totals[menu_item_id] += quantity
+    return totals
+
+
+class DatabaseStockBackend:
+    """
+    Резервирование остатков условными UPDATE прямо в базе данных.
+    """
+
+    # Резерв откатывается вместе с транзакцией, в которой взят
+    transactional = True
+
+    def reserve(self, quantities):
+        from .models import MenuItem
+
+        quantities = _normalize(quantities)
+        failed = []
+        with transaction.atomic():
+            for menu_item_id, quantity in quantities.items():
+                updated = MenuItem.objects.filter(pk=menu_item_id).filter(
+                    Q(stock_quantity__isnull=True) | Q(stock_quantity__gte=quantity)
+                ).update(stock_quantity=F('stock_quantity') - quantity)
+                if not updated:
+                    failed.append(menu_item_id)
+            if failed:
+                transaction.set_rollback(True)
+                return StockReservation(failed=failed)
+        return StockReservation(reserved=quantities)
+
+    def release(self, quantities):
+        from .models import MenuItem
+
+        with transaction.atomic():
+            for menu_item_id, quantity in _normalize(quantities).items():
+                MenuItem.objects.filter(
+                    pk=menu_item_id, stock_quantity__isnull=False
+                ).update(stock_quantity=F('stock_quantity') + quantity)
+
+    def flush(self):
+        return 0
+
+    def reset(self, menu_item_id):
+        pass
+
+
+class CounterStockBackend(abc.ABC):
+    """
+    Базовый класс для резервирования через горячие счетчики.
+
+    Счетчик ``available`` хранит текущий остаток позиции, ``pending`` -
+    изменение, еще не записанное в базу. Позиции без учета остатков
+    (stock_quantity = NULL) не получают счетчика и всегда проходят.
+    """
+
+    # Счетчики живут вне базы: резерв возвращается только через release()
+    transactional = False
+
+    def reserve(self, quantities):
+        quantities = _normalize(quantities)
+        tracked = self._ensure_loaded(quantities)
+        tracked_quantities = {pk: qty for pk, qty in quantities.items() if pk in tracked}
+        failed = self._reserve(tracked_quantities)
+        if failed:
+            return StockReservation(failed=failed)
+        return StockReservation(reserved=quantities)
+
+    def release(self, quantities):
+        quantities = _normalize(quantities)
+        tracked = self._ensure_loaded(quantities)
+        self._release({pk: qty for pk, qty in quantities.items() if pk in tracked})
+
+    def flush(self):
+        """Записать накопленные изменения в MenuItem.stock_quantity."""
+        from .models import MenuItem
+
+        flushed = 0
+        for menu_item_id, delta in self._take_pending().items():
+            if not delta:
+                continue
+            # Остаток в базе мог уменьшиться в обход счетчика: не ниже нуля
+            MenuItem.objects.filter(
+                pk=menu_item_id, stock_quantity__isnull=False
+            ).update(stock_quantity=Greatest(F('stock_quantity') - delta, 0))
+            flushed += 1
+        return flushed
+
+    def reset(self, menu_item_id):
+        """Сбросить счетчик позиции после ручного изменения остатка."""
+        self._forget(int(menu_item_id))
+
+    def _ensure_loaded(self, quantities):
+        """Подгрузить отсутствующие счетчики из базы; вернуть отслеживаемые id."""
+        from .models import MenuItem
+
+        tracked, missing = self._known(list(quantities))
+        if missing:
+            stock = MenuItem.objects.filter(pk__in=missing).values_list('pk', 'stock_quantity')
+            loaded = {pk: value for pk, value in stock}
+            self._load({pk: value for pk, value in loaded.items() if value is not None})
+            self._mark_untracked([pk for pk, value in loaded.items() if value is None])
+            tracked |= {pk for pk, value in loaded.items() if value is not None}
+        return tracked
+
+    # Хранилище счетчиков
+    @abc.abstractmethod
+    def _known(self, menu_item_ids):
+        """(id со счетчиком, id без записи о позиции)."""
+
+    @abc.abstractmethod
+    def _load(self, stock):
+        """Создать счетчики {id: остаток в базе} с учетом незаписанных изменений."""
+
+    @abc.abstractmethod
+    def _mark_untracked(self, menu_item_ids):
+        """Запомнить позиции без учета остатков."""
+
+    @abc.abstractmethod
+    def _reserve(self, quantities):
+        """Списать все количества или ничего; вернуть id, которым не хватило."""
+
+    @abc.abstractmethod
+    def _release(self, quantities):
+        """Вернуть количества в счетчики."""
+
+    @abc.abstractmethod
+    def _take_pending(self):
+        """Забрать накопленные изменения {id: списано}."""
+
+    @abc.abstractmethod
+    def _forget(self, menu_item_id):
+        """Удалить счетчик позиции."""
+
+
+class LocalStockBackend(CounterStockBackend):
+    """
+    Счетчики в памяти процесса (для одного процесса и тестов).
+    """
+
+    UNTRACKED = object()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._available = {}
+        self._pending = Counter()
+
+    def _known(self, menu_item_ids):
+        with self._lock:
+            tracked = {
+                pk for pk in menu_item_ids
+                if pk in self._available and self._available[pk] is not self.UNTRACKED
+            }
+            missing = [pk for pk in menu_item_ids if pk not in self._available]
+        return tracked, missing
+
+    def _load(self, stock):
+        with self._lock:
+            for pk, value in stock.items():
+                self._available.setdefault(pk, value - self._pending[pk])
+
+    def _mark_untracked(self, menu_item_ids):
+        with self._lock:
+            for pk in menu_item_ids:
+                self._available.setdefault(pk, self.UNTRACKED)
+
+    def _reserve(self, quantities):
+        with self._lock:
+            failed = [pk for pk, qty in quantities.items() if self._available[pk] < qty]
+            if not failed:
+                for pk, qty in quantities.items():
+                    self._available[pk] -= qty
+                    self._pending[pk] += qty
+        return failed
+
+    def _release(self, quantities):
+        with self._lock:
+            for pk, qty in quantities.items():
+                self._available[pk] += qty
+                self._pending[pk] -= qty
+
+    def _take_pending(self):
+        with self._lock:
+            pending, self._pending = dict(self._pending), Counter()
+        return pending
+
+    def _forget(self, menu_item_id):
+        with self._lock:
+            self._available.pop(menu_item_id, None)
+
+
+class RedisStockBackend(CounterStockBackend):
+    """
+    Счетчики в Redis, общие для всех процессов.
+
+    Проверка и списание для всего заказа выполняются одним Lua скриптом,
+    поэтому резервирование атомарно без блокировок в базе.
+    """
+
+    KEY_PREFIX = 'stock'
+    UNTRACKED = -1
+
+    RESERVE_SCRIPT = """
+    local failed = {}
+    for i = 1, #KEYS do
+        if tonumber(redis.call('GET', KEYS[i]) or '0') < tonumber(ARGV[i]) then
+            table.insert(failed, i)
+        end
+    end
+    if #failed > 0 then
+        return failed
+    end
+    for i = 1, #KEYS do
+        redis.call('DECRBY', KEYS[i], ARGV[i])
+        redis.call('HINCRBY', ARGV[#KEYS + 1], ARGV[#KEYS + 1 + i], ARGV[i])
+    end
+    return failed
+    """
+
+    TAKE_PENDING_SCRIPT = """
+    local pending = redis.call('HGETALL', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    return pending
+    """
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.client = client
+        self._reserve_script = client.register_script(self.RESERVE_SCRIPT)
+        self._take_pending_script = client.register_script(self.TAKE_PENDING_SCRIPT)
+
+    @property
+    def pending_key(self):
+        return f'{self.KEY_PREFIX}:pending'
+
+    def available_key(self, menu_item_id):
+        return f'{self.KEY_PREFIX}:available:{menu_item_id}'
+
+    def _known(self, menu_item_ids):
+        values = self.client.mget([self.available_key(pk) for pk in menu_item_ids]) if menu_item_ids else []
+        tracked = set()
+        missing = []
+        for pk, value in zip(menu_item_ids, values):
+            if value is None:
+                missing.append(pk)
+            elif int(value) != self.UNTRACKED:
+                tracked.add(pk)
+        return tracked, missing
+
+    def _load(self, stock):
+        if not stock:
+            return
+        pending = self.client.hmget(self.pending_key, [str(pk) for pk in stock])
+        pipe = self.client.pipeline()
+        for (pk, value), delta in zip(stock.items(), pending):
+            pipe.set(self.available_key(pk), value - int(delta or 0), nx=True)
+        pipe.execute()
+
+    def _mark_untracked(self, menu_item_ids):
+        if not menu_item_ids:
+            return
+        pipe = self.client.pipeline()
+        for pk in menu_item_ids:
+            pipe.set(self.available_key(pk), self.UNTRACKED, nx=True)
+        pipe.execute()
+
+    def _reserve(self, quantities):
+        if not quantities:
+            return []
+        pks = list(quantities)
+        failed = self._reserve_script(
+            keys=[self.available_key(pk) for pk in pks],
+            args=[quantities[pk] for pk in pks] + [self.pending_key] + [str(pk) for pk in pks],
+        )
+        return [pks[index - 1] for index in failed]
+
+    def _release(self, quantities):
+        if not quantities:
+            return
+        pipe = self.client.pipeline()
+        for pk, qty in quantities.items():
+            pipe.incrby(self.available_key(pk), qty)
+            pipe.hincrby(self.pending_key, str(pk), -qty)
+        pipe.execute()
+
+    def _take_pending(self):
+        raw = self._take_pending_script(keys=[self.pending_key])
+        return {int(raw[i]): int(raw[i + 1]) for i in range(0, len(raw), 2)}
+
+    def _forget(self, menu_item_id):
+        self.client.delete(self.available_key(menu_item_id))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_stock_backend():
+    """Получить настроенный бэкенд резервирования остатков."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'STOCK_RESERVATION_BACKEND', 'database')
+                if name == 'redis':
+                    _backend = RedisStockBackend()
+                elif name == 'local':
+                    _backend = LocalStockBackend()
+                else:
+                    _backend = DatabaseStockBackend()
+    return _backend
+
+
+def reserve_stock(quantities):
+    """
+    Зарезервировать остатки для заказа целиком.
+
+    ``quantities`` - {menu_item_id: количество}. Либо резервируются все
+    позиции, либо ни одна; в ``failed`` результата перечислены позиции,
+    которых не хватило.
+    """
+    return get_stock_backend().reserve(quantities)
+
+
+def reservation_is_transactional():
+    """Откатывается ли резерв вместе с транзакцией базы данных."""
+    return get_stock_backend().transactional
+
+
+def release_stock(quantities):
+    """Вернуть ранее зарезервированные остатки."""
+    get_stock_backend().release(quantities)
+
+
+def reset_stock_counter(menu_item_id):
+    """Перечитать остаток позиции из базы при следующем резервировании."""
+    get_stock_backend().reset(menu_item_id)
+
+
+def release_order_stock(order):
+    """Вернуть остатки по всем позициям отмененного заказа."""
+    release_stock(quantities_for_order(order))
+
+
+def flush_stock_counters():
+    """Записать накопленные изменения счетчиков в базу данных."""
+    return get_stock_backend().flush()
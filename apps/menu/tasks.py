@@ -0,0 +1,18 @@
+"""
+Celery tasks for menu app.
+"""
+from celery import shared_task
+
+
+@shared_task(ignore_result=True)
+def flush_stock_counters():
+    """Записать горячие счетчики остатков в MenuItem.stock_quantity."""
+    from .stock import flush_stock_counters as flush
+    return flush()
+
+
+@shared_task(ignore_result=True)
+def generate_image_variants(model_label, pk, field_name):
+    """Собрать уменьшенные копии загруженного изображения."""
+    from .images import generate_variants
+    return generate_variants(model_label, pk, field_name)
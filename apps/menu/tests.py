@@ -0,0 +1,435 @@
+"""
+Tests for the menu: stock, snapshot, caching, category counts, search and images.
+Run: python manage.py test apps (or pytest)
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.restaurants.models import Restaurant
+from apps.tables.models import Table, TableSession
+from config import single_flight
+from . import images, search, snapshot, stock
+from .models import MenuCategory, MenuItem
+
+# Without Redis: channel layer, broadcasts, kitchen queue and event log in process
+LOCAL_BACKENDS = override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BROADCAST_MODE='inline',
+    KITCHEN_QUEUE_BACKEND='local',
+    EVENT_LOG_BACKEND='local',
+    STOCK_RESERVATION_BACKEND='database',
+    SECURE_SSL_REDIRECT=False,
+)
+
+
+@LOCAL_BACKENDS
+class StockReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='owner', role=User.Role.OWNER)
+        restaurant = Restaurant.objects.create(
+            name='Test', slug='test', owner=owner, phone='0', address='-', city='-'
+        )
+        table = Table.objects.create(restaurant=restaurant, number='1', qr_code='qr.png')
+        cls.session = TableSession.objects.create(table=table)
+        category = MenuCategory.objects.create(restaurant=restaurant, name='Main')
+        cls.first, cls.second = [
+            MenuItem.objects.create(
+                category=category, name=name, price=Decimal('100.00'), stock_quantity=5
+            )
+            for name in ('First', 'Second')
+        ]
+        cls.unlimited = MenuItem.objects.create(
+            category=category, name='Unlimited', price=Decimal('50.00'), stock_quantity=None
+        )
+
+    def stock_of(self, item):
+        return MenuItem.objects.values_list('stock_quantity', flat=True).get(pk=item.pk)
+
+    def test_reservation_is_all_or_nothing(self):
+        backend = stock.DatabaseStockBackend()
+        reservation = backend.reserve({self.first.pk: 3, self.second.pk: 6})
+        self.assertFalse(reservation)
+        self.assertEqual(reservation.failed, [self.second.pk])
+        self.assertEqual(self.stock_of(self.first), 5)
+        self.assertEqual(self.stock_of(self.second), 5)
+
+    def test_no_oversell(self):
+        backend = stock.DatabaseStockBackend()
+        self.assertTrue(backend.reserve({self.first.pk: 5, self.unlimited.pk: 100}))
+        self.assertFalse(backend.reserve({self.first.pk: 1}))
+        self.assertEqual(self.stock_of(self.first), 0)
+        backend.release({self.first.pk: 2})
+        self.assertEqual(self.stock_of(self.first), 2)
+
+    def test_counters_no_oversell_across_threads(self):
+        backend = stock.LocalStockBackend()
+        # Счетчик загружается из базы в этом потоке, дальше база не нужна
+        self.assertTrue(backend.reserve({self.first.pk: 1}))
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(bool(backend.reserve({self.first.pk: 1}))))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 4)
+
+        self.assertEqual(backend.flush(), 1)
+        self.assertEqual(self.stock_of(self.first), 0)
+
+    def test_flush_never_goes_below_zero(self):
+        backend = stock.LocalStockBackend()
+        self.assertTrue(backend.reserve({self.first.pk: 3}))
+        # Остаток уменьшили в базе мимо счетчика
+        MenuItem.objects.filter(pk=self.first.pk).update(stock_quantity=1)
+        self.assertEqual(backend.flush(), 1)
+        self.assertEqual(self.stock_of(self.first), 0)
+
+    def test_order_over_stock_takes_nothing(self):
+        response = APIClient().post('/api/orders/', {
+            'table_session': self.session.pk,
+            'items_data': [
+                {'menu_item': self.first.pk, 'quantity': 2},
+                {'menu_item': self.second.pk, 'quantity': 9},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock_of(self.first), 5)
+        self.assertEqual(self.stock_of(self.second), 5)
+
+    def test_failed_order_write_releases_stock(self):
+        with mock.patch('apps.orders.models.OrderItem.objects.bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                APIClient().post('/api/orders/', {
+                    'table_session': self.session.pk,
+                    'items_data': [{'menu_item': self.first.pk, 'quantity': 2}],
+                }, format='json')
+        self.assertEqual(self.stock_of(self.first), 5)
+
+    def test_counter_reset_only_when_stock_changes(self):
+        item = MenuItem.objects.get(pk=self.first.pk)
+        with mock.patch.object(stock, 'reset_stock_counter') as reset:
+            item.name = 'Renamed'
+            item.save()
+            item.save(update_fields=['name'])
+            reset.assert_not_called()
+            item.stock_quantity = 7
+            item.save()
+            reset.assert_called_once_with(item.pk)
+
+
+@LOCAL_BACKENDS
+class MenuSnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='owner', role=User.Role.OWNER)
+        cls.restaurant = Restaurant.objects.create(
+            name='Test', slug='old', owner=owner, phone='0', address='-', city='-'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_version_bumped_by_another_process(self):
+        # Кэш по умолчанию (LocMem) у каждого процесса свой
+        self.assertTrue(snapshot.versions_in_database())
+        client = APIClient()
+        first = client.get('/api/menu/snapshot/old/')
+        self.assertEqual(first.status_code, 200)
+
+        with mock.patch.object(snapshot, 'cache', LocMemCache('other-process', {})):
+            snapshot.bump_version(self.restaurant.pk)
+
+        response = client.get('/api/menu/snapshot/old/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['version'], snapshot.current_version(self.restaurant.pk))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'qrmenu-test-cache'),
+    }})
+    def test_renamed_restaurant_forgets_old_slug(self):
+        cache.clear()
+        self.assertFalse(snapshot.versions_in_database())
+        restaurant = Restaurant.objects.get(pk=self.restaurant.pk)
+        self.assertEqual(snapshot.restaurant_id_for_slug('old'), restaurant.pk)
+
+        restaurant.slug = 'new'
+        restaurant.save()
+        self.assertIsNone(snapshot.restaurant_id_for_slug('old'))
+        self.assertEqual(snapshot.restaurant_id_for_slug('new'), restaurant.pk)
+
+
+
+@LOCAL_BACKENDS
+class CategoryItemCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='owner', role=User.Role.OWNER)
+        cls.restaurant = Restaurant.objects.create(
+            name='Test', slug='test', owner=owner, phone='0', address='-', city='-'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.add_categories(2)
+
+    def add_categories(self, count):
+        for _ in range(count):
+            category = MenuCategory.objects.create(
+                restaurant=self.restaurant, name=f'Category {MenuCategory.objects.count()}'
+            )
+            MenuItem.objects.create(category=category, name='Available', price=Decimal('1.00'))
+            MenuItem.objects.create(
+                category=category, name='Hidden', price=Decimal('1.00'), is_available=False
+            )
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        rows = data['results'] if isinstance(data, dict) else data
+        return {row['name']: row['items_count'] for row in rows}, len(queries)
+
+    def test_counts_available_items_in_one_query(self):
+        for url in ('/api/menu/categories/?restaurant_slug=test', '/api/restaurants/test/menu_categories/'):
+            with self.subTest(url=url):
+                cache.clear()
+                counts, queries = self.get(url)
+                self.assertEqual(set(counts.values()), {1})
+                self.add_categories(3)
+                cache.clear()
+                counts, more_queries = self.get(url)
+                self.assertEqual(len(counts), MenuCategory.objects.count())
+                # Число запросов не растет с числом категорий
+                self.assertEqual(more_queries, queries)
+
+    def test_model_property_matches_annotation(self):
+        category = MenuCategory.objects.first()
+        self.assertEqual(category.items_count, 1)
+        self.assertEqual(MenuCategory.objects.with_item_counts().get(pk=category.pk).items_count, 1)
+
+
+
+@LOCAL_BACKENDS
+class MenuSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='owner', role=User.Role.OWNER)
+        cls.restaurant = Restaurant.objects.create(
+            name='Test', slug='test', owner=owner, phone='0', address='-', city='-'
+        )
+        category = MenuCategory.objects.create(restaurant=cls.restaurant, name='Main')
+        cls.borsch, cls.solyanka, cls.caesar, cls.hidden = [
+            MenuItem.objects.create(
+                category=category, name=name, description=description,
+                price=Decimal('10.00'), is_available=available
+            )
+            for name, description, available in (
+                ('Борщ украинский', 'Свекла, сметана', True),
+                ('Солянка', 'Мясная, с оливками', True),
+                ('Салат Цезарь', 'Chicken caesar salad', True),
+                ('Борщ зеленый', '', False),
+            )
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **kwargs):
+        return search.search_items(self.restaurant.pk, query, **kwargs)
+
+    def test_prefix_typo_and_word_forms(self):
+        self.assertEqual(self.search('борш')[0], self.borsch.pk)
+        self.assertEqual(self.search('цезар')[0], self.caesar.pk)
+        self.assertEqual(self.search('caeser')[0], self.caesar.pk)
+        self.assertEqual(self.search('сметаной'), [self.borsch.pk])
+        self.assertEqual(self.search('xyzzy'), [])
+
+    def test_unavailable_items_hidden_by_default(self):
+        self.assertNotIn(self.hidden.pk, self.search('борщ'))
+        self.assertIn(self.hidden.pk, self.search('борщ', available_only=False))
+
+    def test_index_follows_updates_and_deletes(self):
+        MenuItem.objects.filter(pk=self.caesar.pk).update(name='Греческий салат')
+        self.assertNotIn(self.caesar.pk, self.search('цезарь'))
+        self.borsch.delete()
+        self.assertNotIn(self.borsch.pk, self.search('борщ', available_only=False))
+
+    def test_search_endpoint(self):
+        client = APIClient()
+        response = client.get('/api/menu/items/search/', {'q': 'солянк', 'restaurant_slug': 'test'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Солянка')
+        self.assertEqual(client.get('/api/menu/items/search/', {'q': 'x'}).status_code, 400)
+        self.assertEqual(
+            client.get('/api/menu/items/search/', {'q': 'x', 'restaurant_slug': 'nope'}).status_code, 404
+        )
+
+
+class SingleFlightTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.1)
+            return 'menu'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight.get_or_build('key', build, 60)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['menu'] * 10)
+        self.assertEqual(len(builds), 1)
+
+    def test_stale_value_served_while_another_rebuilds(self):
+        single_flight.get_or_build('key', lambda: 1, 60)
+        # Блокировку держит другой процесс: устаревшее значение отдается сразу
+        self.assertTrue(cache.add(single_flight.lock_key('key'), 1, 10))
+        fresh = lambda value: value >= 2  # noqa: E731
+        self.assertEqual(single_flight.get_or_build('key', lambda: 2, 60, fresh=fresh), 1)
+        cache.delete(single_flight.lock_key('key'))
+        self.assertEqual(single_flight.get_or_build('key', lambda: 2, 60, fresh=fresh), 2)
+
+    def test_missing_value_is_not_cached(self):
+        self.assertIsNone(single_flight.get_or_build('key', lambda: None, 60))
+        self.assertEqual(single_flight.get_or_build('key', lambda: 'menu', 60), 'menu')
+
+    def test_cache_errors_fall_back_to_build(self):
+        with mock.patch.multiple(
+            single_flight.cache, **{name: mock.Mock(side_effect=ConnectionError)
+                                    for name in ('get', 'add', 'set', 'delete')}
+        ):
+            self.assertEqual(single_flight.get_or_build('key', lambda: 'menu', 60), 'menu')
+
+
+def jpeg(width, height, orientation=None):
+    """JPEG-файл; orientation - EXIF-тег поворота (вместе с моделью камеры)."""
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+        exif[0x010f] = 'Camera'
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(out, 'JPEG', exif=exif.tobytes())
+    return out.getvalue()
+
+
+@LOCAL_BACKENDS
+@override_settings(IMAGE_PIPELINE='inline')
+class ImageVariantTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create(username='owner', role=User.Role.OWNER)
+        cls.restaurant = Restaurant.objects.create(
+            name='Test', slug='test', owner=owner, phone='0', address='-', city='-'
+        )
+        category = MenuCategory.objects.create(restaurant=cls.restaurant, name='Main')
+        cls.item, cls.other = [
+            MenuItem.objects.create(category=category, name=name, price=Decimal('10.00'))
+            for name in ('First', 'Second')
+        ]
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media = media
+
+    def upload(self, obj, field, name, content):
+        # Варианты строятся после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            setattr(obj, field, SimpleUploadedFile(name, content) if content else None)
+            obj.save()
+        obj.refresh_from_db()
+        return getattr(obj, f'{field}_variants')
+
+    def test_variants_are_rotated_resized_and_stripped(self):
+        variants = self.upload(self.item, 'image', 'dish.jpg', jpeg(1000, 600, orientation=6))
+        self.assertEqual(variants['source'], self.item.image.name)
+        self.assertEqual((variants['width'], variants['height']), (600, 1000))
+        self.assertEqual([width for width, _ in variants['webp']], [160, 320])
+        self.assertIn(variants['hash'], variants['webp'][0][1])
+        self.assertTrue(variants['placeholder'].startswith('data:image/jpeg;base64,'))
+        with Image.open(os.path.join(self.media, variants['jpeg'][0][1])) as image:
+            self.assertEqual(image.size[0], 160)
+            self.assertFalse(image.getexif())
+
+        # Тот же файл у другого блюда переиспользует готовые варианты
+        self.assertEqual(
+            self.upload(self.other, 'image', 'copy.jpg', jpeg(1000, 600, orientation=6))['webp'],
+            variants['webp'],
+        )
+        self.assertFalse(images.generate_variants('menu.MenuItem', self.item.pk, 'image'))
+        self.assertEqual(self.upload(self.item, 'image', None, None), {})
+
+    def test_api_exposes_srcset(self):
+        self.upload(self.item, 'image', 'dish.jpg', jpeg(400, 300))
+        client = APIClient()
+        snapshot_doc = client.get('/api/menu/snapshot/test/').json()
+        srcset = {
+            item['id']: item['image_srcset']
+            for category in snapshot_doc['categories'] for item in category['items']
+        }[self.item.pk]
+        # Ширины не больше исходной, src - самая широкая
+        self.assertTrue(srcset['webp_srcset'].endswith('320.webp 320w'))
+        self.assertTrue(srcset['src'].endswith('320.jpeg'))
+
+        data = client.get('/api/menu/items/').json()
+        rows = data['results'] if isinstance(data, dict) else data
+        [row] = [row for row in rows if row['id'] == self.item.pk]
+        self.assertTrue(row['image_srcset']['src'].startswith('http://testserver/media/derived/'))
+
+    def test_broken_upload_keeps_original_only(self):
+        variants = self.upload(self.restaurant, 'cover_image', 'cover.jpg', b'not an image')
+        self.assertEqual(variants['source'], self.restaurant.cover_image.name)
+        self.assertNotIn('jpeg', variants)
+        response = APIClient().get('/api/restaurants/test/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['cover_image_srcset'])
+
+    def test_command_rebuilds_missing_variants(self):
+        self.upload(self.item, 'image', 'dish.jpg', jpeg(400, 300))
+        MenuItem.objects.filter(pk=self.item.pk).update(image_variants={})
+        call_command('generate_image_variants', '--restaurant', 'test', stdout=io.StringIO())
+        self.item.refresh_from_db()
+        self.assertEqual([width for width, _ in self.item.image_variants['jpeg']], [160, 320])
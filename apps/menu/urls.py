@@ -10,5 +10,6 @@ router.register(r'categories', views.MenuCategoryViewSet, basename='menu-categor
 router.register(r'items', views.MenuItemViewSet, basename='menu-item')
 
 urlpatterns = [
+    path('snapshot/<slug:restaurant_slug>/', views.menu_snapshot, name='menu-snapshot'),
     path('', include(router.urls)),
 ]
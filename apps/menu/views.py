@@ -1,12 +1,16 @@
 """
 Views and ViewSets for menu app.
 """
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from . import search, snapshot
 from .models import MenuCategory, MenuItem
 from .serializers import (
     MenuCategorySerializer, MenuItemListSerializer,
@@ -18,7 +22,7 @@ class MenuCategoryViewSet(viewsets.ModelViewSet):
     """
     ViewSet for menu categories.
     """
-    queryset = MenuCategory.objects.all()
+    queryset = MenuCategory.objects.with_item_counts()
     serializer_class = MenuCategorySerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
@@ -28,7 +32,7 @@ class MenuCategoryViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         user = self.request.user
-        queryset = MenuCategory.objects.all()
+        queryset = MenuCategory.objects.with_item_counts()
         
         if not user.is_authenticated:
             queryset = queryset.filter(is_active=True)
@@ -97,3 +101,51 @@ class MenuItemViewSet(viewsets.ModelViewSet):
         items = self.get_queryset().filter(is_vegetarian=True)
         serializer = MenuItemListSerializer(items, many=True)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked full-text search in one restaurant's menu"""
+        query = request.query_params.get('q', '').strip()
+        restaurant_slug = request.query_params.get('restaurant_slug')
+        if not query or not restaurant_slug:
+            return Response(
+                {'error': 'Укажите q и restaurant_slug'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        restaurant_id = snapshot.restaurant_id_for_slug(restaurant_slug)
+        if restaurant_id is None:
+            return Response({'error': 'Ресторан не найден'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        
+        ids = search.search_items(
+            restaurant_id, query, limit,
+            available_only=not request.user.is_authenticated
+        )
+        items = MenuItem.objects.select_related('category').in_bulk(ids)
+        serializer = MenuItemListSerializer([items[pk] for pk in ids if pk in items], many=True)
+        return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def menu_snapshot(request, restaurant_slug):
+    """Whole menu of a restaurant as one cached document with a strong ETag."""
+    restaurant_id = snapshot.restaurant_id_for_slug(restaurant_slug)
+    if restaurant_id is None:
+        return Response({'error': 'Ресторан не найден'}, status=status.HTTP_404_NOT_FOUND)
+    version = snapshot.current_version(restaurant_id)
+    etag = snapshot.etag(restaurant_id, version)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        # Документ может оказаться предыдущей версии, пока новую собирает другой запрос
+        version, body = snapshot.get_document(restaurant_id, version)
+        etag = snapshot.etag(restaurant_id, version)
+        response = HttpResponse(body, content_type='application/json; charset=utf-8')
+    response['ETag'] = etag
+    # Браузер и прокси хранят документ, но сверяют ETag при каждой загрузке
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -3,7 +3,7 @@ Admin configuration for orders app.
 """
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import Order, OrderItem
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
 
 
 class OrderItemInline(admin.TabularInline):
@@ -36,6 +36,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ['status', 'payment_method', 'created_at', 'table_session__table__restaurant']
     search_fields = ['id', 'guest_name', 'table_session__table__number', 'waiter__username']
     ordering = ['-created_at']
+    list_select_related = ('table_session__table', 'waiter')
     readonly_fields = ('subtotal', 'tax_amount', 'service_charge_amount', 
                       'total_amount', 'items_count', 'created_at', 'confirmed_at',
                       'ready_at', 'delivered_at', 'paid_at', 'cancelled_at', 'updated_at', 'order_timeline')
@@ -150,43 +151,25 @@ class OrderAdmin(admin.ModelAdmin):
     
     def mark_confirmed(self, request, queryset):
         """Mark orders as confirmed."""
-        updated = queryset.filter(status='pending').update(status='confirmed')
+        updated = len(queryset.transition('confirm', changed_by=request.user))
         self.message_user(request, f'{updated} orders marked as confirmed.')
     mark_confirmed.short_description = _('✓ Mark as confirmed')
     
     def mark_ready(self, request, queryset):
         """Mark orders as ready."""
-        from django.utils import timezone
-        updated = 0
-        for order in queryset.filter(status='confirmed'):
-            order.status = 'ready'
-            order.ready_at = timezone.now()
-            order.save()
-            updated += 1
+        updated = len(queryset.filter(status='confirmed').transition('mark_ready', changed_by=request.user))
         self.message_user(request, f'{updated} orders marked as ready.')
     mark_ready.short_description = _('🍽️ Mark as ready')
     
     def mark_delivered(self, request, queryset):
         """Mark orders as delivered."""
-        from django.utils import timezone
-        updated = 0
-        for order in queryset.filter(status='ready'):
-            order.status = 'delivered'
-            order.delivered_at = timezone.now()
-            order.save()
-            updated += 1
+        updated = len(queryset.transition('mark_delivered', changed_by=request.user))
         self.message_user(request, f'{updated} orders marked as delivered.')
     mark_delivered.short_description = _('📦 Mark as delivered')
     
     def mark_paid(self, request, queryset):
         """Mark orders as paid."""
-        from django.utils import timezone
-        updated = 0
-        for order in queryset.filter(status='delivered'):
-            order.status = 'paid'
-            order.paid_at = timezone.now()
-            order.save()
-            updated += 1
+        updated = len(queryset.filter(status='delivered').transition('mark_paid', changed_by=request.user))
         self.message_user(request, f'{updated} orders marked as paid.')
     mark_paid.short_description = _('💳 Mark as paid')
     
@@ -228,3 +211,44 @@ class OrderItemAdmin(admin.ModelAdmin):
     
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    """Read-only inline for archived order items."""
+    model = ArchivedOrderItem
+    extra = 0
+    fields = ('menu_item_name', 'quantity', 'price', 'notes')
+    readonly_fields = fields
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only admin interface for archived orders."""
+    
+    list_display = ['id', 'restaurant', 'table_number', 'status', 'total_amount', 'created_at', 'archived_at']
+    list_filter = ['status', 'restaurant', 'created_at']
+    search_fields = ['id', 'guest_name']
+    ordering = ['-created_at']
+    list_select_related = ('restaurant',)
+    inlines = [ArchivedOrderItemInline]
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        if request.user.is_owner:
+            return qs.filter(restaurant=request.user.restaurant)
+        return qs.none()
+    
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -7,4 +7,5 @@ class OrdersConfig(AppConfig):
     verbose_name = 'Orders'    
     def ready(self):
         """Import signals when app is ready."""
+        import apps.orders.signals
         import config.websocket_signals
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Archival of settled orders.
+
+Paid and cancelled orders that have not changed for
+``ORDER_ARCHIVE_AFTER_DAYS`` are copied with their items, status history
+and payments into the ``Archived*`` tables and removed from the live
+tables, one batch per transaction. Settled payments without an order
+(whole-table payments) are archived the same way.
+
+Live queries (active orders, waiter stats, kitchen) only ever see recent
+rows; reports combine live and archived rows (see
+``PaymentViewSet.statistics`` and ``restaurant_statistics``).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.payments.models import ArchivedPayment, Payment
+from .models import (
+    Order, OrderItem, OrderStatusHistory,
+    ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusHistory
+)
+
+ARCHIVABLE_STATUSES = (Order.Status.PAID, Order.Status.CANCELLED)
+
+SETTLED_PAYMENT_STATUSES = (
+    Payment.Status.COMPLETED, Payment.Status.FAILED,
+    Payment.Status.CANCELLED, Payment.Status.REFUNDED,
+)
+
+ORDER_FIELDS = (
+    'id', 'table_session_id', 'guest_session_id', 'waiter_id', 'status',
+    'payment_method', 'guest_name', 'notes', 'waiter_notes', 'subtotal',
+    'tax_amount', 'service_charge_amount', 'total_amount', 'items_count',
+    'created_at', 'confirmed_at', 'ready_at', 'delivered_at', 'paid_at',
+    'cancelled_at', 'updated_at',
+)
+
+ITEM_FIELDS = (
+    'id', 'order_id', 'menu_item_id', 'quantity', 'price',
+    'selected_options', 'notes', 'created_at',
+)
+
+HISTORY_FIELDS = ('id', 'order_id', 'status', 'changed_by_id', 'notes', 'created_at')
+
+PAYMENT_FIELDS = (
+    'id', 'order_id', 'table_session_id', 'payment_id', 'payment_type',
+    'status', 'amount', 'currency', 'payer_name', 'payer_phone',
+    'payer_email', 'processed_by_id', 'transaction_id', 'payment_data',
+    'refund_amount', 'refund_reason', 'refunded_at', 'created_at',
+    'completed_at', 'updated_at', 'notes',
+)
+
+
+def archive_cutoff(now=None):
+    """Заказы, не менявшиеся с этого момента, можно архивировать."""
+    days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 90)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _lock_batch(queryset, batch_size):
+    """id очередной пачки; строки, занятые другими транзакциями, пропускаются."""
+    return list(
+        queryset.order_by('pk').select_for_update(skip_locked=True, of=('self',))
+        .values_list('pk', flat=True)[:batch_size]
+    )
+
+
+def _archive_payments(payments, restaurant_ids):
+    rows = [
+        ArchivedPayment(restaurant_id=restaurant_ids[row['id']], **row)
+        for row in payments.values(*PAYMENT_FIELDS)
+    ]
+    ArchivedPayment.objects.bulk_create(rows)
+    return rows
+
+
+def archive_orders_batch(cutoff, batch_size=500):
+    """
+    Перенести в архив одну пачку заказов.
+
+    Возвращает (количество заказов, количество платежей).
+    """
+    with transaction.atomic():
+        order_ids = _lock_batch(
+            Order.objects.filter(status__in=ARCHIVABLE_STATUSES, updated_at__lt=cutoff),
+            batch_size
+        )
+        if not order_ids:
+            return 0, 0
+
+        orders = Order.objects.filter(pk__in=order_ids).values(
+            *ORDER_FIELDS,
+            restaurant_id=F('table_session__table__restaurant_id'),
+            table_number=F('table_session__table__number'),
+        )
+        archived = [ArchivedOrder(**row) for row in orders]
+        ArchivedOrder.objects.bulk_create(archived)
+        restaurant_by_order = {order.pk: order.restaurant_id for order in archived}
+
+        ArchivedOrderItem.objects.bulk_create(
+            ArchivedOrderItem(**row)
+            for row in OrderItem.objects.filter(order_id__in=order_ids).values(
+                *ITEM_FIELDS, menu_item_name=F('menu_item__name')
+            )
+        )
+        ArchivedOrderStatusHistory.objects.bulk_create(
+            ArchivedOrderStatusHistory(**row)
+            for row in OrderStatusHistory.objects.filter(order_id__in=order_ids).values(*HISTORY_FIELDS)
+        )
+
+        payments = Payment.objects.filter(order_id__in=order_ids)
+        restaurant_by_payment = {
+            pk: restaurant_by_order[order_id]
+            for pk, order_id in payments.values_list('pk', 'order_id')
+        }
+        archived_payments = _archive_payments(payments, restaurant_by_payment)
+
+        # Позиции, история и платежи удаляются каскадом вместе с заказами
+        Order.objects.filter(pk__in=order_ids).delete()
+    return len(archived), len(archived_payments)
+
+
+def archive_session_payments_batch(cutoff, batch_size=500):
+    """Перенести в архив одну пачку завершенных платежей без заказа."""
+    with transaction.atomic():
+        payment_ids = _lock_batch(
+            Payment.objects.filter(
+                order__isnull=True,
+                table_session__isnull=False,
+                status__in=SETTLED_PAYMENT_STATUSES,
+                updated_at__lt=cutoff
+            ),
+            batch_size
+        )
+        if not payment_ids:
+            return 0
+
+        payments = Payment.objects.filter(pk__in=payment_ids)
+        restaurant_by_payment = dict(
+            payments.values_list('pk', 'table_session__table__restaurant_id')
+        )
+        archived = _archive_payments(payments, restaurant_by_payment)
+        payments.delete()
+    return len(archived)
+
+
+def archive_orders(cutoff=None, batch_size=None, max_batches=None):
+    """
+    Архивировать заказы и платежи старше ``cutoff`` пачками.
+
+    ``max_batches`` ограничивает работу одного запуска; оставшееся
+    заберет следующий запуск. Возвращает количество перенесенных
+    заказов и платежей.
+    """
+    cutoff = cutoff or archive_cutoff()
+    batch_size = batch_size or getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 500)
+
+    totals = {'orders': 0, 'payments': 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        orders, payments = archive_orders_batch(cutoff, batch_size)
+        totals['orders'] += orders
+        totals['payments'] += payments
+        batches += 1
+        if orders < batch_size:
+            break
+
+    while max_batches is None or batches < max_batches:
+        payments = archive_session_payments_batch(cutoff, batch_size)
+        totals['payments'] += payments
+        batches += 1
+        if payments < batch_size:
+            break
+    return totals
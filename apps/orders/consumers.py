@@ -2,13 +2,14 @@
 WebSocket Consumers for orders app.
 Real-time order status updates.
 """
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from config import broadcast, payloads, ws_auth, ws_codec
+from .kitchen import get_kitchen_queue, kitchen_group_name
 from .models import Order, OrderItem
 
 
-class OrderConsumer(AsyncWebsocketConsumer):
+class OrderConsumer(broadcast.BroadcastConsumerMixin, ws_codec.CodecConsumerMixin, AsyncWebsocketConsumer):
     """
     Consumer for order status updates.
     Handles real-time order changes and notifications.
@@ -19,6 +20,11 @@ class OrderConsumer(AsyncWebsocketConsumer):
         self.order_id = self.scope['url_route']['kwargs']['order_id']
         self.order_group_name = f'order_{self.order_id}'
         
+        # Гость своей сессии или сотрудник ресторана заказа
+        if not await ws_auth.can_join_order(self.scope, self.order_id):
+            await self.close(code=ws_auth.FORBIDDEN)
+            return
+        
         # Join order group
         await self.channel_layer.group_add(
             self.order_group_name,
@@ -30,10 +36,10 @@ class OrderConsumer(AsyncWebsocketConsumer):
         # Send initial order status
         order_data = await self.get_order_data()
         if order_data:
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'order_status',
                 'data': order_data
-            }))
+            })
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
@@ -42,104 +48,91 @@ class OrderConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages."""
         try:
-            data = json.loads(text_data)
+            data = ws_codec.loads(text_data, bytes_data)
             action = data.get('action')
             
             if action == 'update_status':
+                if not ws_auth.is_staff(self.scope):
+                    await self.send_message({
+                        'error': 'Permission denied'
+                    })
+                    return
                 new_status = data.get('status')
                 await self.update_order_status(new_status)
             elif action == 'get_status':
                 order_data = await self.get_order_data()
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'order_status',
                     'data': order_data
-                }))
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'error': 'Invalid JSON'
-            }))
+                })
+        except ValueError:
+            await self.send_message({
+                'error': 'Invalid message'
+            })
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'error': str(e)
-            }))
+            })
     
     # Receive message from order group
     async def order_update(self, event):
         """Send order update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'order_update',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def order_status(self, event):
         """Send order status to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'order_status',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def order_items_update(self, event):
         """Send order items update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'order_items_update',
-            'items': event['items']
-        }))
+        await self.forward(event)
     
     @database_sync_to_async
     def get_order_data(self):
         """Get order data from database."""
         try:
-            order = Order.objects.get(id=self.order_id)
+            order = Order.objects.only(
+                'id', 'status', 'total_amount', 'items_count', 'waiter_id', 'created_at',
+                'confirmed_at', 'ready_at', 'delivered_at', 'updated_at'
+            ).get(id=self.order_id)
             items = OrderItem.objects.filter(order=order).values(
                 'id', 'menu_item__name', 'quantity', 'price'
             )
-            return {
-                'id': order.id,
-                'status': order.status,
-                'status_display': order.get_status_display(),
-                'total_amount': str(order.total_amount),
-                'items_count': order.items.count(),
-                'items': list(items),
-                'created_at': order.created_at.isoformat(),
-                'confirmed_at': order.confirmed_at.isoformat() if order.confirmed_at else None,
-                'ready_at': order.ready_at.isoformat() if order.ready_at else None,
-                'delivered_at': order.delivered_at.isoformat() if order.delivered_at else None,
-            }
+            data = payloads.order_payload(order)
+            data['items'] = list(items)
+            return data
         except Order.DoesNotExist:
             return None
     
     @database_sync_to_async
     def update_order_status(self, new_status):
         """Update order status in database."""
-        try:
-            order = Order.objects.get(id=self.order_id)
-            if new_status in [status[0] for status in Order.STATUS_CHOICES]:
-                order.status = new_status
-                order.save(update_fields=['status'])
-                
-                # Broadcast status change to all consumers in group
-                from asgiref.sync import async_to_sync
-                from channels.layers import get_channel_layer
-                
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    self.order_group_name,
-                    {
-                        'type': 'order_status',
-                        'data': {
-                            'status': new_status,
-                            'status_display': order.get_status_display()
-                        }
-                    }
-                )
-        except Order.DoesNotExist:
-            pass
+        transition = Order.transition_for_status(new_status)
+        if transition is None:
+            return
+        
+        # Переход выполняется условным UPDATE; если статус уже изменился, ничего не пишется
+        order = Order(pk=self.order_id)
+        if not order.transition(transition, changed_by=ws_auth.scope_user(self.scope)):
+            return
+        
+        # Broadcast status change to all consumers in group
+        broadcast.send(
+            self.order_group_name,
+            {
+                'type': 'order_status',
+                'data': {
+                    'status': new_status,
+                    'status_display': order.get_status_display()
+                }
+            }
+        )
 
 
-class OrderItemConsumer(AsyncWebsocketConsumer):
+class OrderItemConsumer(broadcast.BroadcastConsumerMixin, ws_codec.CodecConsumerMixin, AsyncWebsocketConsumer):
     """
     Consumer for order item updates.
     Handles real-time updates for items in an order.
@@ -150,6 +143,10 @@ class OrderItemConsumer(AsyncWebsocketConsumer):
         self.order_id = self.scope['url_route']['kwargs']['order_id']
         self.items_group_name = f'order_items_{self.order_id}'
         
+        if not await ws_auth.can_join_order(self.scope, self.order_id):
+            await self.close(code=ws_auth.FORBIDDEN)
+            return
+        
         await self.channel_layer.group_add(
             self.items_group_name,
             self.channel_name
@@ -164,29 +161,26 @@ class OrderItemConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages."""
         try:
-            data = json.loads(text_data)
+            data = ws_codec.loads(text_data, bytes_data)
             action = data.get('action')
             
             if action == 'get_items':
                 items_data = await self.get_order_items()
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'items_list',
                     'items': items_data
-                }))
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'error': 'Invalid JSON'
-            }))
+                })
+        except ValueError:
+            await self.send_message({
+                'error': 'Invalid message'
+            })
     
     async def items_updated(self, event):
         """Send items update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'items_updated',
-            'items': event['items']
-        }))
+        await self.forward(event)
     
     @database_sync_to_async
     def get_order_items(self):
@@ -198,3 +192,63 @@ class OrderItemConsumer(AsyncWebsocketConsumer):
             return list(items)
         except Exception:
             return []
+
+
+class KitchenConsumer(broadcast.BroadcastConsumerMixin, ws_codec.CodecConsumerMixin, AsyncWebsocketConsumer):
+    """
+    Consumer for the kitchen display.
+    Sends one queue snapshot on connect, then small deltas with sequence numbers.
+    """
+    
+    async def connect(self):
+        """Handle WebSocket connection."""
+        self.restaurant_id = self.scope['url_route']['kwargs']['restaurant_id']
+        self.group_name = kitchen_group_name(self.restaurant_id)
+        
+        if not ws_auth.is_staff_of(self.scope, self.restaurant_id):
+            await self.close(code=ws_auth.FORBIDDEN)
+            return
+        
+        # Подписка до снимка: дельты, пришедшие раньше снимка, клиент отбросит по seq
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+        
+        await self.accept()
+        await self.send_snapshot()
+    
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection."""
+        await self.channel_layer.group_discard(
+            self.group_name,
+            self.channel_name
+        )
+    
+    async def receive(self, text_data=None, bytes_data=None):
+        """Handle incoming messages."""
+        try:
+            data = ws_codec.loads(text_data, bytes_data)
+            if data.get('action') == 'get_snapshot':
+                await self.send_snapshot()
+        except ValueError:
+            await self.send_message({
+                'error': 'Invalid message'
+            })
+    
+    async def send_snapshot(self):
+        """Send the current kitchen queue."""
+        snapshot = await self.get_snapshot()
+        await self.send_message({
+            'type': 'kitchen_snapshot',
+            **snapshot
+        })
+    
+    async def kitchen_delta(self, event):
+        """Send kitchen queue delta to WebSocket."""
+        await self.forward(event)
+    
+    @database_sync_to_async
+    def get_snapshot(self):
+        """Get kitchen queue snapshot (reads the database only on cold start)."""
+        return get_kitchen_queue().snapshot(self.restaurant_id)
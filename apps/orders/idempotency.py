@@ -0,0 +1,247 @@
+"""
+Idempotent create requests (``Idempotency-Key`` header).
+
+The first request with a key claims it, runs the view and stores the
+status code and body of its response for ``IDEMPOTENCY_KEY_TTL`` seconds.
+A retry with the same key and body gets the stored response back without
+running the serializer again; a retry that arrives while the first request
+is still running gets ``409`` with ``Retry-After``, and reusing a key with a
+different body gets ``422``. Errors (validation errors, exceptions and
+5xx responses) release the key, so a corrected request can be retried.
+
+Keys live in the shared Django cache. When no shared cache is configured
+(the default ``LocMemCache`` is per process) they are kept in the
+``IdempotencyKey`` table instead; ``IDEMPOTENCY_BACKEND`` forces either.
+"""
+import hashlib
+import json
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 200
+
+# Ответ еще не сохранен: запрос с этим ключом выполняется
+IN_PROGRESS = None
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60)
+
+
+def lock_timeout():
+    return getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 30)
+
+
+class CacheIdempotencyStore:
+    """
+    Ключи в общем кэше Django; захват ключа - атомарный cache.add().
+    """
+
+    KEY_PREFIX = 'idempotency'
+
+    def _key(self, key):
+        return f'{self.KEY_PREFIX}:{key}'
+
+    def claim(self, key, fingerprint):
+        """Захватить ключ; вернуть None или уже сохраненную запись."""
+        record = {'fingerprint': fingerprint, 'status': IN_PROGRESS, 'data': None}
+        if cache.add(self._key(key), record, lock_timeout()):
+            return None
+        existing = cache.get(self._key(key))
+        if existing is None:
+            # Ключ истек между add() и get()
+            return None if cache.add(self._key(key), record, lock_timeout()) else record
+        return existing
+
+    def save(self, key, fingerprint, status_code, data):
+        cache.set(
+            self._key(key),
+            {'fingerprint': fingerprint, 'status': status_code, 'data': data},
+            key_ttl()
+        )
+
+    def release(self, key):
+        cache.delete(self._key(key))
+
+
+class DatabaseIdempotencyStore:
+    """
+    Ключи в таблице IdempotencyKey; захват ключа - INSERT в уникальный индекс.
+    """
+
+    def claim(self, key, fingerprint):
+        from .models import IdempotencyKey
+
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=key, fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=lock_timeout())
+                )
+            return None
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyKey.objects.filter(key=key).first()
+        if existing is None:
+            # Ключ удалили между INSERT и SELECT
+            return self.claim(key, fingerprint)
+        if existing.expires_at <= now:
+            # Истекший ключ (или брошенная блокировка) захватывается заново
+            reclaimed = IdempotencyKey.objects.filter(
+                key=key, expires_at=existing.expires_at
+            ).update(
+                fingerprint=fingerprint, status_code=None, response_body=None,
+                expires_at=now + timedelta(seconds=lock_timeout())
+            )
+            if reclaimed:
+                return None
+            existing = IdempotencyKey.objects.filter(key=key).first() or existing
+        return {
+            'fingerprint': existing.fingerprint,
+            'status': existing.status_code,
+            'data': existing.response_body,
+        }
+
+    def save(self, key, fingerprint, status_code, data):
+        from .models import IdempotencyKey
+
+        IdempotencyKey.objects.filter(key=key).update(
+            status_code=status_code, response_body=data,
+            expires_at=timezone.now() + timedelta(seconds=key_ttl())
+        )
+
+    def release(self, key):
+        from .models import IdempotencyKey
+
+        IdempotencyKey.objects.filter(key=key).delete()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    """Получить хранилище ключей идемпотентности."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                name = getattr(settings, 'IDEMPOTENCY_BACKEND', None)
+                if name is None:
+                    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+                    name = 'database' if backend in PER_PROCESS_CACHES else 'cache'
+                if name == 'cache':
+                    _store = CacheIdempotencyStore()
+                else:
+                    _store = DatabaseIdempotencyStore()
+    return _store
+
+
+def purge_expired_keys():
+    """Удалить истекшие ключи из таблицы."""
+    from .models import IdempotencyKey
+
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def _fingerprint(request):
+    try:
+        raw = request.body
+    except RawPostDataException:
+        # multipart: поток уже прочитан парсером
+        raw = json.dumps(request.data, sort_keys=True, cls=JSONEncoder, default=str).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _scoped_key(request, scope, key):
+    """Ключ, привязанный к эндпоинту и пользователю (sha256, 64 символа)."""
+    user = request.user
+    owner = f'user-{user.pk}' if user and user.is_authenticated else 'anonymous'
+    return hashlib.sha256(f'{scope}:{owner}:{key}'.encode()).hexdigest()
+
+
+def idempotent_response(request, scope, handler):
+    """
+    Выполнить ``handler()`` не больше одного раза для ключа из заголовка.
+
+    Без заголовка Idempotency-Key просто вызывает handler.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    store = get_idempotency_store()
+    key = _scoped_key(request, scope, key)
+    fingerprint = _fingerprint(request)
+
+    record = store.claim(key, fingerprint)
+    if record is not None:
+        if record['fingerprint'] != fingerprint:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record['status'] is IN_PROGRESS:
+            return Response(
+                {'error': 'A request with this Idempotency-Key is still being processed'},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'}
+            )
+        return Response(
+            json.loads(record['data']) if record['data'] is not None else None,
+            status=record['status'],
+            headers={'Idempotent-Replayed': 'true'}
+        )
+
+    try:
+        response = handler()
+    except Exception:
+        store.release(key)
+        raise
+
+    if response.status_code >= 500:
+        store.release(key)
+    else:
+        data = response.data
+        store.save(
+            key, fingerprint, response.status_code,
+            json.dumps(data, cls=JSONEncoder) if data is not None else None
+        )
+    return response
+
+
+class IdempotentCreateMixin:
+    """
+    Поддержка заголовка Idempotency-Key для create() во ViewSet.
+    """
+
+    idempotency_scope = None
+
+    def create(self, request, *args, **kwargs):
+        scope = self.idempotency_scope or self.basename
+        return idempotent_response(
+            request, scope, lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs)
+        )
@@ -0,0 +1,489 @@
+"""
+Write-behind order ingestion (``ORDER_INGESTION_MODE = 'queue'``).
+
+``POST /api/orders/`` validates the cart against a short-lived cache of the
+restaurant's menu, reserves stock, appends the order to a durable queue and
+answers ``202 Accepted`` with a provisional id. No order rows are written
+and nothing is broadcast inside the request.
+
+``drain_order_queue`` (Celery) takes the queue in batches, writes orders and
+their items with two ``bulk_create`` calls per batch, sends ``order_placed``
+for each order and confirms it to the guest over the table-session
+WebSocket (``order_accepted`` / ``order_rejected`` with the provisional id).
+Draining is idempotent: an intent whose order already exists (a batch that
+was committed but not acknowledged) is skipped.
+
+The queue is a Redis stream with a consumer group
+(``ORDER_INGEST_QUEUE_BACKEND = 'redis'``) or the ``OrderIntent`` table
+(``'database'``, a local stand-in without Redis).
+
+A batch that fails to write is retried one intent at a time; an intent that
+fails on its own is rejected (``order_rejected``, stock released) so later
+orders keep moving. Database connection errors leave the batch queued. An
+entry delivered ``ORDER_INGEST_MAX_DELIVERIES`` times without being written
+is rejected and moved aside: to the ``orders:ingest:dead`` stream, or kept
+in ``OrderIntent`` with ``attempts`` at the limit.
+"""
+import json
+import logging
+import socket
+import threading
+import uuid
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, InterfaceError, OperationalError, transaction
+from django.db.models import F
+
+from config import broadcast, single_flight
+
+logger = logging.getLogger(__name__)
+
+MenuItemInfo = namedtuple('MenuItemInfo', 'pk name price is_available stock_quantity')
+SessionInfo = namedtuple('SessionInfo', 'pk restaurant_id is_active')
+RestaurantRates = namedtuple('RestaurantRates', 'tax_rate service_charge')
+
+
+def ingestion_enabled():
+    return getattr(settings, 'ORDER_INGESTION_MODE', 'sync') == 'queue'
+
+
+def cache_ttl():
+    return getattr(settings, 'ORDER_INGEST_CACHE_TTL', 60)
+
+
+def max_deliveries():
+    return getattr(settings, 'ORDER_INGEST_MAX_DELIVERIES', 5)
+
+
+# Кэш данных меню для проверки корзины без обращения к базе
+def menu_cache_key(restaurant_id):
+    return f'ingest:menu:{restaurant_id}'
+
+
+def rates_cache_key(restaurant_id):
+    return f'ingest:rates:{restaurant_id}'
+
+
+def session_cache_key(session_id):
+    return f'ingest:session:{session_id}'
+
+
+def get_menu_items(restaurant_id):
+    """Позиции меню ресторана {id: MenuItemInfo} из кэша."""
+    from apps.menu.models import MenuItem
+
+    def build():
+        return {
+            row[0]: MenuItemInfo(*row)
+            for row in MenuItem.objects.filter(category__restaurant_id=restaurant_id).values_list(
+                'pk', 'name', 'price', 'is_available', 'stock_quantity'
+            )
+        }
+
+    # Истекшую запись пересобирает один запрос; invalidate_menu удаляет ее сразу
+    return single_flight.get_or_build(menu_cache_key(restaurant_id), build, cache_ttl())
+
+
+def get_restaurant_rates(restaurant_id):
+    """Ставки налога и сервисного сбора ресторана из кэша."""
+    from apps.restaurants.models import Restaurant
+
+    def build():
+        row = Restaurant.objects.filter(pk=restaurant_id).values_list(
+            'tax_rate', 'service_charge'
+        ).first()
+        return RestaurantRates(*row) if row is not None else None
+
+    return single_flight.get_or_build(rates_cache_key(restaurant_id), build, cache_ttl())
+
+
+def get_session_info(session_id):
+    """Сессия столика (id, ресторан и открыта ли она) из кэша или None."""
+    from apps.tables.models import TableSession
+
+    key = session_cache_key(session_id)
+    info = cache.get(key)
+    if info is None:
+        row = TableSession.objects.filter(pk=session_id).values_list(
+            'pk', 'table__restaurant_id', 'closed_at'
+        ).first()
+        if row is None:
+            return None
+        pk, restaurant_id, closed_at = row
+        info = SessionInfo(pk, restaurant_id, closed_at is None)
+        # Закрытие сессии удаляет запись сразу (invalidate_session)
+        cache.set(key, info, cache_ttl())
+    return info
+
+
+def invalidate_menu(restaurant_id):
+    cache.delete(menu_cache_key(restaurant_id))
+
+
+def invalidate_rates(restaurant_id):
+    cache.delete(rates_cache_key(restaurant_id))
+
+
+def invalidate_session(session_id):
+    cache.delete(session_cache_key(session_id))
+
+
+# Очередь
+def _dumps(payload):
+    return json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+class DatabaseOrderQueue:
+    """
+    Очередь в таблице OrderIntent.
+
+    Пачка блокируется через SELECT ... FOR UPDATE SKIP LOCKED, записывается
+    и удаляется в одной транзакции, поэтому несколько воркеров не получают
+    одни и те же заказы. Неудачная попытка увеличивает attempts; записи,
+    исчерпавшие попытки, остаются в таблице и больше не выдаются.
+    """
+
+    def append(self, payload):
+        from .models import OrderIntent
+
+        OrderIntent.objects.create(
+            provisional_id=payload['provisional_id'], payload=json.loads(_dumps(payload))
+        )
+
+    def consume(self, batch_size, handler):
+        """Передать handler() одну пачку заказов; вернуть ее размер."""
+        from .models import OrderIntent
+
+        taken = []
+        try:
+            with transaction.atomic():
+                intents = list(
+                    OrderIntent.objects.filter(attempts__lt=max_deliveries())
+                    .order_by('pk').select_for_update(skip_locked=True)[:batch_size]
+                )
+                if not intents:
+                    return 0
+                taken = [intent.pk for intent in intents]
+                handler([intent.payload for intent in intents])
+                OrderIntent.objects.filter(pk__in=taken).delete()
+        except Exception:
+            self._record_failure(taken)
+            raise
+        return len(intents)
+
+    def _record_failure(self, pks):
+        """Учесть неудачную попытку; заказы, исчерпавшие попытки, отклонить."""
+        from .models import OrderIntent
+
+        if not pks:
+            return
+        try:
+            with transaction.atomic():
+                OrderIntent.objects.filter(pk__in=pks).update(attempts=F('attempts') + 1)
+                dead = list(
+                    OrderIntent.objects.filter(pk__in=pks, attempts__gte=max_deliveries())
+                    .values_list('payload', flat=True)
+                )
+                if dead:
+                    logger.error('Order intents moved aside after %d attempts: %s', max_deliveries(),
+                                 [payload.get('provisional_id') for payload in dead])
+                    reject_intents(dead)
+        except DatabaseError:
+            # База недоступна: пачка просто останется в очереди
+            logger.exception('Cannot record failed order intents')
+
+    def pending(self):
+        from .models import OrderIntent
+
+        return OrderIntent.objects.filter(attempts__lt=max_deliveries()).count()
+
+
+class RedisOrderQueue:
+    """
+    Очередь в потоке Redis (XADD / XREADGROUP / XACK).
+
+    Запись подтверждается и удаляется только после коммита пачки; записи
+    упавшего воркера забирает следующий через XAUTOCLAIM. Записи, выданные
+    больше ORDER_INGEST_MAX_DELIVERIES раз, переносятся в DEAD_STREAM.
+    """
+
+    STREAM = 'orders:ingest'
+    GROUP = 'ingest'
+    DEAD_STREAM = 'orders:ingest:dead'
+    DEAD_MAXLEN = 10000
+
+    def __init__(self, url=None, client=None, consumer=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.client = client
+        self.consumer = consumer or f'{socket.gethostname()}-{uuid.uuid4().hex[:8]}'
+        self._group_ready = False
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        import redis
+
+        try:
+            self.client.xgroup_create(self.STREAM, self.GROUP, id='0', mkstream=True)
+        except redis.ResponseError as exc:
+            if 'BUSYGROUP' not in str(exc):
+                raise
+        self._group_ready = True
+
+    def append(self, payload):
+        self.client.xadd(self.STREAM, {'payload': _dumps(payload)})
+
+    def _claim_stale(self, batch_size):
+        """Записи, которые другой воркер взял, но не подтвердил."""
+        idle_ms = getattr(settings, 'ORDER_INGEST_RECLAIM_SECONDS', 60) * 1000
+        result = self.client.xautoclaim(
+            self.STREAM, self.GROUP, self.consumer,
+            min_idle_time=idle_ms, start_id='0-0', count=batch_size
+        )
+        return [entry for entry in result[1] if entry and entry[1]]
+
+    def _retire_exhausted(self, entries):
+        """Перенести в DEAD_STREAM записи, исчерпавшие попытки; вернуть остальные."""
+        if not entries:
+            return entries
+        pipe = self.client.pipeline()
+        for entry_id, _ in entries:
+            pipe.xpending_range(self.STREAM, self.GROUP, min=entry_id, max=entry_id, count=1)
+        # XAUTOCLAIM уже увеличил счетчик выдач забранных записей
+        deliveries = [info[0]['times_delivered'] if info else 0 for info in pipe.execute()]
+
+        live, dead = [], []
+        for entry, delivered in zip(entries, deliveries):
+            (dead if delivered > max_deliveries() else live).append(entry)
+        if dead:
+            ids = [entry_id for entry_id, _ in dead]
+            logger.error('Order intents moved to %s after %d deliveries: %s',
+                         self.DEAD_STREAM, max_deliveries(), ids)
+            pipe = self.client.pipeline()
+            for entry_id, fields in dead:
+                pipe.xadd(self.DEAD_STREAM, {'id': entry_id, 'payload': fields[b'payload']},
+                          maxlen=self.DEAD_MAXLEN, approximate=True)
+            pipe.xack(self.STREAM, self.GROUP, *ids)
+            pipe.xdel(self.STREAM, *ids)
+            pipe.execute()
+            reject_intents([json.loads(fields[b'payload']) for _, fields in dead])
+        return live
+
+    def consume(self, batch_size, handler):
+        """Передать handler() одну пачку заказов; вернуть ее размер."""
+        self._ensure_group()
+        entries = self._retire_exhausted(self._claim_stale(batch_size))
+        if not entries:
+            response = self.client.xreadgroup(
+                self.GROUP, self.consumer, {self.STREAM: '>'}, count=batch_size
+            )
+            entries = response[0][1] if response else []
+        if not entries:
+            return 0
+
+        ids = [entry_id for entry_id, _ in entries]
+        handler([json.loads(fields[b'payload']) for _, fields in entries])
+
+        pipe = self.client.pipeline()
+        pipe.xack(self.STREAM, self.GROUP, *ids)
+        pipe.xdel(self.STREAM, *ids)
+        pipe.execute()
+        return len(entries)
+
+    def pending(self):
+        return self.client.xlen(self.STREAM)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_order_queue():
+    """Получить очередь приема заказов."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                backend = getattr(settings, 'ORDER_INGEST_QUEUE_BACKEND', 'redis')
+                if backend == 'redis':
+                    _queue = RedisOrderQueue()
+                else:
+                    _queue = DatabaseOrderQueue()
+    return _queue
+
+
+def enqueue_order(payload):
+    """Добавить заказ в очередь; вернуть его предварительный id."""
+    payload.setdefault('provisional_id', str(uuid.uuid4()))
+    get_order_queue().append(payload)
+    return payload['provisional_id']
+
+
+# Запись заказов из очереди
+def _push(session_id, message_type, data):
+    broadcast.send(f'table_session_{session_id}', {'type': message_type, 'data': data})
+
+
+def _announce(accepted, rejected):
+    from .signals import order_placed
+    from .models import Order
+
+    # События всей пачки уходят одним сообщением на группу
+    with broadcast.batch():
+        for order, lines in accepted:
+            order_placed.send(sender=Order, order=order, items=lines)
+            _push(order.table_session_id, 'order_accepted', {
+                'provisional_id': str(order.ingest_id),
+                'order_id': order.pk,
+                'status': order.status,
+                'total_amount': str(order.total_amount),
+                'items_count': order.items_count,
+            })
+        for payload, reason in rejected:
+            _push(payload['table_session'], 'order_rejected', {
+                'provisional_id': payload['provisional_id'],
+                'reason': reason,
+            })
+
+
+def _release(rejected):
+    from apps.menu.stock import release_stock
+
+    for payload, _ in rejected:
+        release_stock(payload.get('reserved') or {})
+
+
+def reject_intents(payloads, reason='Не удалось записать заказ'):
+    """Отклонить заказы из очереди: после коммита вернуть остатки и сообщить гостям."""
+    rejected = [(payload, reason) for payload in payloads]
+    transaction.on_commit(lambda: _release(rejected), robust=True)
+    transaction.on_commit(lambda: _announce([], rejected), robust=True)
+
+
+def persist_intents(payloads):
+    """
+    Записать пачку заказов из очереди.
+
+    Заказы и позиции пишутся двумя bulk_create в одной транзакции; события
+    отправляются после коммита. Возвращает количество записанных заказов.
+    """
+    from apps.menu.models import MenuItem
+    from apps.tables.models import TableSession
+    from .models import Order, OrderItem
+
+    existing = {
+        str(pk) for pk in Order.objects.filter(
+            ingest_id__in=[payload['provisional_id'] for payload in payloads]
+        ).values_list('ingest_id', flat=True)
+    }
+    payloads = [payload for payload in payloads if payload['provisional_id'] not in existing]
+    if not payloads:
+        return 0
+
+    sessions = TableSession.objects.select_related('table').in_bulk(
+        {payload['table_session'] for payload in payloads}
+    )
+    menu_items = MenuItem.objects.only('id', 'name').in_bulk(
+        {item['menu_item'] for payload in payloads for item in payload['items']}
+    )
+
+    accepted, rejected = [], []
+    for payload in payloads:
+        session = sessions.get(payload['table_session'])
+        if session is None:
+            rejected.append((payload, 'Сессия столика не найдена'))
+            continue
+        # Сессию могли закрыть, пока заказ ждал в очереди
+        if session.closed_at is not None:
+            rejected.append((payload, 'Сессия столика закрыта'))
+            continue
+        if any(item['menu_item'] not in menu_items for item in payload['items']):
+            rejected.append((payload, 'Позиция меню больше не доступна'))
+            continue
+        order = Order(
+            ingest_id=payload['provisional_id'],
+            table_session=session,
+            guest_name=payload['guest_name'],
+            payment_method=payload['payment_method'],
+            notes=payload['notes'],
+            items_count=payload['items_count'],
+            **{field: Decimal(value) for field, value in payload['totals'].items()}
+        )
+        lines = [
+            OrderItem(
+                menu_item=menu_items[item['menu_item']],
+                quantity=item['quantity'],
+                price=Decimal(item['price']),
+                selected_options=item['selected_options'],
+                notes=item['notes'],
+            )
+            for item in payload['items']
+        ]
+        accepted.append((order, lines))
+
+    with transaction.atomic():
+        Order.objects.bulk_create([order for order, _ in accepted])
+        for order, lines in accepted:
+            for line in lines:
+                line.order = order
+        OrderItem.objects.bulk_create([line for _, lines in accepted for line in lines])
+        transaction.on_commit(lambda: _release(rejected))
+        transaction.on_commit(lambda: _announce(accepted, rejected))
+    return len(accepted)
+
+
+# Ошибки соединения с базой: пачка остается в очереди до следующей попытки
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+def persist_batch(payloads):
+    """
+    Записать пачку заказов; если она не записывается, записать их по одному.
+
+    Заказ, который не записывается и один, отклоняется, чтобы не задерживать
+    остальные заказы очереди. Ошибки соединения с базой пробрасываются.
+    """
+    try:
+        with transaction.atomic():
+            return persist_intents(payloads)
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception:
+        logger.warning('Order batch of %d failed, writing one by one', len(payloads), exc_info=True)
+
+    persisted = 0
+    for payload in payloads:
+        try:
+            with transaction.atomic():
+                persisted += persist_intents([payload])
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception:
+            logger.exception('Order intent %s rejected', payload.get('provisional_id'))
+            reject_intents([payload])
+    return persisted
+
+
+def drain_queue(batch_size=None, max_batches=None):
+    """Разобрать очередь пачками; вернуть количество записанных заказов."""
+    batch_size = batch_size or getattr(settings, 'ORDER_INGEST_BATCH_SIZE', 200)
+    queue = get_order_queue()
+    persisted = 0
+    batches = 0
+
+    def handler(payloads):
+        nonlocal persisted
+        persisted += persist_batch(payloads)
+
+    while max_batches is None or batches < max_batches:
+        taken = queue.consume(batch_size, handler)
+        batches += 1
+        if taken < batch_size:
+            break
+    return persisted
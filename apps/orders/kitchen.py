@@ -0,0 +1,336 @@
+"""
+Kitchen display queue.
+
+Keeps a per-restaurant queue of confirmed and preparing orders with their
+items. The queue is filled from order events (``order_placed`` and
+``order_transitioned``), so confirming an order does not read the database:
+the lines of a new order are stored as soon as it is placed and only become
+visible to the kitchen when the order is confirmed.
+
+Every visible change is pushed to the ``kitchen_<restaurant_id>`` group as a
+small delta (``added``, ``updated`` or ``bumped``) with a per-restaurant
+sequence number. ``KitchenConsumer`` sends one snapshot on connect; clients
+ignore deltas whose ``seq`` is not newer than the snapshot.
+
+The queue lives in Redis (``KITCHEN_QUEUE_BACKEND = 'redis'``, shared by all
+processes) or in process memory (``'local'``, single process and tests).
+A restaurant's queue is rebuilt from the database on the first snapshot and
+again every ``KITCHEN_QUEUE_RESYNC_INTERVAL`` seconds, which also drops
+orders whose events were lost; in Redis the queue of a restaurant without
+new orders expires after ``KITCHEN_QUEUE_TTL`` seconds.
+"""
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from config import broadcast
+
+from .models import Order
+
+# Статусы, в которых заказ хранится в очереди, и статусы, видимые кухне
+TRACKED_STATUSES = (Order.Status.PENDING, Order.Status.CONFIRMED, Order.Status.PREPARING)
+VISIBLE_STATUSES = (Order.Status.CONFIRMED, Order.Status.PREPARING)
+
+# Заказы, которые уже готовятся, показываются выше новых
+PRIORITY = {Order.Status.PREPARING: 1, Order.Status.CONFIRMED: 0}
+
+
+def kitchen_group_name(restaurant_id):
+    return f'kitchen_{restaurant_id}'
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def build_entry(order, items):
+    """Запись очереди по заказу и его позициям (без запросов к базе)."""
+    return {
+        'order_id': order.pk,
+        'restaurant_id': order.table.restaurant_id,
+        'table_number': order.table.number,
+        'guest_name': order.guest_name,
+        'notes': order.notes,
+        'status': order.status,
+        'priority': PRIORITY.get(order.status, 0),
+        'created_at': _isoformat(order.created_at),
+        'confirmed_at': _isoformat(order.confirmed_at),
+        'items': [
+            {
+                'menu_item_id': item.menu_item_id,
+                'name': item.menu_item.name,
+                'quantity': item.quantity,
+                'notes': item.notes,
+                'selected_options': item.selected_options,
+            }
+            for item in items
+        ],
+    }
+
+
+def resync_interval():
+    return getattr(settings, 'KITCHEN_QUEUE_RESYNC_INTERVAL', 60 * 60)
+
+
+def queue_ttl():
+    return getattr(settings, 'KITCHEN_QUEUE_TTL', 24 * 60 * 60)
+
+
+def sort_key(entry):
+    return (-entry['priority'], entry['confirmed_at'] or entry['created_at'] or '', entry['order_id'])
+
+
+class LocalKitchenStore:
+    """
+    Очередь в памяти процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders = {}
+        self._index = {}
+        self._seq = {}
+        self._warm = {}
+
+    def get(self, order_id):
+        with self._lock:
+            restaurant_id = self._index.get(order_id)
+            if restaurant_id is None:
+                return None
+            return self._orders[restaurant_id].get(order_id)
+
+    def put(self, entry):
+        with self._lock:
+            self._orders.setdefault(entry['restaurant_id'], {})[entry['order_id']] = entry
+            self._index[entry['order_id']] = entry['restaurant_id']
+
+    def remove(self, order_id):
+        with self._lock:
+            restaurant_id = self._index.pop(order_id, None)
+            if restaurant_id is not None:
+                self._orders.get(restaurant_id, {}).pop(order_id, None)
+
+    def entries(self, restaurant_id):
+        with self._lock:
+            return list(self._orders.get(restaurant_id, {}).values()), self._seq.get(restaurant_id, 0)
+
+    def next_seq(self, restaurant_id):
+        with self._lock:
+            self._seq[restaurant_id] = self._seq.get(restaurant_id, 0) + 1
+            return self._seq[restaurant_id]
+
+    def is_warm(self, restaurant_id):
+        return self._warm.get(restaurant_id, 0) > time.monotonic()
+
+    def mark_warm(self, restaurant_id):
+        self._warm[restaurant_id] = time.monotonic() + resync_interval()
+
+
+class RedisKitchenStore:
+    """
+    Очередь в Redis: хэш заказов на ресторан, ключ заказ -> ресторан
+    и счетчик последовательности.
+
+    Хэш ресторана и ключи его заказов живут KITCHEN_QUEUE_TTL с последней
+    записи. Отметка о заполнении истекает раньше хэша, поэтому пустой после
+    истечения хэш не выдается за актуальную очередь.
+    """
+
+    KEY_PREFIX = 'kitchen'
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.client = client
+
+    def _orders_key(self, restaurant_id):
+        return f'{self.KEY_PREFIX}:{restaurant_id}:orders'
+
+    def _seq_key(self, restaurant_id):
+        return f'{self.KEY_PREFIX}:{restaurant_id}:seq'
+
+    def _warm_key(self, restaurant_id):
+        return f'{self.KEY_PREFIX}:{restaurant_id}:warm'
+
+    def _index_key(self, order_id):
+        return f'{self.KEY_PREFIX}:order:{order_id}'
+
+    def get(self, order_id):
+        restaurant_id = self.client.get(self._index_key(order_id))
+        if restaurant_id is None:
+            return None
+        raw = self.client.hget(self._orders_key(int(restaurant_id)), order_id)
+        return json.loads(raw) if raw else None
+
+    def put(self, entry):
+        ttl = queue_ttl()
+        orders_key = self._orders_key(entry['restaurant_id'])
+        pipe = self.client.pipeline()
+        pipe.hset(orders_key, entry['order_id'], json.dumps(entry))
+        pipe.expire(orders_key, ttl)
+        pipe.set(self._index_key(entry['order_id']), entry['restaurant_id'], ex=ttl)
+        pipe.execute()
+
+    def remove(self, order_id):
+        restaurant_id = self.client.get(self._index_key(order_id))
+        pipe = self.client.pipeline()
+        if restaurant_id is not None:
+            pipe.hdel(self._orders_key(int(restaurant_id)), order_id)
+        pipe.delete(self._index_key(order_id))
+        pipe.execute()
+
+    def entries(self, restaurant_id):
+        pipe = self.client.pipeline()
+        pipe.hvals(self._orders_key(restaurant_id))
+        pipe.get(self._seq_key(restaurant_id))
+        raw, seq = pipe.execute()
+        return [json.loads(value) for value in raw], int(seq or 0)
+
+    def next_seq(self, restaurant_id):
+        return self.client.incr(self._seq_key(restaurant_id))
+
+    def is_warm(self, restaurant_id):
+        return bool(self.client.exists(self._warm_key(restaurant_id)))
+
+    def mark_warm(self, restaurant_id):
+        pipe = self.client.pipeline()
+        pipe.set(self._warm_key(restaurant_id), 1, ex=min(resync_interval(), queue_ttl()))
+        pipe.expire(self._orders_key(restaurant_id), queue_ttl())
+        pipe.execute()
+
+
+class KitchenQueue:
+    """
+    Очередь кухни, обновляемая по событиям заказов.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    # События заказов
+    def order_placed(self, order, items):
+        """Запомнить новый заказ вместе с позициями."""
+        entry = build_entry(order, items)
+        self.store.put(entry)
+        if entry['status'] in VISIBLE_STATUSES:
+            self._push(entry['restaurant_id'], 'added', entry)
+
+    def status_changed(self, order_ids, status):
+        """Применить переход статуса к заказам очереди."""
+        missing = []
+        for order_id in map(int, order_ids):
+            entry = self.store.get(order_id)
+            if entry is None:
+                missing.append(order_id)
+                continue
+            self._apply_status(entry, status)
+
+        # Заказ создан в обход order_placed (например, в админке)
+        if missing and status in VISIBLE_STATUSES:
+            for order in self._load_orders(pk__in=missing):
+                self._apply_status(build_entry(order, order.items.all()), status, force_add=True)
+
+    def _apply_status(self, entry, status, force_add=False):
+        was_visible = entry['status'] in VISIBLE_STATUSES and not force_add
+        if status not in TRACKED_STATUSES:
+            self.store.remove(entry['order_id'])
+            if was_visible:
+                self._push(entry['restaurant_id'], 'bumped', {'order_id': entry['order_id']})
+            return
+
+        entry['status'] = status
+        entry['priority'] = PRIORITY.get(status, 0)
+        if status == Order.Status.CONFIRMED and not entry['confirmed_at']:
+            entry['confirmed_at'] = timezone.now().isoformat()
+        self.store.put(entry)
+        if status in VISIBLE_STATUSES:
+            self._push(entry['restaurant_id'], 'updated' if was_visible else 'added', entry)
+
+    # Снимок
+    def snapshot(self, restaurant_id):
+        """Текущая очередь ресторана и номер последнего изменения."""
+        restaurant_id = int(restaurant_id)
+        if not self.store.is_warm(restaurant_id):
+            self.warm(restaurant_id)
+        entries, seq = self.store.entries(restaurant_id)
+        orders = sorted(
+            (entry for entry in entries if entry['status'] in VISIBLE_STATUSES),
+            key=sort_key
+        )
+        return {'seq': seq, 'orders': orders}
+
+    def warm(self, restaurant_id):
+        """
+        Сверить очередь ресторана с базой (при холодном старте и раз в
+        KITCHEN_QUEUE_RESYNC_INTERVAL).
+
+        Заказы из базы записываются заново; заказы, которые в базе уже не
+        ждут кухню (их событие потерялось), удаляются из очереди.
+        """
+        entries, _ = self.store.entries(restaurant_id)
+        previous = {entry['order_id']: entry for entry in entries}
+        tracked = set()
+        for order in self._load_orders(
+            table_session__table__restaurant_id=restaurant_id,
+            status__in=TRACKED_STATUSES
+        ):
+            entry = build_entry(order, order.items.all())
+            tracked.add(order.pk)
+            self.store.put(entry)
+            before = previous.get(order.pk)
+            if entry['status'] in VISIBLE_STATUSES and (
+                before is None or before['status'] != entry['status']
+            ):
+                visible = before is not None and before['status'] in VISIBLE_STATUSES
+                self._push(restaurant_id, 'updated' if visible else 'added', entry)
+
+        stale = set(previous) - tracked
+        if stale:
+            # Заказ, записанный после выборки выше, в ней не виден: перепроверить
+            stale -= set(Order.objects.filter(
+                pk__in=stale, status__in=TRACKED_STATUSES
+            ).values_list('pk', flat=True))
+        for order_id in sorted(stale):
+            self.store.remove(order_id)
+            if previous[order_id]['status'] in VISIBLE_STATUSES:
+                self._push(restaurant_id, 'bumped', {'order_id': order_id})
+        self.store.mark_warm(restaurant_id)
+
+    def _load_orders(self, **filters):
+        return Order.objects.filter(**filters).select_related(
+            'table_session__table'
+        ).prefetch_related('items__menu_item')
+
+    def _push(self, restaurant_id, action, data):
+        seq = self.store.next_seq(restaurant_id)
+        broadcast.send(
+            kitchen_group_name(restaurant_id),
+            {
+                'type': 'kitchen_delta',
+                'seq': seq,
+                'action': action,
+                'order': data,
+            }
+        )
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_kitchen_queue():
+    """Получить очередь кухни с настроенным хранилищем."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                if getattr(settings, 'KITCHEN_QUEUE_BACKEND', 'redis') == 'local':
+                    store = LocalKitchenStore()
+                else:
+                    store = RedisKitchenStore()
+                _queue = KitchenQueue(store)
+    return _queue
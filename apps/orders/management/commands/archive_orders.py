@@ -0,0 +1,43 @@
+"""
+Management command to archive settled orders.
+Usage: python manage.py archive_orders [--days 90] [--batch-size 500] [--max-batches N]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from apps.orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Перенести оплаченные и отмененные заказы старше заданного возраста в архив'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+            help='Архивировать заказы, не менявшиеся указанное число дней'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ORDER_ARCHIVE_BATCH_SIZE,
+            help='Количество заказов, переносимых в одной транзакции'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Ограничить количество пачек за один запуск'
+        )
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        totals = archive_orders(
+            cutoff=cutoff,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {totals['orders']} orders and {totals['payments']} payments."
+        ))
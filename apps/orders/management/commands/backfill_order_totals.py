@@ -0,0 +1,45 @@
+"""
+Management command to backfill stored order totals.
+Usage: python manage.py backfill_order_totals [--batch-size 500] [--restaurant slug]
+"""
+from django.core.management.base import BaseCommand
+from apps.orders.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать сохраненные суммы заказов по их позициям'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество заказов, пересчитываемых в одной транзакции'
+        )
+        parser.add_argument(
+            '--restaurant',
+            help='Slug ресторана (по умолчанию все рестораны)'
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Order.objects.order_by('pk')
+        if options['restaurant']:
+            queryset = queryset.filter(table_session__table__restaurant__slug=options['restaurant'])
+        
+        processed = 0
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            updated += Order.objects.filter(pk__in=batch).recalculate_totals()
+            processed += len(batch)
+            last_pk = batch[-1]
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} orders, updated {updated}.'
+        ))
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.1 on 2026-10-17 03:54
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="items_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество позиций"
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="service_charge_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0"),
+                editable=False,
+                max_digits=10,
+                verbose_name="Сервисный сбор",
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="subtotal",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0"),
+                editable=False,
+                max_digits=10,
+                verbose_name="Сумма без налогов",
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="tax_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0"),
+                editable=False,
+                max_digits=10,
+                verbose_name="Сумма налога",
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="total_amount",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=Decimal("0"),
+                editable=False,
+                max_digits=10,
+                verbose_name="Общая сумма",
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_initial"),
+        ("menu", "0001_initial"),
+        ("orders", "0002_order_totals"),
+        ("tables", "0002_keyset_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="order_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["status", "-created_at", "-id"], name="order_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="orderitem",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="orderitem_created_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_initial"),
+        ("orders", "0003_keyset_indexes"),
+        ("tables", "0002_keyset_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["updated_at", "id"], name="order_updated_id_idx"
+            ),
+        ),
+    ]
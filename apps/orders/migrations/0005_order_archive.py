@@ -0,0 +1,274 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_order_updated_index"),
+        ("restaurants", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedOrder",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="ID заказа"
+                    ),
+                ),
+                (
+                    "table_session_id",
+                    models.BigIntegerField(verbose_name="ID сессии столика"),
+                ),
+                (
+                    "table_number",
+                    models.CharField(max_length=20, verbose_name="Номер столика"),
+                ),
+                (
+                    "guest_session_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="ID гостевой сессии"
+                    ),
+                ),
+                (
+                    "waiter_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="ID официанта"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает подтверждения"),
+                            ("confirmed", "Подтвержден"),
+                            ("preparing", "Готовится"),
+                            ("ready", "Готов"),
+                            ("delivered", "Доставлен"),
+                            ("paid", "Оплачен"),
+                            ("cancelled", "Отменен"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "payment_method",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("cash", "Наличные"),
+                            ("qr", "QR код"),
+                            ("card", "Карта"),
+                        ],
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "guest_name",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Имя гостя"
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Примечания")),
+                (
+                    "waiter_notes",
+                    models.TextField(blank=True, verbose_name="Заметки официанта"),
+                ),
+                (
+                    "subtotal",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=10,
+                        verbose_name="Сумма без налогов",
+                    ),
+                ),
+                (
+                    "tax_amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Сумма налога"
+                    ),
+                ),
+                (
+                    "service_charge_amount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=10,
+                        verbose_name="Сумма обслуживания",
+                    ),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Итоговая сумма"
+                    ),
+                ),
+                (
+                    "items_count",
+                    models.PositiveIntegerField(verbose_name="Количество позиций"),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Дата создания")),
+                (
+                    "confirmed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время подтверждения"
+                    ),
+                ),
+                (
+                    "ready_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время готовности"
+                    ),
+                ),
+                (
+                    "delivered_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время доставки"
+                    ),
+                ),
+                (
+                    "paid_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время оплаты"
+                    ),
+                ),
+                (
+                    "cancelled_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Время отмены"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(verbose_name="Дата обновления")),
+                (
+                    "archived_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата архивации"
+                    ),
+                ),
+                (
+                    "restaurant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_orders",
+                        to="restaurants.restaurant",
+                        verbose_name="Ресторан",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивный заказ",
+                "verbose_name_plural": "Архивные заказы",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedOrderItem",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="ID позиции"
+                    ),
+                ),
+                (
+                    "menu_item_id",
+                    models.BigIntegerField(verbose_name="ID позиции меню"),
+                ),
+                (
+                    "menu_item_name",
+                    models.CharField(
+                        max_length=200, verbose_name="Название позиции меню"
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField(verbose_name="Количество")),
+                (
+                    "price",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Цена за единицу"
+                    ),
+                ),
+                (
+                    "selected_options",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Выбранные опции"
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Примечания")),
+                ("created_at", models.DateTimeField(verbose_name="Дата создания")),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="orders.archivedorder",
+                        verbose_name="Заказ",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивная позиция заказа",
+                "verbose_name_plural": "Архивные позиции заказов",
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedOrderStatusHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="ID записи"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает подтверждения"),
+                            ("confirmed", "Подтвержден"),
+                            ("preparing", "Готовится"),
+                            ("ready", "Готов"),
+                            ("delivered", "Доставлен"),
+                            ("paid", "Оплачен"),
+                            ("cancelled", "Отменен"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "changed_by_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="ID пользователя"
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Примечания")),
+                ("created_at", models.DateTimeField(verbose_name="Время изменения")),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="status_history",
+                        to="orders.archivedorder",
+                        verbose_name="Заказ",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивная история статусов",
+                "verbose_name_plural": "Архивная история статусов",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="archivedorder",
+            index=models.Index(
+                fields=["restaurant", "-created_at"], name="archorder_restaurant_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0005_order_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(max_length=64, unique=True, verbose_name="Ключ"),
+                ),
+                (
+                    "fingerprint",
+                    models.CharField(max_length=64, verbose_name="Отпечаток запроса"),
+                ),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(
+                        blank=True, null=True, verbose_name="Код ответа"
+                    ),
+                ),
+                (
+                    "response_body",
+                    models.TextField(blank=True, null=True, verbose_name="Тело ответа"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="Истекает"),
+                ),
+            ],
+            options={
+                "verbose_name": "Ключ идемпотентности",
+                "verbose_name_plural": "Ключи идемпотентности",
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0006_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderIntent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "provisional_id",
+                    models.UUIDField(unique=True, verbose_name="Предварительный id"),
+                ),
+                ("payload", models.JSONField(verbose_name="Данные заказа")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Заказ в очереди",
+                "verbose_name_plural": "Заказы в очереди",
+            },
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="ingest_id",
+            field=models.UUIDField(
+                blank=True,
+                editable=False,
+                null=True,
+                unique=True,
+                verbose_name="Предварительный id",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.1 on 2026-10-17 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0007_order_ingestion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderintent",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text="Заказ с ORDER_INGEST_MAX_DELIVERIES попыток отклонен и больше не записывается",
+                verbose_name="Неудачных попыток",
+            ),
+        ),
+    ]
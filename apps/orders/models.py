@@ -1,11 +1,92 @@
 """
 Order models.
 """
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
+from collections import namedtuple
 from decimal import Decimal
-from django.db.models import Sum, F
+from django.db.models import Sum, F, Value, Case, When
+from django.db.models.functions import Concat
+
+
+TWO_PLACES = Decimal('0.01')
+
+
+# Переход статуса заказа: целевой статус, допустимые исходные статусы,
+# поле времени, которое проставляется при переходе, и нужно ли назначить
+# официанта, выполнившего переход
+Transition = namedtuple('Transition', 'target sources timestamp assign_waiter')
+
+
+class OrderQuerySet(models.QuerySet):
+    """
+    QuerySet заказов.
+    """
+    
+    def recalculate_totals(self):
+        """
+        Пересчитать сохраненные суммы заказов по их позициям.
+        
+        Строки заказов блокируются на время пересчета, суммы позиций
+        считаются одним GROUP BY запросом, а изменившиеся заказы
+        записываются одним bulk_update. Возвращает число обновленных заказов.
+        """
+        with transaction.atomic(using=self.db):
+            rows = list(
+                self.select_for_update(of=('self',)).order_by().values_list(
+                    'pk',
+                    'table_session__table__restaurant__tax_rate',
+                    'table_session__table__restaurant__service_charge',
+                    *Order.TOTAL_FIELDS
+                )
+            )
+            if not rows:
+                return 0
+            
+            sums = {
+                row['order']: row
+                for row in OrderItem.objects.using(self.db).filter(
+                    order__in=[row[0] for row in rows]
+                ).order_by().values('order').annotate(
+                    subtotal=Sum(
+                        F('price') * F('quantity'),
+                        output_field=models.DecimalField(max_digits=12, decimal_places=2)
+                    ),
+                    items_count=Sum('quantity'),
+                )
+            }
+            
+            now = timezone.now()
+            changed = []
+            for pk, tax_rate, service_charge, *current in rows:
+                aggregated = sums.get(pk, {})
+                totals = Order.calculate_totals(
+                    aggregated.get('subtotal'), tax_rate, service_charge
+                )
+                totals['items_count'] = aggregated.get('items_count') or 0
+                if tuple(totals[field] for field in Order.TOTAL_FIELDS) == tuple(current):
+                    continue
+                changed.append(Order(pk=pk, updated_at=now, **totals))
+            
+            if changed:
+                self.model.objects.using(self.db).bulk_update(
+                    changed, [*Order.TOTAL_FIELDS, 'updated_at'], batch_size=500
+                )
+        return len(changed)
+    
+    def transition(self, name, changed_by=None, notes=''):
+        """
+        Перевести все заказы выборки, для которых переход допустим.
+        
+        Блокировка строк, UPDATE и история статусов - в Order.apply_transition.
+        Возвращает список id переведенных заказов.
+        """
+        return Order.apply_transition(
+            Order.TRANSITIONS[name], self.values_list('pk', flat=True),
+            changed_by=changed_by, notes=notes, using=self.db
+        )
 
 
 class Order(models.Model):
@@ -27,6 +108,32 @@ class Order(models.Model):
         QR = 'qr', _('QR код')
         CARD = 'card', _('Карта')
     
+    TRANSITIONS = {
+        'confirm': Transition(
+            Status.CONFIRMED, (Status.PENDING,), 'confirmed_at', True
+        ),
+        'start_preparing': Transition(
+            Status.PREPARING, (Status.CONFIRMED,), None, False
+        ),
+        'mark_ready': Transition(
+            Status.READY, (Status.PENDING, Status.CONFIRMED, Status.PREPARING), 'ready_at', False
+        ),
+        'mark_delivered': Transition(
+            Status.DELIVERED, (Status.READY,), 'delivered_at', False
+        ),
+        # Гость может оплатить по QR еще до подтверждения официантом
+        'mark_paid': Transition(
+            Status.PAID,
+            (Status.PENDING, Status.CONFIRMED, Status.PREPARING, Status.READY, Status.DELIVERED),
+            'paid_at', False
+        ),
+        'cancel': Transition(
+            Status.CANCELLED,
+            (Status.PENDING, Status.CONFIRMED, Status.PREPARING, Status.READY),
+            'cancelled_at', False
+        ),
+    }
+    
     # Привязка к сессии столика
     table_session = models.ForeignKey(
         'tables.TableSession',
@@ -132,10 +239,70 @@ class Order(models.Model):
         verbose_name=_('Дата обновления')
     )
     
+    # Суммы (пересчитываются при изменении позиций заказа)
+    subtotal = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0'),
+        editable=False,
+        verbose_name=_('Сумма без налогов')
+    )
+    
+    tax_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0'),
+        editable=False,
+        verbose_name=_('Сумма налога')
+    )
+    
+    service_charge_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0'),
+        editable=False,
+        verbose_name=_('Сервисный сбор')
+    )
+    
+    total_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0'),
+        editable=False,
+        verbose_name=_('Общая сумма')
+    )
+    
+    items_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_('Количество позиций')
+    )
+    
+    # Предварительный id заказа, принятого через очередь (см. apps.orders.ingestion)
+    ingest_id = models.UUIDField(
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        verbose_name=_('Предварительный id')
+    )
+    
+    TOTAL_FIELDS = (
+        'subtotal', 'tax_amount', 'service_charge_amount',
+        'total_amount', 'items_count'
+    )
+    
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Заказ')
         verbose_name_plural = _('Заказы')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+        ]
     
     def __str__(self):
         return f"Заказ #{self.pk} - {self.table_session.table} ({self.get_status_display()})"
@@ -150,87 +317,162 @@ class Order(models.Model):
         """Получить столик"""
         return self.table_session.table
     
-    @property
-    def subtotal(self):
-        """Подсчет суммы без налогов и сервисного сбора"""
-        total = self.items.aggregate(
-            total=Sum(F('price') * F('quantity'))
-        )['total'] or Decimal('0')
-        return total
-    
-    @property
-    def tax_amount(self):
-        """Сумма налога"""
-        restaurant = self.restaurant
-        if restaurant.tax_rate > 0:
-            return self.subtotal * (restaurant.tax_rate / 100)
-        return Decimal('0')
-    
-    @property
-    def service_charge_amount(self):
-        """Сумма сервисного сбора"""
-        restaurant = self.restaurant
-        if restaurant.service_charge > 0:
-            return self.subtotal * (restaurant.service_charge / 100)
-        return Decimal('0')
-    
-    @property
-    def total_amount(self):
-        """Общая сумма заказа"""
-        return self.subtotal + self.tax_amount + self.service_charge_amount
-    
-    @property
-    def items_count(self):
-        """Количество позиций в заказе"""
-        return self.items.aggregate(total=Sum('quantity'))['total'] or 0
+    @staticmethod
+    def calculate_totals(subtotal, tax_rate, service_charge):
+        """Подсчет налога, сервисного сбора и общей суммы по сумме позиций"""
+        subtotal = Decimal(subtotal or 0).quantize(TWO_PLACES)
+        tax_amount = Decimal('0.00')
+        service_charge_amount = Decimal('0.00')
+        if tax_rate and tax_rate > 0:
+            tax_amount = (subtotal * tax_rate / 100).quantize(TWO_PLACES)
+        if service_charge and service_charge > 0:
+            service_charge_amount = (subtotal * service_charge / 100).quantize(TWO_PLACES)
+        return {
+            'subtotal': subtotal,
+            'tax_amount': tax_amount,
+            'service_charge_amount': service_charge_amount,
+            'total_amount': subtotal + tax_amount + service_charge_amount,
+        }
+    
+    def recalculate_totals(self):
+        """Пересчитать сохраненные суммы заказа и обновить экземпляр"""
+        Order.objects.filter(pk=self.pk).recalculate_totals()
+        self.refresh_from_db(fields=[*self.TOTAL_FIELDS, 'updated_at'])
+    
+    @classmethod
+    def transition_for_status(cls, status):
+        """Имя перехода, ведущего в указанный статус"""
+        for name, transition in cls.TRANSITIONS.items():
+            if transition.target == status:
+                return name
+        return None
+    
+    @classmethod
+    def apply_transition(cls, transition, pks, changed_by=None, notes='', extra=None,
+                         now=None, using=None):
+        """
+        Выполнить переход для заказов ``pks``.
+        
+        Заказы в допустимых исходных статусах выбираются с блокировкой строк
+        (SELECT ... FOR UPDATE) и переводятся одним UPDATE по их id.
+        Записывает только статус, время перехода и updated_at, добавляет
+        записи OrderStatusHistory, возвращает остатки при отмене и после
+        коммита отправляет сигнал ``order_transitioned``.
+        Возвращает список id фактически переведенных заказов.
+        """
+        from apps.menu.stock import release_stock
+        from .signals import order_transitioned
+        
+        if not getattr(changed_by, 'is_authenticated', False):
+            changed_by = None
+        pks = [cls._meta.pk.to_python(pk) for pk in pks]
+        
+        now = now or timezone.now()
+        values = {'status': transition.target, 'updated_at': now}
+        if transition.timestamp:
+            values[transition.timestamp] = now
+        if transition.assign_waiter and changed_by is not None:
+            values['waiter'] = changed_by
+        values.update(extra or {})
+        
+        manager = cls.objects.db_manager(using)
+        with transaction.atomic(using=manager.db):
+            # Заказы, для которых переход допустим, блокируются до конца
+            # транзакции: UPDATE переводит ровно их
+            pks = list(
+                manager.filter(pk__in=pks, status__in=transition.sources)
+                .select_for_update(of=('self',))
+                .order_by('pk')
+                .values_list('pk', flat=True)
+            )
+            if not pks:
+                return []
+            manager.filter(pk__in=pks).update(**values)
+            
+            OrderStatusHistory.objects.db_manager(manager.db).bulk_create([
+                OrderStatusHistory(
+                    order_id=pk, status=transition.target,
+                    changed_by=changed_by, notes=notes
+                )
+                for pk in pks
+            ])
+            
+            if transition.target == cls.Status.CANCELLED:
+                quantities = OrderItem.objects.db_manager(manager.db).filter(
+                    order__in=pks
+                ).values('menu_item').annotate(quantity=Sum('quantity'))
+                release_stock({row['menu_item']: row['quantity'] for row in quantities})
+            
+            transaction.on_commit(
+                lambda: order_transitioned.send(
+                    sender=cls, order_ids=list(pks), status=transition.target
+                ),
+                using=manager.db
+            )
+        return pks
+    
+    def transition(self, name, changed_by=None, notes='', extra=None):
+        """
+        Выполнить переход ``name`` для заказа.
+        
+        Возвращает False, если из текущего статуса в базе переход недопустим.
+        """
+        transition = self.TRANSITIONS[name]
+        now = timezone.now()
+        if not self.apply_transition(
+            transition, [self.pk], changed_by=changed_by, notes=notes, extra=extra, now=now
+        ):
+            return False
+        
+        self.status = transition.target
+        self.updated_at = now
+        if transition.timestamp:
+            setattr(self, transition.timestamp, now)
+        if transition.assign_waiter and getattr(changed_by, 'is_authenticated', False):
+            self.waiter = changed_by
+        if extra:
+            self.refresh_from_db(fields=list(extra))
+        return True
     
     def confirm_order(self, waiter):
         """Подтверждение заказа официантом"""
-        from django.utils import timezone
-        
-        self.waiter = waiter
-        self.status = self.Status.CONFIRMED
-        self.confirmed_at = timezone.now()
-        self.save()
+        return self.transition('confirm', changed_by=waiter)
     
-    def mark_as_preparing(self):
+    def mark_as_preparing(self, user=None):
         """Отметить заказ как готовящийся"""
-        self.status = self.Status.PREPARING
-        self.save()
+        return self.transition('start_preparing', changed_by=user)
     
-    def mark_as_ready(self):
+    def mark_as_ready(self, user=None):
         """Отметить заказ как готовый"""
-        from django.utils import timezone
-        
-        self.status = self.Status.READY
-        self.ready_at = timezone.now()
-        self.save()
+        return self.transition('mark_ready', changed_by=user)
     
-    def mark_as_delivered(self):
+    def mark_as_delivered(self, user=None):
         """Отметить заказ как доставленный"""
-        from django.utils import timezone
-        
-        self.status = self.Status.DELIVERED
-        self.delivered_at = timezone.now()
-        self.save()
-    
-    def mark_as_paid(self):
-        """Отметить заказ как оплаченный"""
-        from django.utils import timezone
-        
-        self.status = self.Status.PAID
-        self.paid_at = timezone.now()
-        self.save()
+        return self.transition('mark_delivered', changed_by=user)
     
-    def cancel_order(self, reason=''):
-        """Отменить заказ"""
-        from django.utils import timezone
+    def mark_as_paid(self, user=None):
+        """
+        Отметить заказ как оплаченный.
         
-        self.status = self.Status.CANCELLED
-        self.cancelled_at = timezone.now()
+        Уже оплаченный заказ (повторный или раздельный платеж) тоже считается
+        успехом: статус и история при этом не меняются.
+        """
+        if self.transition('mark_paid', changed_by=user):
+            return True
+        self.refresh_from_db(fields=['status', 'paid_at'])
+        return self.status == self.Status.PAID
+    
+    def cancel_order(self, reason='', user=None):
+        """Отменить заказ и вернуть зарезервированные остатки"""
+        extra = None
         if reason:
-            self.waiter_notes = f"{self.waiter_notes}\nПричина отмены: {reason}".strip()
-        self.save()
+            line = f"Причина отмены: {reason}"
+            extra = {'waiter_notes': Case(
+                When(waiter_notes='', then=Value(line)),
+                default=Concat(F('waiter_notes'), Value(f"\n{line}")),
+                output_field=models.TextField()
+            )}
+        return self.transition('cancel', changed_by=user, notes=reason, extra=extra)
 
 
 class OrderItem(models.Model):
@@ -287,6 +529,9 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = _('Позиция заказа')
         verbose_name_plural = _('Позиции заказов')
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='orderitem_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.menu_item.name} x{self.quantity}"
@@ -346,3 +591,176 @@ class OrderStatusHistory(models.Model):
     
     def __str__(self):
         return f"Заказ #{self.order.pk} - {self.get_status_display()} ({self.created_at})"
+
+
+class ArchivedOrder(models.Model):
+    """
+    Архивная копия оплаченного или отмененного заказа.
+
+    Заказы переносятся сюда из рабочих таблиц (см. apps.orders.archive),
+    чтобы рабочие таблицы и их индексы оставались небольшими. Первичный ключ
+    совпадает с id исходного заказа; ссылки на сессию, гостя и официанта
+    хранятся как простые id, так как эти записи могут быть удалены.
+    """
+    
+    id = models.BigIntegerField(primary_key=True, verbose_name=_('ID заказа'))
+    
+    restaurant = models.ForeignKey(
+        'restaurants.Restaurant',
+        on_delete=models.CASCADE,
+        related_name='archived_orders',
+        verbose_name=_('Ресторан')
+    )
+    
+    table_session_id = models.BigIntegerField(verbose_name=_('ID сессии столика'))
+    table_number = models.CharField(max_length=20, verbose_name=_('Номер столика'))
+    guest_session_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('ID гостевой сессии'))
+    waiter_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('ID официанта'))
+    
+    status = models.CharField(max_length=20, choices=Order.Status.choices, verbose_name=_('Статус'))
+    payment_method = models.CharField(
+        max_length=20,
+        choices=Order.PaymentMethod.choices,
+        blank=True,
+        verbose_name=_('Способ оплаты')
+    )
+    guest_name = models.CharField(max_length=100, blank=True, verbose_name=_('Имя гостя'))
+    notes = models.TextField(blank=True, verbose_name=_('Примечания'))
+    waiter_notes = models.TextField(blank=True, verbose_name=_('Заметки официанта'))
+    
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Сумма без налогов'))
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Сумма налога'))
+    service_charge_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        verbose_name=_('Сумма обслуживания')
+    )
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Итоговая сумма'))
+    items_count = models.PositiveIntegerField(verbose_name=_('Количество позиций'))
+    
+    created_at = models.DateTimeField(verbose_name=_('Дата создания'))
+    confirmed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Время подтверждения'))
+    ready_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Время готовности'))
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Время доставки'))
+    paid_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Время оплаты'))
+    cancelled_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Время отмены'))
+    updated_at = models.DateTimeField(verbose_name=_('Дата обновления'))
+    
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата архивации'))
+    
+    class Meta:
+        verbose_name = _('Архивный заказ')
+        verbose_name_plural = _('Архивные заказы')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['restaurant', '-created_at'], name='archorder_restaurant_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Архивный заказ #{self.pk} ({self.get_status_display()})"
+
+
+class ArchivedOrderItem(models.Model):
+    """
+    Архивная копия позиции заказа.
+    """
+    
+    id = models.BigIntegerField(primary_key=True, verbose_name=_('ID позиции'))
+    
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name=_('Заказ')
+    )
+    
+    menu_item_id = models.BigIntegerField(verbose_name=_('ID позиции меню'))
+    menu_item_name = models.CharField(max_length=200, verbose_name=_('Название позиции меню'))
+    quantity = models.PositiveIntegerField(verbose_name=_('Количество'))
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Цена за единицу'))
+    selected_options = models.JSONField(default=dict, blank=True, verbose_name=_('Выбранные опции'))
+    notes = models.TextField(blank=True, verbose_name=_('Примечания'))
+    created_at = models.DateTimeField(verbose_name=_('Дата создания'))
+    
+    class Meta:
+        verbose_name = _('Архивная позиция заказа')
+        verbose_name_plural = _('Архивные позиции заказов')
+    
+    def __str__(self):
+        return f"{self.menu_item_name} x{self.quantity}"
+
+
+class ArchivedOrderStatusHistory(models.Model):
+    """
+    Архивная история статусов заказа.
+    """
+    
+    id = models.BigIntegerField(primary_key=True, verbose_name=_('ID записи'))
+    
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name='status_history',
+        verbose_name=_('Заказ')
+    )
+    
+    status = models.CharField(max_length=20, choices=Order.Status.choices, verbose_name=_('Статус'))
+    changed_by_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('ID пользователя'))
+    notes = models.TextField(blank=True, verbose_name=_('Примечания'))
+    created_at = models.DateTimeField(verbose_name=_('Время изменения'))
+    
+    class Meta:
+        verbose_name = _('Архивная история статусов')
+        verbose_name_plural = _('Архивная история статусов')
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Заказ #{self.order_id} - {self.get_status_display()} ({self.created_at})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Сохраненный ответ на запрос с заголовком Idempotency-Key.
+
+    Используется, когда в проекте не настроен общий кэш
+    (см. apps.orders.idempotency). Пока запрос выполняется, status_code
+    пустой, а expires_at ограничивает время блокировки ключа.
+    """
+    
+    key = models.CharField(max_length=64, unique=True, verbose_name=_('Ключ'))
+    fingerprint = models.CharField(max_length=64, verbose_name=_('Отпечаток запроса'))
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name=_('Код ответа'))
+    response_body = models.TextField(null=True, blank=True, verbose_name=_('Тело ответа'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
+    expires_at = models.DateTimeField(db_index=True, verbose_name=_('Истекает'))
+    
+    class Meta:
+        verbose_name = _('Ключ идемпотентности')
+        verbose_name_plural = _('Ключи идемпотентности')
+    
+    def __str__(self):
+        return self.key
+
+
+class OrderIntent(models.Model):
+    """
+    Заказ, принятый в очередь и еще не записанный в таблицы заказов.
+
+    Хранилище очереди приема заказов, когда Redis не используется
+    (ORDER_INGEST_QUEUE_BACKEND = 'database', см. apps.orders.ingestion).
+    """
+    
+    provisional_id = models.UUIDField(unique=True, verbose_name=_('Предварительный id'))
+    payload = models.JSONField(verbose_name=_('Данные заказа'))
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name=_('Неудачных попыток'),
+        help_text=_('Заказ с ORDER_INGEST_MAX_DELIVERIES попыток отклонен и больше не записывается')
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата создания'))
+    
+    class Meta:
+        verbose_name = _('Заказ в очереди')
+        verbose_name_plural = _('Заказы в очереди')
+    
+    def __str__(self):
+        return str(self.provisional_id)
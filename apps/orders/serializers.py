@@ -1,9 +1,16 @@
 """
 Serializers for orders app.
 """
+from collections import Counter
+from django.db import transaction
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field
+from apps.menu.models import MenuItem
+from apps.menu.stock import release_stock, reservation_is_transactional, reserve_stock
+from apps.tables.models import TableSession
+from . import ingestion
 from .models import Order, OrderItem
+from .signals import order_placed
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -84,38 +91,277 @@ class OrderDetailSerializer(serializers.ModelSerializer):
         )
 
 
+class OrderItemInputSerializer(serializers.Serializer):
+    """
+    Serializer for a single cart line in order creation.
+    """
+    menu_item = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    selected_options = serializers.DictField(required=False, default=dict)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+def validate_cart(items_data, menu_items, check_stock=True):
+    """
+    Check cart lines against ``menu_items`` ({id: menu item}).
+    
+    Returns the requested quantity per menu item; raises a ValidationError
+    with one entry per line otherwise. ``check_stock=False`` leaves the stock
+    check to the reservation (for cached, possibly stale stock values).
+    """
+    requested = Counter()
+    errors = []
+    for item in items_data:
+        menu_item = menu_items.get(item['menu_item'])
+        if menu_item is None:
+            errors.append({'menu_item': 'Позиция меню не найдена'})
+            continue
+        if not menu_item.is_available:
+            errors.append({'menu_item': f'«{menu_item.name}» сейчас недоступно'})
+            continue
+        requested[menu_item.pk] += item['quantity']
+        errors.append({})
+    
+    if check_stock:
+        for pk, quantity in requested.items():
+            menu_item = menu_items[pk]
+            if menu_item.stock_quantity is not None and menu_item.stock_quantity < quantity:
+                for index, item in enumerate(items_data):
+                    if item['menu_item'] == pk:
+                        errors[index] = {'quantity': f'Недостаточно «{menu_item.name}» в наличии'}
+    
+    if any(errors):
+        raise serializers.ValidationError({'items_data': errors})
+    return requested
+
+
+def reserve_cart(items_data, menu_items, requested):
+    """
+    Reserve stock for the whole cart; raises a ValidationError when an item
+    ran out in the meantime.
+    """
+    reservation = reserve_stock({
+        pk: quantity for pk, quantity in requested.items()
+        if menu_items[pk].stock_quantity is not None
+    })
+    if not reservation:
+        raise serializers.ValidationError({
+            'items_data': [
+                {'quantity': f'Недостаточно «{menu_items[item["menu_item"]].name}» в наличии'}
+                if item['menu_item'] in reservation.failed else {}
+                for item in items_data
+            ]
+        })
+    return reservation
+
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     """
     Serializer for creating orders.
+    
+    All cart lines are validated against one batched MenuItem query; stock
+    for the whole cart is reserved and the order and its lines are written
+    with bulk_create inside one transaction. The "new order" event is
+    broadcast once, after commit, by ``order_placed``.
     """
+    table_session = serializers.PrimaryKeyRelatedField(
+        queryset=TableSession.objects.select_related('table__restaurant')
+    )
     items_data = serializers.ListField(
-        child=serializers.DictField(),
+        child=OrderItemInputSerializer(),
         write_only=True,
-        required=True
+        required=True,
+        allow_empty=False
     )
     
     class Meta:
         model = Order
         fields = (
-            'table_session', 'guest_name', 'payment_method', 'notes', 'items_data'
+            'id', 'table_session', 'guest_name', 'payment_method', 'notes', 'items_data'
         )
+        read_only_fields = ('id',)
+    
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        restaurant_id = attrs['table_session'].table.restaurant_id
+        items_data = attrs['items_data']
+        
+        menu_items = MenuItem.objects.filter(
+            pk__in={item['menu_item'] for item in items_data},
+            category__restaurant_id=restaurant_id
+        ).only('id', 'name', 'price', 'is_available', 'stock_quantity').in_bulk()
+        requested = validate_cart(items_data, menu_items)
+        
+        attrs['menu_items'] = menu_items
+        attrs['requested_stock'] = requested
+        return attrs
     
     def create(self, validated_data):
         items_data = validated_data.pop('items_data')
-        order = Order.objects.create(**validated_data)
+        menu_items = validated_data.pop('menu_items')
+        requested_stock = validated_data.pop('requested_stock')
+        restaurant = validated_data['table_session'].table.restaurant
+        
+        lines = [
+            OrderItem(
+                menu_item=menu_items[item['menu_item']],
+                quantity=item['quantity'],
+                price=menu_items[item['menu_item']].price,
+                selected_options=item['selected_options'],
+                notes=item['notes'],
+            )
+            for item in items_data
+        ]
+        totals = Order.calculate_totals(
+            sum(line.total_price for line in lines),
+            restaurant.tax_rate,
+            restaurant.service_charge
+        )
+        
+        order = Order(
+            items_count=sum(line.quantity for line in lines),
+            **totals,
+            **validated_data
+        )
         
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        # Резерв в базе откатывается вместе с заказом; резерв в счетчиках
+        # при ошибке записи возвращается явно
+        transactional = reservation_is_transactional()
+        reservation = None
+        try:
+            with transaction.atomic():
+                reservation = reserve_cart(items_data, menu_items, requested_stock)
+                # bulk_create не вызывает post_save: о заказе объявляет
+                # order_placed, когда позиции уже записаны
+                Order.objects.bulk_create([order])
+                for line in lines:
+                    line.order = order
+                OrderItem.objects.bulk_create(lines)
+                
+                transaction.on_commit(
+                    lambda: order_placed.send(sender=Order, order=order, items=lines)
+                )
+        except Exception:
+            if reservation is not None and not transactional:
+                release_stock(reservation.reserved)
+            raise
         
         return order
 
 
+class OrderIntentSerializer(serializers.Serializer):
+    """
+    Serializer for queued order creation (ORDER_INGESTION_MODE = 'queue').
+    
+    The cart is validated against cached menu data and, once stock is
+    reserved, the order is appended to the ingestion queue instead of being
+    written; ``save()`` returns the acknowledgement with the provisional id.
+    """
+    table_session = serializers.IntegerField()
+    guest_name = serializers.CharField(required=False, allow_blank=True, max_length=100, default='')
+    payment_method = serializers.ChoiceField(
+        choices=Order.PaymentMethod.choices, default=Order.PaymentMethod.CASH
+    )
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    items_data = serializers.ListField(
+        child=OrderItemInputSerializer(),
+        required=True,
+        allow_empty=False
+    )
+    
+    def validate_table_session(self, value):
+        session = ingestion.get_session_info(value)
+        if session is None:
+            raise serializers.ValidationError('Сессия столика не найдена')
+        if not session.is_active:
+            raise serializers.ValidationError('Сессия столика закрыта')
+        return session
+    
+    def validate(self, attrs):
+        restaurant_id = attrs['table_session'].restaurant_id
+        attrs['rates'] = ingestion.get_restaurant_rates(restaurant_id)
+        attrs['menu_items'] = ingestion.get_menu_items(restaurant_id)
+        attrs['requested_stock'] = validate_cart(
+            attrs['items_data'], attrs['menu_items'], check_stock=False
+        )
+        return attrs
+    
+    def create(self, validated_data):
+        items_data = validated_data['items_data']
+        menu_items = validated_data['menu_items']
+        rates = validated_data['rates']
+        
+        lines = [
+            {
+                'menu_item': item['menu_item'],
+                'quantity': item['quantity'],
+                'price': menu_items[item['menu_item']].price,
+                'selected_options': item['selected_options'],
+                'notes': item['notes'],
+            }
+            for item in items_data
+        ]
+        totals = Order.calculate_totals(
+            sum(line['price'] * line['quantity'] for line in lines),
+            rates.tax_rate,
+            rates.service_charge
+        )
+        
+        reservation = reserve_cart(items_data, menu_items, validated_data['requested_stock'])
+        payload = {
+            'table_session': validated_data['table_session'].pk,
+            'guest_name': validated_data['guest_name'],
+            'payment_method': validated_data['payment_method'],
+            'notes': validated_data['notes'],
+            'items': lines,
+            'items_count': sum(line['quantity'] for line in lines),
+            'totals': totals,
+            'reserved': reservation.reserved,
+        }
+        try:
+            provisional_id = ingestion.enqueue_order(payload)
+        except Exception:
+            release_stock(reservation.reserved)
+            raise
+        
+        return {
+            'provisional_id': provisional_id,
+            'status': 'queued',
+            'table_session': payload['table_session'],
+            'items_count': payload['items_count'],
+            **{field: str(value) for field, value in totals.items()},
+        }
+
+
 class OrderUpdateSerializer(serializers.ModelSerializer):
     """
     Serializer for updating orders.
+    Status changes go through the order state machine.
     """
     class Meta:
         model = Order
         fields = (
             'status', 'payment_method', 'notes', 'waiter_notes'
         )
+    
+    def validate_status(self, value):
+        if self.instance is not None and value != self.instance.status:
+            if Order.transition_for_status(value) is None:
+                raise serializers.ValidationError('Недопустимый статус')
+        return value
+    
+    def update(self, instance, validated_data):
+        new_status = validated_data.pop('status', instance.status)
+        with transaction.atomic():
+            if new_status != instance.status:
+                request = self.context.get('request')
+                if not instance.transition(
+                    Order.transition_for_status(new_status),
+                    changed_by=getattr(request, 'user', None)
+                ):
+                    raise serializers.ValidationError({'status': 'Недопустимый переход статуса'})
+            if validated_data:
+                for attr, value in validated_data.items():
+                    setattr(instance, attr, value)
+                instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
@@ -0,0 +1,82 @@
+"""
+Signals for orders app.
+Keeps stored order totals in sync with order items, announces committed
+order events, feeds the kitchen queue and invalidates the ingestion caches.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+from apps.tables.signals import table_occupancy_changed
+from .models import Order, OrderItem
+
+
+# Отправляется после коммита нового заказа вместе с позициями
+# (см. OrderCreateSerializer). Аргументы: order, items.
+order_placed = Signal()
+
+# Отправляется после коммита перехода статуса (см. Order.apply_transition).
+# Аргументы: order_ids, status.
+order_transitioned = Signal()
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, raw=False, **kwargs):
+    """Пересчитать суммы заказа после изменения позиции."""
+    if raw:
+        return
+    Order.objects.filter(pk=instance.order_id).recalculate_totals()
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, origin=None, **kwargs):
+    """Пересчитать суммы заказа после удаления позиции."""
+    # При каскадном удалении самого заказа пересчитывать нечего
+    if isinstance(origin, Order) or getattr(origin, 'model', None) is Order:
+        return
+    Order.objects.filter(pk=instance.order_id).recalculate_totals()
+
+
+@receiver(order_placed)
+def kitchen_order_placed(sender, order, items, **kwargs):
+    """Добавить новый заказ в очередь кухни."""
+    from .kitchen import get_kitchen_queue
+    get_kitchen_queue().order_placed(order, items)
+
+
+@receiver(order_transitioned)
+def kitchen_order_transitioned(sender, order_ids, status, **kwargs):
+    """Обновить очередь кухни после перехода статуса."""
+    from .kitchen import get_kitchen_queue
+    get_kitchen_queue().status_changed(order_ids, status)
+
+
+@receiver(post_save, sender='menu.MenuItem')
+@receiver(post_delete, sender='menu.MenuItem')
+def menu_item_changed(sender, instance, raw=False, **kwargs):
+    """Сбросить кэш меню, по которому проверяются заказы в очереди."""
+    if raw:
+        return
+    from apps.menu.models import MenuCategory
+    from .ingestion import invalidate_menu
+    restaurant_id = MenuCategory.objects.filter(pk=instance.category_id).values_list(
+        'restaurant_id', flat=True
+    ).first()
+    if restaurant_id is not None:
+        invalidate_menu(restaurant_id)
+
+
+@receiver(post_save, sender='restaurants.Restaurant')
+def restaurant_changed(sender, instance, raw=False, **kwargs):
+    """Сбросить кэш ставок налога и сервисного сбора."""
+    if raw:
+        return
+    from .ingestion import invalidate_rates
+    invalidate_rates(instance.pk)
+
+
+@receiver(table_occupancy_changed)
+def table_session_closed(sender, session, opened, **kwargs):
+    """Сбросить кэш закрытой сессии: заказы в нее больше не принимаются."""
+    if opened:
+        return
+    from .ingestion import invalidate_session
+    invalidate_session(session.pk)
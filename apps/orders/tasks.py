@@ -0,0 +1,26 @@
+"""
+Celery tasks for orders app.
+"""
+from celery import shared_task
+from django.conf import settings
+
+
+@shared_task(ignore_result=True)
+def archive_settled_orders():
+    """Перенести старые оплаченные и отмененные заказы в архив."""
+    from .archive import archive_orders
+    return archive_orders(max_batches=getattr(settings, 'ORDER_ARCHIVE_MAX_BATCHES', None))
+
+
+@shared_task(ignore_result=True)
+def purge_idempotency_keys():
+    """Удалить истекшие ключи идемпотентности из таблицы."""
+    from .idempotency import purge_expired_keys
+    return purge_expired_keys()
+
+
+@shared_task(ignore_result=True)
+def drain_order_queue():
+    """Записать заказы, накопившиеся в очереди приема."""
+    from .ingestion import drain_queue
+    return drain_queue(max_batches=getattr(settings, 'ORDER_INGEST_MAX_BATCHES', None))
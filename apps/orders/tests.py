@@ -0,0 +1,725 @@
+"""
+Tests for orders.
+Run: python manage.py test apps (or pytest)
+"""
+import asyncio
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.menu import stock
+from apps.menu.models import MenuCategory, MenuItem
+from apps.payments.models import ArchivedPayment, Payment
+from apps.restaurants.models import Restaurant
+from apps.tables import occupancy
+from apps.tables.models import Table, TableSession
+from config import broadcast, event_log, payloads, websocket_signals, ws_codec
+from config.asgi_routing import websocket_urlpatterns
+from config.broadcaster import Broadcaster
+from config.channel_layer import LocalChannelLayer
+from config.ws_auth import TokenAuthMiddleware, staff_token
+from . import archive, idempotency, ingestion, kitchen
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusHistory, Order, OrderIntent,
+    OrderItem, OrderStatusHistory
+)
+from .serializers import OrderCreateSerializer
+
+# Without Redis: channel layer, broadcasts, kitchen queue and event log in process
+LOCAL_BACKENDS = override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BROADCAST_MODE='inline',
+    KITCHEN_QUEUE_BACKEND='local',
+    EVENT_LOG_BACKEND='local',
+    STOCK_RESERVATION_BACKEND='database',
+    SECURE_SSL_REDIRECT=False,
+)
+
+
+class OrderTestCase(TestCase):
+    """Restaurant (tax 10%, service 5%) with one open table and three items."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='owner', role=User.Role.OWNER)
+        cls.restaurant = Restaurant.objects.create(
+            name='Test', slug='test', owner=cls.owner, phone='0', address='-', city='-',
+            tax_rate=Decimal('10'), service_charge=Decimal('5')
+        )
+        cls.waiter = User.objects.create(
+            username='waiter', role=User.Role.WAITER, restaurant=cls.restaurant
+        )
+        # Готовый qr_code: QR-картинка не генерируется
+        cls.table = Table.objects.create(restaurant=cls.restaurant, number='1', qr_code='qr.png')
+        cls.session = TableSession.objects.create(table=cls.table)
+        category = MenuCategory.objects.create(restaurant=cls.restaurant, name='Main')
+        cls.items = [
+            MenuItem.objects.create(
+                category=category, name=f'Item {i}', price=Decimal('100.00'), stock_quantity=5
+            )
+            for i in range(3)
+        ]
+
+    def create_order(self, quantity=1):
+        order = Order.objects.create(table_session=self.session)
+        OrderItem.objects.create(order=order, menu_item=self.items[0], quantity=quantity)
+        return order
+
+
+@LOCAL_BACKENDS
+class OrderIntakeTests(OrderTestCase):
+
+    def post_order(self, *quantities):
+        return APIClient().post('/api/orders/', {
+            'table_session': self.session.pk,
+            'items_data': [
+                {'menu_item': item.pk, 'quantity': quantity}
+                for item, quantity in zip(self.items, quantities)
+            ],
+        }, format='json')
+
+    def test_order_announced_once_with_items(self):
+        announced = []
+
+        def record(instance, created=False):
+            announced.append((instance.pk, created, instance.items.count()))
+
+        with mock.patch('config.websocket_signals.broadcast_order_update', record), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.post_order(2, 1)
+            # До коммита о заказе никто не объявил
+            self.assertEqual(announced, [])
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(announced, [(response.data['id'], True, 2)])
+
+    @override_settings(STOCK_RESERVATION_BACKEND='local')
+    def test_failed_write_returns_counter_reservation(self):
+        stock._backend = None
+        self.addCleanup(setattr, stock, '_backend', None)
+        with mock.patch('apps.orders.models.OrderItem.objects.bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post_order(4)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(stock.reserve_stock({self.items[0].pk: 5}))
+
+
+@LOCAL_BACKENDS
+class OrderTransitionTests(OrderTestCase):
+
+    def test_illegal_transition_is_rejected(self):
+        order = self.create_order()
+        self.assertFalse(order.mark_as_delivered())
+        self.assertFalse(order.mark_as_preparing())
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.PENDING)
+        self.assertFalse(OrderStatusHistory.objects.filter(order=order).exists())
+
+    def test_transitions_write_history(self):
+        order = self.create_order()
+        self.assertTrue(order.confirm_order(self.waiter))
+        self.assertTrue(order.mark_as_preparing(self.waiter))
+        self.assertTrue(order.mark_as_ready(self.waiter))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.READY)
+        self.assertEqual(order.waiter, self.waiter)
+        self.assertIsNotNone(order.confirmed_at)
+        self.assertIsNotNone(order.ready_at)
+        self.assertEqual(
+            list(order.status_history.order_by('pk').values_list('status', 'changed_by')),
+            [('confirmed', self.waiter.pk), ('preparing', self.waiter.pk), ('ready', self.waiter.pk)]
+        )
+
+    def test_stale_copies_have_one_winner(self):
+        # Две копии заказа, прочитанные до перехода: решает условный UPDATE в базе
+        order = self.create_order()
+        first = Order.objects.get(pk=order.pk)
+        second = Order.objects.get(pk=order.pk)
+        self.assertTrue(first.confirm_order(self.waiter))
+        self.assertFalse(second.confirm_order(self.owner))
+        self.assertEqual(Order.objects.get(pk=order.pk).waiter, self.waiter)
+        self.assertEqual(OrderStatusHistory.objects.filter(order=order).count(), 1)
+
+    def test_queryset_transition_skips_illegal(self):
+        orders = [self.create_order() for _ in range(3)]
+        orders[0].confirm_order(self.waiter)
+        confirmed = Order.objects.filter(pk__in=[o.pk for o in orders]).transition('confirm')
+        self.assertEqual(sorted(confirmed), [orders[1].pk, orders[2].pk])
+        self.assertEqual(OrderStatusHistory.objects.filter(status='confirmed').count(), 3)
+
+    def test_transition_reports_only_orders_it_moved(self):
+        # Заказ уже в целевом статусе с тем же updated_at не считается переведенным
+        now = timezone.now()
+        done, pending = self.create_order(), self.create_order()
+        Order.objects.filter(pk=done.pk).update(status=Order.Status.CONFIRMED, updated_at=now)
+        moved = Order.apply_transition(
+            Order.TRANSITIONS['confirm'], [done.pk, pending.pk], now=now
+        )
+        self.assertEqual(moved, [pending.pk])
+        self.assertFalse(OrderStatusHistory.objects.filter(order=done).exists())
+
+    def test_cancel_releases_stock_once(self):
+        response = APIClient().post('/api/orders/', {
+            'table_session': self.session.pk,
+            'items_data': [{'menu_item': self.items[0].pk, 'quantity': 4}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].stock_quantity, 1)
+
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertTrue(order.cancel_order('no'))
+        self.assertFalse(order.cancel_order('no'))
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].stock_quantity, 5)
+
+
+@LOCAL_BACKENDS
+class KitchenQueueTests(OrderTestCase):
+
+    def setUp(self):
+        kitchen._queue = None
+        self.addCleanup(setattr, kitchen, '_queue', None)
+        self.deltas = []
+        send = broadcast.send
+
+        def record(group, message, **kwargs):
+            if group == kitchen.kitchen_group_name(self.restaurant.pk):
+                self.deltas.append((message['seq'], message['action'], message['order']['order_id']))
+            else:
+                send(group, message, **kwargs)
+
+        patcher = mock.patch.object(broadcast, 'send', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = kitchen.get_kitchen_queue()
+
+    def place_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/orders/', {
+                'table_session': self.session.pk,
+                'items_data': [{'menu_item': self.items[0].pk, 'quantity': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Order.objects.get(pk=response.data['id'])
+
+    def transition(self, order, method):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(getattr(order, method)(self.waiter))
+
+    def test_deltas_follow_transitions(self):
+        order = self.place_order()
+        # Новый заказ кухне еще не виден
+        self.assertEqual(self.deltas, [])
+        self.transition(order, 'confirm_order')
+        self.transition(order, 'mark_as_preparing')
+        self.transition(order, 'mark_as_ready')
+        self.assertEqual(self.deltas, [
+            (1, 'added', order.pk), (2, 'updated', order.pk), (3, 'bumped', order.pk)
+        ])
+        self.assertEqual(self.queue.snapshot(self.restaurant.pk), {'seq': 3, 'orders': []})
+
+    @override_settings(KITCHEN_QUEUE_RESYNC_INTERVAL=0)
+    def test_resync_drops_orders_with_lost_events(self):
+        kept, lost = self.place_order(), self.place_order()
+        self.transition(kept, 'confirm_order')
+        self.transition(lost, 'confirm_order')
+        snapshot = self.queue.snapshot(self.restaurant.pk)
+        self.assertEqual([entry['order_id'] for entry in snapshot['orders']], [kept.pk, lost.pk])
+
+        # Переход записан мимо событий
+        Order.objects.filter(pk=lost.pk).update(status=Order.Status.PAID)
+        snapshot = self.queue.snapshot(self.restaurant.pk)
+        self.assertEqual([entry['order_id'] for entry in snapshot['orders']], [kept.pk])
+        self.assertEqual(self.deltas[-1], (snapshot['seq'], 'bumped', lost.pk))
+        self.assertIsNone(self.queue.store.get(lost.pk))
+
+
+@LOCAL_BACKENDS
+class KeysetPaginationTests(OrderTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        for i in range(7):
+            order = Order.objects.create(table_session=cls.session)
+            # Пары заказов с одинаковым created_at: порядок решает id
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=i // 2))
+
+    def walk(self, url):
+        client, pages = APIClient(), []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertNotIn('count', response.data)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def ids(self, page):
+        return [order['id'] for order in page['results']]
+
+    def test_pages_cover_every_order_once(self):
+        expected = list(Order.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        pages = self.walk('/api/orders/?page_size=3')
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], expected)
+
+        ascending = self.walk('/api/orders/?page_size=3&ordering=created_at')
+        self.assertEqual([pk for page in ascending for pk in self.ids(page)], expected[::-1])
+
+    def test_previous_link_returns_same_page(self):
+        first, second, third = self.walk('/api/orders/?page_size=3')
+        previous = APIClient().get(third['previous']).data
+        self.assertEqual(self.ids(previous), self.ids(second))
+        self.assertEqual(self.ids(APIClient().get(previous['previous']).data), self.ids(first))
+
+    def test_count_on_request_and_bad_cursor(self):
+        self.assertEqual(APIClient().get('/api/orders/?include_count=true').data['count'], 7)
+        self.assertEqual(APIClient().get('/api/orders/?cursor=garbage').status_code, 404)
+
+
+@LOCAL_BACKENDS
+class OrderArchiveTests(OrderTestCase):
+
+    def settled_order(self):
+        order = self.create_order(quantity=2)
+        order.confirm_order(self.waiter)
+        order.mark_as_paid(self.waiter)
+        Payment.objects.create(order=order, amount=Decimal('230.00'), status=Payment.Status.COMPLETED)
+        return order
+
+    def test_settled_orders_move_with_their_rows(self):
+        old = timezone.now() - timedelta(days=200)
+        settled = [self.settled_order() for _ in range(3)]
+        live = self.create_order()
+        recent = self.settled_order()
+        Order.objects.filter(pk__in=[o.pk for o in settled] + [live.pk]).update(updated_at=old)
+
+        self.assertEqual(archive.archive_orders(batch_size=2), {'orders': 3, 'payments': 3})
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {live.pk, recent.pk})
+        archived = ArchivedOrder.objects.get(pk=settled[0].pk)
+        self.assertEqual(archived.restaurant, self.restaurant)
+        self.assertEqual(archived.table_number, '1')
+        self.assertEqual(archived.total_amount, Decimal('230.00'))
+        self.assertEqual(ArchivedOrderItem.objects.get(order=archived).menu_item_name, 'Item 0')
+        self.assertEqual(ArchivedOrderStatusHistory.objects.filter(order=archived).count(), 2)
+        # Каскадное удаление забрало позиции и историю из горячих таблиц
+        self.assertFalse(OrderItem.objects.filter(order_id=settled[0].pk).exists())
+        self.assertFalse(OrderStatusHistory.objects.filter(order_id=settled[0].pk).exists())
+        self.assertEqual(ArchivedPayment.objects.count(), 3)
+        self.assertEqual(Payment.objects.count(), 1)
+
+        # Повторный запуск ничего не переносит
+        self.assertEqual(archive.archive_orders(), {'orders': 0, 'payments': 0})
+
+
+@LOCAL_BACKENDS
+class OrderPayloadTests(OrderTestCase):
+
+    def setUp(self):
+        self.sent = []
+        patcher = mock.patch.object(
+            broadcast, 'send', lambda group, message, **kwargs: self.sent.append((group, message))
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_new_order_reads_table_once(self):
+        Order.objects.create(table_session=self.session, waiter=self.waiter)
+        order = Order.objects.get()
+        self.sent.clear()
+        with self.assertNumQueries(1):
+            websocket_signals.broadcast_order_update(order, created=True)
+        self.assertEqual(
+            [group for group, _ in self.sent],
+            [f'order_{order.pk}', f'restaurant_{self.restaurant.pk}', f'waiter_{self.waiter.pk}']
+        )
+
+    def test_status_update_makes_no_queries(self):
+        order = self.create_order()
+        order = Order.objects.get(pk=order.pk)
+        self.sent.clear()
+        with self.assertNumQueries(0):
+            websocket_signals.broadcast_order_update(order)
+        group, message = self.sent[0]
+        self.assertEqual(group, f'order_{order.pk}')
+        self.assertEqual(message['data']['v'], payloads.PAYLOAD_VERSION)
+        self.assertEqual(message['data']['total_amount'], str(order.total_amount))
+
+
+@LOCAL_BACKENDS
+class OrderTotalsTests(OrderTestCase):
+
+    def test_totals_follow_items(self):
+        order = Order.objects.create(table_session=self.session)
+        line = OrderItem.objects.create(order=order, menu_item=self.items[0], quantity=2)
+        OrderItem.objects.create(order=order, menu_item=self.items[1], quantity=1)
+        order.refresh_from_db()
+        self.assertEqual(order.subtotal, Decimal('300.00'))
+        self.assertEqual(order.tax_amount, Decimal('30.00'))
+        self.assertEqual(order.service_charge_amount, Decimal('15.00'))
+        self.assertEqual(order.total_amount, Decimal('345.00'))
+        self.assertEqual(order.items_count, 3)
+
+        line.quantity = 1
+        line.save()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('230.00'))
+
+        line.delete()
+        order.refresh_from_db()
+        self.assertEqual(order.items_count, 1)
+        self.assertEqual(order.total_amount, Decimal('115.00'))
+
+
+@LOCAL_BACKENDS
+@override_settings(IDEMPOTENCY_BACKEND='database')
+class IdempotencyTests(OrderTestCase):
+
+    def setUp(self):
+        idempotency._store = None
+        self.addCleanup(setattr, idempotency, '_store', None)
+        self.client = APIClient()
+        self.body = {
+            'table_session': self.session.pk,
+            'items_data': [{'menu_item': self.items[0].pk, 'quantity': 2}],
+        }
+
+    def post(self, body, key):
+        return self.client.post('/api/orders/', body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        first = self.post(self.body, 'key-1')
+        self.assertEqual(first.status_code, 201, first.content)
+        second = self.post(self.body, 'key-1')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].stock_quantity, 3)
+
+    def test_key_reused_with_other_body(self):
+        self.assertEqual(self.post(self.body, 'key-2').status_code, 201)
+        response = self.post(dict(self.body, notes='other'), 'key-2')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_while_first_is_running(self):
+        retries = []
+        original_save = OrderCreateSerializer.save
+
+        def save(serializer, **kwargs):
+            # Повтор приходит, пока первый запрос еще создает заказ
+            retries.append(self.post(self.body, 'key-3'))
+            return original_save(serializer, **kwargs)
+
+        with mock.patch.object(OrderCreateSerializer, 'save', save):
+            first = self.post(self.body, 'key-3')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(retries[0]['Retry-After'], '1')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_request_releases_key(self):
+        bad = dict(self.body, items_data=[{'menu_item': 0, 'quantity': 1}])
+        self.assertEqual(self.post(bad, 'key-4').status_code, 400)
+        self.assertEqual(self.post(self.body, 'key-4').status_code, 201)
+
+
+@LOCAL_BACKENDS
+@override_settings(ORDER_INGESTION_MODE='queue', ORDER_INGEST_QUEUE_BACKEND='database')
+class OrderIngestionTests(OrderTestCase):
+
+    def setUp(self):
+        # Кэш сессий и меню переживает откат тестовой транзакции
+        cache.clear()
+        ingestion._queue = None
+        self.addCleanup(setattr, ingestion, '_queue', None)
+
+    def enqueue(self, quantity=1):
+        response = APIClient().post('/api/orders/', {
+            'table_session': self.session.pk,
+            'items_data': [{'menu_item': self.items[0].pk, 'quantity': quantity}],
+        }, format='json')
+        self.assertEqual(response.status_code, 202, response.content)
+        return OrderIntent.objects.get(provisional_id=response.data['provisional_id']).payload
+
+    def test_persist_intents_skips_written_orders(self):
+        payload = self.enqueue(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ingestion.persist_intents([payload]), 1)
+        # Пачка записана, но не подтверждена в очереди: повтор ничего не пишет
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ingestion.persist_intents([payload]), 0)
+        order = Order.objects.get()
+        self.assertEqual(str(order.ingest_id), payload['provisional_id'])
+        self.assertEqual(order.total_amount, Decimal('230.00'))
+        self.assertEqual(order.items.count(), 1)
+
+    def test_drain_writes_and_empties_queue(self):
+        self.enqueue()
+        self.enqueue()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ingestion.drain_queue(), 2)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(ingestion.get_order_queue().pending(), 0)
+
+    def test_closed_session_takes_no_stock(self):
+        self.enqueue()
+        with self.captureOnCommitCallbacks(execute=True):
+            occupancy.close_session(self.session)
+        response = APIClient().post('/api/orders/', {
+            'table_session': self.session.pk,
+            'items_data': [{'menu_item': self.items[0].pk, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('table_session', response.data)
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].stock_quantity, 4)
+
+        # Заказ, поставленный до закрытия, отклоняется и возвращает остатки
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ingestion.drain_queue(), 0)
+        self.assertFalse(Order.objects.exists())
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].stock_quantity, 5)
+
+    def test_failing_intent_does_not_block_queue(self):
+        good = self.enqueue()
+        poison = self.enqueue(3)
+        OrderIntent.objects.filter(provisional_id=poison['provisional_id']).update(
+            payload=dict(poison, totals={'subtotal': 'not a number'})
+        )
+        with self.assertLogs('apps.orders.ingestion', 'WARNING') as logs, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ingestion.drain_queue(), 1)
+        self.assertIn(poison['provisional_id'], logs.output[-1])
+        self.assertEqual(str(Order.objects.get().ingest_id), good['provisional_id'])
+        self.assertFalse(OrderIntent.objects.exists())
+        # Отклоненный заказ вернул свои остатки
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].stock_quantity, 4)
+
+
+class RecordingBroadcaster:
+    """Stands in for config.broadcaster: keeps submitted messages per group."""
+
+    def __init__(self):
+        self.sent = []
+
+    def submit(self, group, message, coalesce_key=None):
+        self.sent.append((group, message))
+
+    def events(self, group):
+        events = []
+        for sent_group, message in self.sent:
+            if sent_group == group:
+                events.extend(message['events'] if message['type'] == broadcast.BATCH_TYPE else [message])
+        return [(event['type'], event.get('data')) for event in events]
+
+
+@LOCAL_BACKENDS
+class TransactionBroadcastTests(TestCase):
+
+    def setUp(self):
+        self.broadcaster = RecordingBroadcaster()
+        patcher = mock.patch('config.broadcast.get_broadcaster', return_value=self.broadcaster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rolled_back_savepoint_drops_its_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                broadcast.send('group', {'type': 'kept', 'data': 1}, key=1)
+                try:
+                    with transaction.atomic():
+                        broadcast.send('group', {'type': 'lost', 'data': 2}, key=2)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                broadcast.send('group', {'type': 'kept', 'data': 3}, key=3)
+                self.assertEqual(self.broadcaster.sent, [])
+        self.assertEqual(self.broadcaster.events('group'), [('kept', 1), ('kept', 3)])
+
+    def test_latest_event_wins_across_savepoints(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                broadcast.send('group', {'type': 'order_update', 'data': 'placed'}, key=1)
+                with transaction.atomic():
+                    broadcast.send('group', {'type': 'order_update', 'data': 'confirmed'}, key=1)
+                broadcast.send('group', {'type': 'order_update', 'data': 'ready'}, key=1)
+        self.assertEqual(self.broadcaster.events('group'), [('order_update', 'ready')])
+
+
+@LOCAL_BACKENDS
+class BroadcasterQueueTests(TestCase):
+
+    def setUp(self):
+        self.broadcaster = Broadcaster()
+        # Без фонового отправителя: сообщения остаются в очереди
+        for target, value in (
+            (self.broadcaster, {'_wake': lambda: None}),
+            (broadcast, {'get_broadcaster': lambda: self.broadcaster}),
+        ):
+            patcher = mock.patch.multiple(target, **value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        event_log._log = None
+        self.addCleanup(setattr, event_log, '_log', None)
+
+    def send(self, *args, **kwargs):
+        # Каждое событие - отдельная зафиксированная транзакция
+        with self.captureOnCommitCallbacks(execute=True):
+            broadcast.send(*args, **kwargs)
+
+    def queued(self):
+        return [(group, message['data']) for group, message, _ in self.broadcaster._items.values()]
+
+    def test_replacement_moves_to_tail(self):
+        self.send('order_1', {'type': 'order_update', 'data': 'placed'}, key=1)
+        self.send('order_2', {'type': 'order_update', 'data': 'placed'}, key=2)
+        self.send('order_1', {'type': 'order_update', 'data': 'confirmed'}, key=1)
+        self.assertEqual(self.queued(), [('order_2', 'placed'), ('order_1', 'confirmed')])
+        self.assertEqual(self.broadcaster.coalesced, 1)
+
+    def test_numbered_events_are_not_coalesced(self):
+        for data in ('placed', 'confirmed'):
+            self.send(
+                'restaurant_1', {'type': 'order_update', 'data': data}, key=1, restaurant_id=1
+            )
+        self.assertEqual(self.queued(), [('restaurant_1', 'placed'), ('restaurant_1', 'confirmed')])
+        seqs = [message['seq'] for _, message, _ in self.broadcaster._items.values()]
+        self.assertEqual(seqs, [seqs[0], seqs[0] + 1])
+        self.assertEqual(self.broadcaster.coalesced, 0)
+
+
+@LOCAL_BACKENDS
+class OrderSocketTests(OrderTestCase):
+
+    def setUp(self):
+        self.app = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        self.order = self.create_order()
+        self.path = f'/ws/orders/{self.order.pk}/?token={staff_token(self.waiter)}'
+
+    async def connect(self, *subprotocols):
+        communicator = WebsocketCommunicator(self.app, self.path, subprotocols=list(subprotocols))
+        self.assertTrue((await communicator.connect())[0])
+        # Кадр codec (только msgpack) и текущий статус
+        for _ in range(len(subprotocols) + 1):
+            await communicator.receive_from()
+        return communicator
+
+    async def test_msgpack_subprotocol(self):
+        communicator = WebsocketCommunicator(self.app, self.path, subprotocols=['msgpack'])
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'msgpack')
+        codec = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(codec['type'], 'codec')
+
+        # Компактная форма: коды статусов и эпоха в мс, без отображаемых полей
+        status = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(status['type'], 'order_status')
+        self.assertEqual(status['data']['status'], codec['enums']['status'].index('pending'))
+        self.assertIsInstance(status['data']['created_at'], int)
+        self.assertNotIn('status_display', status['data'])
+
+        await communicator.send_to(bytes_data=msgpack.packb({'action': 'get_status'}))
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from())['type'], 'order_status')
+        await communicator.send_to(bytes_data=b'\xc1')
+        self.assertIn('error', msgpack.unpackb(await communicator.receive_from()))
+        await communicator.disconnect()
+
+    async def test_json_by_default(self):
+        communicator = WebsocketCommunicator(self.app, self.path)
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertIsNone(subprotocol)
+        status = json.loads(await communicator.receive_from())
+        self.assertEqual(status['data']['status'], 'pending')
+        self.assertIn('status_display', status['data'])
+        await communicator.disconnect()
+
+    async def test_group_event_is_encoded_once(self):
+        sockets = [await self.connect(), await self.connect(), await self.connect('msgpack')]
+        recorder = RecordingBroadcaster()
+        with mock.patch('config.broadcast.get_broadcaster', return_value=recorder), \
+                mock.patch.object(ws_codec, 'dumps_json', wraps=ws_codec.dumps_json) as dumps_json, \
+                mock.patch.object(ws_codec, 'dumps_msgpack', wraps=ws_codec.dumps_msgpack) as dumps_msgpack:
+            # Путь broadcast.send вне транзакции
+            buffer = broadcast.EventBuffer()
+            buffer.add(f'order_{self.order.pk}', {'type': 'order_update', 'data': {'status': 'ready'}})
+            broadcast.flush(buffer)
+            [(group, message)] = recorder.sent
+            await get_channel_layer().group_send(group, message)
+            frames = [await socket.receive_from() for socket in sockets]
+        # Кадры кодируются при отправке в группу, а не для каждого подключения
+        self.assertEqual((dumps_json.call_count, dumps_msgpack.call_count), (1, 1))
+
+        expected = {'type': 'order_update', 'data': {'status': 'ready'}}
+        self.assertEqual(json.loads(frames[0]), expected)
+        self.assertEqual(frames[1], frames[0])
+        self.assertEqual(frames[2], ws_codec.dumps_msgpack(expected))
+        for socket in sockets:
+            await socket.disconnect()
+
+
+class LocalChannelLayerTests(TestCase):
+
+    async def test_group_send_shares_message_and_respects_capacity(self):
+        layer = LocalChannelLayer(capacity=2)
+        first, second = await layer.new_channel(), await layer.new_channel()
+        for channel in (first, second):
+            await layer.group_add('group', channel)
+        message = {'type': 'update'}
+        await layer.group_send('group', message)
+        # Один объект на всех участников группы, без копирования
+        self.assertIs(await layer.receive(first), message)
+        self.assertIs(await layer.receive(second), message)
+
+        await layer.send(first, {'type': 'one'})
+        await layer.send(first, {'type': 'two'})
+        with self.assertRaises(ChannelFull):
+            await layer.send(first, {'type': 'three'})
+        # Переполненный участник пропускает событие, остальные его получают;
+        # full считает оба отказа
+        await layer.group_send('group', {'type': 'update'})
+        self.assertEqual(layer.full, 2)
+        self.assertEqual((await layer.receive(second))['type'], 'update')
+        self.assertEqual((await layer.receive(first))['type'], 'one')
+
+    async def test_expired_messages_are_dropped(self):
+        layer = LocalChannelLayer(expiry=0)
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'old'})
+        time.sleep(0.01)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.05)
+        self.assertEqual(layer.expired, 1)
+
+    async def test_discarded_channel_gets_nothing(self):
+        layer = LocalChannelLayer()
+        channel = await layer.new_channel()
+        await layer.group_add('group', channel)
+        await layer.group_discard('group', channel)
+        await layer.group_send('group', {'type': 'update'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.05)
+        self.assertEqual(layer.stats()['groups'], 0)
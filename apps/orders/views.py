@@ -1,16 +1,21 @@
 """
 Views and ViewSets for orders app.
 """
+import uuid
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
+from config.pagination import KeysetPagination
 from .models import Order, OrderItem
+from . import ingestion
+from .idempotency import IdempotentCreateMixin, idempotent_response
 from .serializers import (
     OrderListSerializer, OrderDetailSerializer,
-    OrderCreateSerializer, OrderUpdateSerializer,
+    OrderCreateSerializer, OrderIntentSerializer, OrderUpdateSerializer,
     OrderItemSerializer
 )
 
@@ -19,19 +24,25 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     """
     ViewSet for order items.
     """
-    queryset = OrderItem.objects.all()
+    queryset = OrderItem.objects.select_related('menu_item')
     serializer_class = OrderItemSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['order', 'menu_item']
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     ViewSet for orders.
+    Order creation honours the Idempotency-Key header; with
+    ORDER_INGESTION_MODE = 'queue' it only queues the order and answers 202.
     """
     queryset = Order.objects.all()
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['table_session', 'status', 'payment_method']
     ordering_fields = ['created_at', 'total_amount']
@@ -43,13 +54,19 @@ class OrderViewSet(viewsets.ModelViewSet):
         elif self.action == 'list':
             return OrderListSerializer
         elif self.action == 'create':
+            if ingestion.ingestion_enabled():
+                return OrderIntentSerializer
             return OrderCreateSerializer
         else:
             return OrderUpdateSerializer
     
     def get_queryset(self):
         user = self.request.user
-        queryset = Order.objects.all()
+        queryset = Order.objects.select_related(
+            'table_session__table__restaurant', 'guest_session', 'waiter'
+        )
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('items__menu_item')
         
         restaurant_slug = self.request.query_params.get('restaurant_slug')
         if restaurant_slug:
@@ -57,84 +74,82 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         return queryset
     
-    @action(detail=True, methods=['post'])
-    def confirm(self, request, pk=None):
-        """Confirm order by waiter"""
-        order = self.get_object()
-        
-        if order.status != Order.Status.PENDING:
+    def create(self, request, *args, **kwargs):
+        if not ingestion.ingestion_enabled():
+            return super().create(request, *args, **kwargs)
+        return idempotent_response(
+            request, self.idempotency_scope or self.basename, lambda: self._enqueue(request)
+        )
+    
+    def _enqueue(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=False, methods=['get'], url_path=r'provisional/(?P<provisional_id>[^/.]+)')
+    def provisional(self, request, provisional_id=None):
+        """Get the order created from a queued order, 202 while it is still queued"""
+        try:
+            provisional_id = uuid.UUID(provisional_id)
+        except ValueError:
+            return Response({'error': 'Invalid provisional id'}, status=status.HTTP_400_BAD_REQUEST)
+        order = self.get_queryset().prefetch_related('items__menu_item').filter(
+            ingest_id=provisional_id
+        ).first()
+        if order is None:
             return Response(
-                {'error': 'Заказ уже был подтвержден'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'provisional_id': str(provisional_id), 'status': 'queued'},
+                status=status.HTTP_202_ACCEPTED
             )
-        
-        order.confirm_order(request.user)
+        return Response(OrderDetailSerializer(order).data)
+    
+    def _transition_response(self, order, transitioned, error):
+        if not transitioned:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
         serializer = OrderDetailSerializer(order)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        """Confirm order by waiter"""
+        order = self.get_object()
+        return self._transition_response(
+            order, order.confirm_order(request.user), 'Заказ уже был подтвержден'
+        )
+    
     @action(detail=True, methods=['post'])
     def mark_ready(self, request, pk=None):
         """Mark order as ready"""
         order = self.get_object()
-        
-        if order.status not in [Order.Status.PENDING, Order.Status.CONFIRMED, Order.Status.PREPARING]:
-            return Response(
-                {'error': 'Не может быть отмечено как готово'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        from django.utils import timezone
-        order.status = Order.Status.READY
-        order.ready_at = timezone.now()
-        order.save()
-        
-        serializer = OrderDetailSerializer(order)
-        return Response(serializer.data)
+        return self._transition_response(
+            order, order.mark_as_ready(request.user), 'Не может быть отмечено как готово'
+        )
     
     @action(detail=True, methods=['post'])
     def mark_delivered(self, request, pk=None):
         """Mark order as delivered"""
         order = self.get_object()
-        
-        from django.utils import timezone
-        order.status = Order.Status.DELIVERED
-        order.delivered_at = timezone.now()
-        order.save()
-        
-        serializer = OrderDetailSerializer(order)
-        return Response(serializer.data)
+        return self._transition_response(
+            order, order.mark_as_delivered(request.user), 'Не может быть отмечено как доставлено'
+        )
     
     @action(detail=True, methods=['post'])
     def mark_paid(self, request, pk=None):
         """Mark order as paid"""
         order = self.get_object()
-        
-        from django.utils import timezone
-        order.status = Order.Status.PAID
-        order.paid_at = timezone.now()
-        order.save()
-        
-        serializer = OrderDetailSerializer(order)
-        return Response(serializer.data)
+        return self._transition_response(
+            order, order.mark_as_paid(request.user), 'Не может быть отмечено как оплачено'
+        )
     
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel order"""
         order = self.get_object()
-        
-        if order.status in [Order.Status.PAID, Order.Status.DELIVERED]:
-            return Response(
-                {'error': 'Не может быть отменен'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        from django.utils import timezone
-        order.status = Order.Status.CANCELLED
-        order.cancelled_at = timezone.now()
-        order.save()
-        
-        serializer = OrderDetailSerializer(order)
-        return Response(serializer.data)
+        return self._transition_response(
+            order,
+            order.cancel_order(request.data.get('reason', ''), user=request.user),
+            'Не может быть отменен'
+        )
     
     @action(detail=False, methods=['get'])
     def active(self, request):
@@ -3,7 +3,7 @@ Admin configuration for payments app.
 """
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import Payment
+from .models import Payment, ArchivedPayment
 
 
 @admin.register(Payment)
@@ -126,3 +126,31 @@ class PaymentAdmin(admin.ModelAdmin):
                 table_session__table__restaurant=request.user.restaurant
             )
         return qs.none()
+
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(admin.ModelAdmin):
+    """Read-only admin interface for archived payments."""
+    
+    list_display = ['payment_id', 'restaurant', 'order_id', 'amount', 'payment_type', 'status', 'created_at']
+    list_filter = ['status', 'payment_type', 'restaurant', 'created_at']
+    search_fields = ['payment_id', 'order_id', 'payer_name', 'payer_phone', 'payer_email']
+    ordering = ['-created_at']
+    list_select_related = ('restaurant',)
+    
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        if request.user.is_owner:
+            return qs.filter(restaurant=request.user.restaurant)
+        return qs.none()
+    
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
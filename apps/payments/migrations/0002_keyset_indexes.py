@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0003_keyset_indexes"),
+        ("payments", "0001_initial"),
+        ("tables", "0002_keyset_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="payment_created_id_idx"
+            ),
+        ),
+    ]
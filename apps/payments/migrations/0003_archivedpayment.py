@@ -0,0 +1,168 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0002_keyset_indexes"),
+        ("restaurants", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedPayment",
+            fields=[
+                (
+                    "id",
+                    models.BigIntegerField(
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID платежа (внутренний)",
+                    ),
+                ),
+                (
+                    "order_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="ID заказа"
+                    ),
+                ),
+                (
+                    "table_session_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="ID сессии столика"
+                    ),
+                ),
+                (
+                    "payment_id",
+                    models.CharField(
+                        max_length=100, unique=True, verbose_name="ID платежа"
+                    ),
+                ),
+                (
+                    "payment_type",
+                    models.CharField(
+                        choices=[
+                            ("cash", "Наличные"),
+                            ("qr", "QR код"),
+                            ("card", "Карта"),
+                            ("online", "Онлайн"),
+                        ],
+                        max_length=20,
+                        verbose_name="Тип оплаты",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Ожидает оплаты"),
+                            ("processing", "Обрабатывается"),
+                            ("completed", "Завершен"),
+                            ("failed", "Ошибка"),
+                            ("cancelled", "Отменен"),
+                            ("refunded", "Возвращен"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Сумма"
+                    ),
+                ),
+                ("currency", models.CharField(max_length=10, verbose_name="Валюта")),
+                (
+                    "payer_name",
+                    models.CharField(
+                        blank=True, max_length=200, verbose_name="Имя плательщика"
+                    ),
+                ),
+                (
+                    "payer_phone",
+                    models.CharField(
+                        blank=True, max_length=20, verbose_name="Телефон плательщика"
+                    ),
+                ),
+                (
+                    "payer_email",
+                    models.EmailField(
+                        blank=True, max_length=254, verbose_name="Email плательщика"
+                    ),
+                ),
+                (
+                    "processed_by_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="ID обработавшего"
+                    ),
+                ),
+                (
+                    "transaction_id",
+                    models.CharField(
+                        blank=True, max_length=200, verbose_name="ID транзакции"
+                    ),
+                ),
+                (
+                    "payment_data",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Данные платежа"
+                    ),
+                ),
+                (
+                    "refund_amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Сумма возврата"
+                    ),
+                ),
+                (
+                    "refund_reason",
+                    models.TextField(blank=True, verbose_name="Причина возврата"),
+                ),
+                (
+                    "refunded_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата возврата"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Дата создания")),
+                (
+                    "completed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Дата завершения"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(verbose_name="Дата обновления")),
+                ("notes", models.TextField(blank=True, verbose_name="Примечания")),
+                (
+                    "archived_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата архивации"
+                    ),
+                ),
+                (
+                    "restaurant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_payments",
+                        to="restaurants.restaurant",
+                        verbose_name="Ресторан",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивный платеж",
+                "verbose_name_plural": "Архивные платежи",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["restaurant", "-created_at"],
+                        name="archpayment_restaurant_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,7 +1,7 @@
 """
 Payment models.
 """
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
 import uuid
@@ -171,6 +171,9 @@ class Payment(models.Model):
         verbose_name = _('Платеж')
         verbose_name_plural = _('Платежи')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='payment_created_id_idx'),
+        ]
     
     def __str__(self):
         order_info = f"Заказ #{self.order.pk}" if self.order else f"Столик {self.table_session.table.number}"
@@ -192,18 +195,29 @@ class Payment(models.Model):
         return None
     
     def complete_payment(self, user=None):
-        """Завершить платеж"""
+        """
+        Завершить платеж и отметить заказ оплаченным в одной транзакции.
+        
+        Заказ, уже оплаченный другим платежом, остается оплаченным. Если
+        заказ нельзя отметить оплаченным (отменен), ничего не сохраняется
+        и возвращается False.
+        """
         from django.utils import timezone
         
-        self.status = self.Status.COMPLETED
-        self.completed_at = timezone.now()
-        if user:
-            self.processed_by = user
-        self.save()
+        previous = (self.status, self.completed_at, self.processed_by_id)
+        with transaction.atomic():
+            self.status = self.Status.COMPLETED
+            self.completed_at = timezone.now()
+            if user:
+                self.processed_by = user
+            self.save()
+            
+            if self.order is None or self.order.mark_as_paid(user):
+                return True
+            transaction.set_rollback(True)
         
-        # Обновить статус заказа
-        if self.order:
-            self.order.mark_as_paid()
+        self.status, self.completed_at, self.processed_by_id = previous
+        return False
     
     def fail_payment(self, reason=''):
         """Отметить платеж как неудачный"""
@@ -226,6 +240,65 @@ class Payment(models.Model):
         self.save()
 
 
+class ArchivedPayment(models.Model):
+    """
+    Архивная копия завершенного платежа.
+
+    Платежи переносятся сюда вместе с архивируемыми заказами
+    (см. apps.orders.archive). Первичный ключ совпадает с id исходного
+    платежа, ссылки на заказ и сессию хранятся как простые id.
+    """
+    
+    id = models.BigIntegerField(primary_key=True, verbose_name=_('ID платежа (внутренний)'))
+    
+    restaurant = models.ForeignKey(
+        'restaurants.Restaurant',
+        on_delete=models.CASCADE,
+        related_name='archived_payments',
+        verbose_name=_('Ресторан')
+    )
+    
+    order_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('ID заказа'))
+    table_session_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('ID сессии столика'))
+    
+    payment_id = models.CharField(max_length=100, unique=True, verbose_name=_('ID платежа'))
+    payment_type = models.CharField(max_length=20, choices=Payment.PaymentType.choices, verbose_name=_('Тип оплаты'))
+    status = models.CharField(max_length=20, choices=Payment.Status.choices, verbose_name=_('Статус'))
+    
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Сумма'))
+    currency = models.CharField(max_length=10, verbose_name=_('Валюта'))
+    
+    payer_name = models.CharField(max_length=200, blank=True, verbose_name=_('Имя плательщика'))
+    payer_phone = models.CharField(max_length=20, blank=True, verbose_name=_('Телефон плательщика'))
+    payer_email = models.EmailField(blank=True, verbose_name=_('Email плательщика'))
+    processed_by_id = models.BigIntegerField(null=True, blank=True, verbose_name=_('ID обработавшего'))
+    
+    transaction_id = models.CharField(max_length=200, blank=True, verbose_name=_('ID транзакции'))
+    payment_data = models.JSONField(default=dict, blank=True, verbose_name=_('Данные платежа'))
+    
+    refund_amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_('Сумма возврата'))
+    refund_reason = models.TextField(blank=True, verbose_name=_('Причина возврата'))
+    refunded_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Дата возврата'))
+    
+    created_at = models.DateTimeField(verbose_name=_('Дата создания'))
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Дата завершения'))
+    updated_at = models.DateTimeField(verbose_name=_('Дата обновления'))
+    notes = models.TextField(blank=True, verbose_name=_('Примечания'))
+    
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name=_('Дата архивации'))
+    
+    class Meta:
+        verbose_name = _('Архивный платеж')
+        verbose_name_plural = _('Архивные платежи')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['restaurant', '-created_at'], name='archpayment_restaurant_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Архивный платеж {self.payment_id} ({self.amount} {self.currency})"
+
+
 class QRPaymentCode(models.Model):
     """
     QR коды для оплаты.
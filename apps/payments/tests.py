@@ -0,0 +1,52 @@
+"""
+Tests for payments.
+Run: python manage.py test apps (or pytest)
+"""
+from decimal import Decimal
+
+from rest_framework.test import APIClient
+
+from apps.orders.models import Order, OrderStatusHistory
+from apps.orders.tests import LOCAL_BACKENDS, OrderTestCase
+from .models import Payment
+
+
+@LOCAL_BACKENDS
+class PaymentCompletionTests(OrderTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.waiter)
+
+    def pay(self, order, amount='115.00'):
+        payment = Payment.objects.create(order=order, amount=Decimal(amount))
+        return self.client.post(f'/api/payments/{payment.pk}/confirm/')
+
+    def test_pending_order_can_be_paid(self):
+        order = self.create_order()
+        response = self.pay(order)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['status'], Payment.Status.COMPLETED)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.PAID)
+        self.assertIsNotNone(order.paid_at)
+
+    def test_split_payment_of_paid_order_succeeds(self):
+        order = self.create_order()
+        order.confirm_order(self.waiter)
+        self.assertEqual(self.pay(order, '60.00').status_code, 200)
+        self.assertEqual(self.pay(order, '55.00').status_code, 200)
+        self.assertEqual(
+            Payment.objects.filter(order=order, status=Payment.Status.COMPLETED).count(), 2
+        )
+        # Второй платеж не пишет повторный переход в историю
+        self.assertEqual(
+            OrderStatusHistory.objects.filter(order=order, status=Order.Status.PAID).count(), 1
+        )
+
+    def test_cancelled_order_payment_is_rolled_back(self):
+        order = self.create_order()
+        order.cancel_order('no')
+        response = self.pay(order)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Payment.objects.get(order=order).status, Payment.Status.PENDING)
@@ -7,18 +7,22 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from .models import Payment
+from config.pagination import KeysetPagination
+from apps.orders.idempotency import IdempotentCreateMixin
+from .models import Payment, ArchivedPayment
 from .serializers import (
     PaymentSerializer, PaymentCreateSerializer, PaymentUpdateSerializer
 )
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     ViewSet for payments.
+    Payment creation honours the Idempotency-Key header.
     """
     queryset = Payment.objects.all()
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'payment_type', 'order', 'table_session']
     ordering_fields = ['created_at', 'amount']
@@ -46,6 +50,16 @@ class PaymentViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def get_archive_queryset(self):
+        """Archived payments matching the same restaurant filter."""
+        queryset = ArchivedPayment.objects.all()
+        
+        restaurant_slug = self.request.query_params.get('restaurant_slug')
+        if restaurant_slug:
+            queryset = queryset.filter(restaurant__slug=restaurant_slug)
+        
+        return queryset
+    
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
         """Confirm payment"""
@@ -57,13 +71,12 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        payment.status = Payment.Status.COMPLETED
-        payment.save()
-        
-        # Update order status if exists
-        if payment.order:
-            payment.order.status = 'paid'
-            payment.order.save()
+        # Платеж и статус заказа сохраняются вместе или не сохраняются вовсе
+        if not payment.complete_payment(request.user):
+            return Response(
+                {'error': 'Заказ не может быть отмечен как оплаченный'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         serializer = PaymentSerializer(payment)
         return Response(serializer.data)
@@ -111,33 +124,39 @@ class PaymentViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Get payment statistics"""
+        """Get payment statistics (live and archived payments)"""
         from django.db.models import Sum, Count
         from datetime import timedelta
         from django.utils import timezone
         
-        restaurant_slug = request.query_params.get('restaurant_slug')
+        querysets = (self.get_queryset(), self.get_archive_queryset())
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
         
-        queryset = self.get_queryset()
-        
-        total_revenue = queryset.filter(status=Payment.Status.COMPLETED).aggregate(
-            total=Sum('amount')
-        )['total'] or 0
-        
-        today_revenue = queryset.filter(
-            status=Payment.Status.COMPLETED,
-            created_at__gte=timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        ).aggregate(total=Sum('amount'))['total'] or 0
+        def revenue(**filters):
+            return sum(
+                queryset.filter(status=Payment.Status.COMPLETED, **filters).aggregate(
+                    total=Sum('amount')
+                )['total'] or 0
+                for queryset in querysets
+            )
         
-        payment_methods = queryset.values('payment_type').annotate(
-            count=Count('id'),
-            total=Sum('amount')
-        )
+        payment_methods = {}
+        for queryset in querysets:
+            for row in queryset.order_by().values('payment_type').annotate(
+                count=Count('id'),
+                total=Sum('amount')
+            ):
+                method = payment_methods.setdefault(
+                    row['payment_type'], {'payment_type': row['payment_type'], 'count': 0, 'total': 0}
+                )
+                method['count'] += row['count']
+                method['total'] += row['total'] or 0
         
         return Response({
-            'total_revenue': total_revenue,
-            'today_revenue': today_revenue,
-            'payment_methods': payment_methods,
-            'total_transactions': queryset.count(),
-            'pending_transactions': queryset.filter(status=Payment.Status.PENDING).count()
+            'total_revenue': revenue(),
+            'today_revenue': revenue(created_at__gte=today),
+            'payment_methods': list(payment_methods.values()),
+            'total_transactions': sum(queryset.count() for queryset in querysets),
+            # Archived payments are always settled
+            'pending_transactions': querysets[0].filter(status=Payment.Status.PENDING).count()
         })
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurant",
+            name="cover_image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="Уменьшенные копии обложки",
+            ),
+        ),
+        migrations.AddField(
+            model_name="restaurant",
+            name="logo_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="Уменьшенные копии логотипа",
+            ),
+        ),
+    ]
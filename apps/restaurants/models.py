@@ -50,6 +50,21 @@ class Restaurant(models.Model):
         verbose_name=_('Обложка')
     )
     
+    # Уменьшенные копии изображений (apps.menu.images)
+    logo_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_('Уменьшенные копии логотипа')
+    )
+    
+    cover_image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_('Уменьшенные копии обложки')
+    )
+    
     # Контактная информация
     phone = models.CharField(
         max_length=20,
@@ -3,6 +3,7 @@ Serializers for restaurants app.
 """
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field
+from apps.menu.serializers import ResponsiveImageField
 from .models import Restaurant, RestaurantSettings
 
 
@@ -24,13 +25,14 @@ class RestaurantListSerializer(serializers.ModelSerializer):
     Serializer for listing restaurants with minimal info.
     """
     owner_name = serializers.CharField(source='owner.get_full_name', read_only=True)
+    logo_srcset = ResponsiveImageField(source='logo_variants')
     total_tables = serializers.SerializerMethodField()
     active_tables = serializers.SerializerMethodField()
     
     class Meta:
         model = Restaurant
         fields = (
-            'id', 'name', 'slug', 'owner', 'owner_name', 'logo',
+            'id', 'name', 'slug', 'owner', 'owner_name', 'logo', 'logo_srcset',
             'city', 'phone', 'is_active', 'total_tables', 'active_tables'
         )
         read_only_fields = ('id', 'slug')
@@ -50,6 +52,8 @@ class RestaurantDetailSerializer(serializers.ModelSerializer):
     """
     owner_name = serializers.CharField(source='owner.get_full_name', read_only=True)
     settings = RestaurantSettingsSerializer(read_only=True)
+    logo_srcset = ResponsiveImageField(source='logo_variants')
+    cover_image_srcset = ResponsiveImageField(source='cover_image_variants')
     total_tables = serializers.SerializerMethodField()
     active_tables = serializers.SerializerMethodField()
     is_open_now = serializers.BooleanField(read_only=True)
@@ -58,7 +62,8 @@ class RestaurantDetailSerializer(serializers.ModelSerializer):
         model = Restaurant
         fields = (
             'id', 'name', 'slug', 'owner', 'owner_name', 'description',
-            'logo', 'cover_image', 'phone', 'email', 'website', 'address',
+            'logo', 'logo_srcset', 'cover_image', 'cover_image_srcset',
+            'phone', 'email', 'website', 'address',
             'city', 'country', 'currency', 'language', 'tax_rate',
             'service_charge', 'opening_time', 'closing_time', 'is_active',
             'allow_cash_payment', 'allow_qr_payment', 'require_waiter_confirmation',
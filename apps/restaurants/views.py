@@ -72,7 +72,7 @@ class RestaurantViewSet(viewsets.ModelViewSet):
     def menu_categories(self, request, slug=None):
         """Get restaurant menu categories"""
         restaurant = self.get_object()
-        categories = restaurant.menu_categories.filter(is_active=True)
+        categories = restaurant.menu_categories.filter(is_active=True).with_item_counts()
         
         from apps.menu.serializers import MenuCategorySerializer
         serializer = MenuCategorySerializer(categories, many=True)
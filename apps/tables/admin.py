@@ -1,8 +1,10 @@
 """
 Admin configuration for tables app.
 """
+from django import forms
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
+from . import occupancy
 from .models import Table, TableSession
 
 
@@ -15,7 +17,9 @@ class TableAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'is_occupied', 'zone', 'restaurant', 'created_at']
     search_fields = ['number', 'restaurant__name', 'zone']
     ordering = ['restaurant', 'number']
-    readonly_fields = ('qr_code', 'qr_url', 'current_orders_count', 'created_at', 'updated_at', 'qr_code_preview')
+    # Занятость меняют только сессии (apps.tables.occupancy)
+    readonly_fields = ('qr_code', 'qr_url', 'current_orders_count', 'created_at', 'updated_at', 'qr_code_preview',
+                       'is_occupied')
     actions = ['occupy_tables', 'release_tables', 'activate_tables', 'deactivate_tables']
     
     fieldsets = (
@@ -94,14 +98,26 @@ class TableAdmin(admin.ModelAdmin):
     qr_code_preview.short_description = _('QR Code')
     
     def occupy_tables(self, request, queryset):
-        """Mark tables as occupied."""
-        updated = queryset.update(is_occupied=True)
+        """Open a session at each free table."""
+        updated = 0
+        for table in queryset.filter(is_occupied=False):
+            try:
+                occupancy.open_session(table)
+                updated += 1
+            except occupancy.TableOccupied:
+                pass
         self.message_user(request, f'{updated} tables marked as occupied.')
     occupy_tables.short_description = _('Mark as occupied')
     
     def release_tables(self, request, queryset):
-        """Mark tables as free."""
-        updated = queryset.update(is_occupied=False)
+        """Close the open session of each occupied table."""
+        updated = 0
+        for table in queryset.filter(is_occupied=True):
+            try:
+                occupancy.close_table(table)
+                updated += 1
+            except occupancy.NoActiveSession:
+                pass
         self.message_user(request, f'{updated} tables marked as free.')
     release_tables.short_description = _('Mark as free')
     
@@ -126,10 +142,25 @@ class TableAdmin(admin.ModelAdmin):
         return qs.none()
 
 
+class TableSessionAdminForm(forms.ModelForm):
+    """New sessions can only be opened at free tables."""
+    
+    class Meta:
+        model = TableSession
+        fields = ('table', 'waiter', 'notes')
+    
+    def clean_table(self):
+        table = self.cleaned_data['table']
+        if self.instance._state.adding and table.is_occupied:
+            raise forms.ValidationError(_('Столик уже занят'))
+        return table
+
+
 @admin.register(TableSession)
 class TableSessionAdmin(admin.ModelAdmin):
     """Admin interface for TableSession model."""
     
+    form = TableSessionAdminForm
     list_display = ['id', 'table', 'guests_count', 'started_at', 'closed_at', 'is_active']
     list_filter = ['started_at', 'closed_at', 'table__restaurant']
     search_fields = ['table__number', 'table__restaurant__name', 'session_code']
@@ -148,6 +179,22 @@ class TableSessionAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_readonly_fields(self, request, obj=None):
+        # Столик открытой сессии не меняется: иначе занятость разойдется с сессиями
+        if obj is not None:
+            return self.readonly_fields + ('table',)
+        return self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        """New sessions are opened through the occupancy service."""
+        if change:
+            return super().save_model(request, obj, form, change)
+        session = occupancy.open_session(obj.table, waiter=obj.waiter, notes=obj.notes)
+        obj.pk = session.pk
+        obj.session_code = session.session_code
+        obj.started_at = session.started_at
+        obj._state.adding = False
+    
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
@@ -2,13 +2,14 @@
 WebSocket Consumers for tables app.
 Real-time table status updates.
 """
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from config import broadcast, payloads, ws_auth, ws_codec
+from . import occupancy
 from .models import Table, TableSession
 
 
-class TableConsumer(AsyncWebsocketConsumer):
+class TableConsumer(broadcast.BroadcastConsumerMixin, ws_codec.CodecConsumerMixin, AsyncWebsocketConsumer):
     """
     Consumer for table status updates.
     Handles real-time table changes and availability.
@@ -19,6 +20,11 @@ class TableConsumer(AsyncWebsocketConsumer):
         self.table_id = self.scope['url_route']['kwargs']['table_id']
         self.table_group_name = f'table_{self.table_id}'
         
+        # Гость этого столика или сотрудник ресторана
+        if not await ws_auth.can_join_table(self.scope, self.table_id):
+            await self.close(code=ws_auth.FORBIDDEN)
+            return
+        
         await self.channel_layer.group_add(
             self.table_group_name,
             self.channel_name
@@ -29,10 +35,10 @@ class TableConsumer(AsyncWebsocketConsumer):
         # Send initial table status
         table_data = await self.get_table_data()
         if table_data:
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'table_status',
                 'data': table_data
-            }))
+            })
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
@@ -41,41 +47,41 @@ class TableConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages."""
         try:
-            data = json.loads(text_data)
+            data = ws_codec.loads(text_data, bytes_data)
             action = data.get('action')
             
-            if action == 'occupy':
-                await self.set_table_occupied(True)
-            elif action == 'release':
-                await self.set_table_occupied(False)
+            if action in ('occupy', 'release') and not ws_auth.is_staff(self.scope):
+                await self.send_message({
+                    'error': 'Permission denied'
+                })
+            elif action in ('occupy', 'release'):
+                error = await self.set_table_occupied(action == 'occupy')
+                if error:
+                    await self.send_message({
+                        'error': error
+                    })
             elif action == 'get_status':
                 table_data = await self.get_table_data()
-                await self.send(text_data=json.dumps({
+                await self.send_message({
                     'type': 'table_status',
                     'data': table_data
-                }))
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'error': 'Invalid JSON'
-            }))
+                })
+        except ValueError:
+            await self.send_message({
+                'error': 'Invalid message'
+            })
     
     # Receive message from table group
     async def table_update(self, event):
         """Send table update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'table_update',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     async def table_status(self, event):
         """Send table status to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'table_status',
-            'data': event['data']
-        }))
+        await self.forward(event)
     
     @database_sync_to_async
     def get_table_data(self):
@@ -92,44 +98,32 @@ class TableConsumer(AsyncWebsocketConsumer):
                 'is_active': table.is_active,
                 'zone': table.zone,
                 'restaurant': table.restaurant.name,
-                'session': {
-                    'id': current_session.id,
-                    'session_code': current_session.session_code,
-                    'guests_count': current_session.guests_count,
-                    'started_at': current_session.started_at.isoformat(),
-                } if current_session else None
+                'session': payloads.session_payload(
+                    current_session, current_session.guests_count
+                ) if current_session else None
             }
         except Table.DoesNotExist:
             return None
     
     @database_sync_to_async
     def set_table_occupied(self, occupied):
-        """Update table occupied status."""
+        """
+        Open or close the table session; the occupancy signal broadcasts the change.
+        Returns an error message if the table is already in that state.
+        """
         try:
             table = Table.objects.get(id=self.table_id)
-            table.is_occupied = occupied
-            table.save(update_fields=['is_occupied'])
-            
-            # Broadcast status change
-            from asgiref.sync import async_to_sync
-            from channels.layers import get_channel_layer
-            
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                self.table_group_name,
-                {
-                    'type': 'table_status',
-                    'data': {
-                        'is_occupied': occupied,
-                        'updated_at': 'now'
-                    }
-                }
-            )
+            if occupied:
+                occupancy.open_session(table)
+            else:
+                occupancy.close_table(table)
         except Table.DoesNotExist:
             pass
+        except (occupancy.TableOccupied, occupancy.NoActiveSession) as exc:
+            return str(exc)
 
 
-class TableSessionConsumer(AsyncWebsocketConsumer):
+class TableSessionConsumer(broadcast.BroadcastConsumerMixin, ws_codec.CodecConsumerMixin, AsyncWebsocketConsumer):
     """
     Consumer for table session updates.
     Handles guest count and session status.
@@ -140,6 +134,11 @@ class TableSessionConsumer(AsyncWebsocketConsumer):
         self.session_id = self.scope['url_route']['kwargs']['session_id']
         self.session_group_name = f'table_session_{self.session_id}'
         
+        # Гость этой сессии или сотрудник ресторана
+        if not await ws_auth.can_join_session(self.scope, self.session_id):
+            await self.close(code=ws_auth.FORBIDDEN)
+            return
+        
         await self.channel_layer.group_add(
             self.session_group_name,
             self.channel_name
@@ -150,10 +149,10 @@ class TableSessionConsumer(AsyncWebsocketConsumer):
         # Send initial session status
         session_data = await self.get_session_data()
         if session_data:
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'session_status',
                 'data': session_data
-            }))
+            })
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
@@ -162,28 +161,35 @@ class TableSessionConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming messages."""
         try:
-            data = json.loads(text_data)
+            data = ws_codec.loads(text_data, bytes_data)
             action = data.get('action')
             
             if action == 'update_guests_count':
                 guests_count = data.get('guests_count')
                 await self.update_guests_count(guests_count)
             elif action == 'close_session':
-                await self.close_session()
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
-                'error': 'Invalid JSON'
-            }))
+                # Сессию закрывает персонал, а не гость
+                if ws_auth.is_staff(self.scope):
+                    await self.close_session()
+        except ValueError:
+            await self.send_message({
+                'error': 'Invalid message'
+            })
     
     async def session_update(self, event):
         """Send session update to WebSocket."""
-        await self.send(text_data=json.dumps({
-            'type': 'session_update',
-            'data': event['data']
-        }))
+        await self.forward(event)
+    
+    async def order_accepted(self, event):
+        """Send confirmation of a queued order to WebSocket."""
+        await self.forward(event)
+    
+    async def order_rejected(self, event):
+        """Send rejection of a queued order to WebSocket."""
+        await self.forward(event)
     
     @database_sync_to_async
     def get_session_data(self):
@@ -191,15 +197,10 @@ class TableSessionConsumer(AsyncWebsocketConsumer):
         try:
             session = TableSession.objects.select_related('table', 'table__restaurant').get(id=self.session_id)
             
-            return {
-                'id': session.id,
-                'session_code': session.session_code,
-                'table_number': session.table.number,
-                'restaurant': session.table.restaurant.name,
-                'guests_count': session.guests_count,
-                'started_at': session.started_at.isoformat(),
-                'closed_at': session.closed_at.isoformat() if session.closed_at else None,
-            }
+            data = payloads.session_payload(session, session.guests_count)
+            data['table_number'] = session.table.number
+            data['restaurant'] = session.table.restaurant.name
+            return data
         except TableSession.DoesNotExist:
             return None
     
@@ -208,35 +209,27 @@ class TableSessionConsumer(AsyncWebsocketConsumer):
         """Update guest count for session."""
         try:
             session = TableSession.objects.get(id=self.session_id)
-            session.guests_count = guests_count
-            session.save(update_fields=['guests_count'])
-            
-            # Broadcast update
-            from asgiref.sync import async_to_sync
-            from channels.layers import get_channel_layer
-            
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                self.session_group_name,
-                {
-                    'type': 'session_update',
-                    'data': {'guests_count': guests_count}
-                }
-            )
+            with broadcast.batch():
+                session.guests_count = guests_count
+                session.save(update_fields=['guests_count'])
+                
+                # Broadcast update
+                broadcast.send(
+                    self.session_group_name,
+                    {
+                        'type': 'session_update',
+                        'data': {'guests_count': guests_count}
+                    },
+                    key=session.id
+                )
         except TableSession.DoesNotExist:
             pass
     
     @database_sync_to_async
     def close_session(self):
         """Close the session."""
-        from django.utils import timezone
         try:
-            session = TableSession.objects.get(id=self.session_id)
-            session.closed_at = timezone.now()
-            session.save(update_fields=['closed_at'])
-            
-            # Update table
-            session.table.is_occupied = False
-            session.table.save(update_fields=['is_occupied'])
-        except TableSession.DoesNotExist:
+            session = TableSession.objects.select_related('table').get(id=self.session_id)
+            occupancy.close_session(session)
+        except (TableSession.DoesNotExist, occupancy.NoActiveSession):
             pass
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.1 on 2026-10-17 04:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tables", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tablesession",
+            index=models.Index(
+                fields=["-started_at", "-id"], name="tablesession_started_id_idx"
+            ),
+        ),
+    ]
@@ -199,6 +199,9 @@ class TableSession(models.Model):
         verbose_name = _('Сессия столика')
         verbose_name_plural = _('Сессии столиков')
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['-started_at', '-id'], name='tablesession_started_id_idx'),
+        ]
     
     def __str__(self):
         status = "Активна" if not self.closed_at else "Завершена"
@@ -209,23 +212,16 @@ class TableSession(models.Model):
         if not self.session_code:
             self.session_code = str(uuid.uuid4())[:8].upper()
         
-        is_new = self.pk is None
+        # Занятость столика меняет apps.tables.occupancy, а не сохранение сессии
         super().save(*args, **kwargs)
-        
-        # Обновление статуса столика
-        if is_new:
-            self.table.is_occupied = True
-            self.table.save(update_fields=['is_occupied'])
     
     def close_session(self):
         """Закрыть сессию столика"""
-        from django.utils import timezone
-        self.closed_at = timezone.now()
-        self.save()
-        
-        # Обновить статус столика
-        self.table.is_occupied = False
-        self.table.save(update_fields=['is_occupied'])
+        from .occupancy import close_session, NoActiveSession
+        try:
+            close_session(self)
+        except NoActiveSession:
+            pass
     
     @property
     def is_active(self):
@@ -236,10 +232,8 @@ class TableSession(models.Model):
     def total_amount(self):
         """Общая сумма всех заказов в сессии"""
         from decimal import Decimal
-        total = Decimal('0')
-        for order in self.orders.all():
-            total += order.total_amount
-        return total
+        from django.db.models import Sum
+        return self.orders.aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
     
     @property
     def guests_count(self):
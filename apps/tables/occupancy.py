@@ -0,0 +1,86 @@
+"""
+Table occupancy: opening and closing table sessions.
+
+Occupancy is changed only here. Opening a session is one conditional
+``UPDATE`` of the table (``is_occupied = false -> true``) and one ``INSERT``
+of the session; closing is one ``UPDATE`` of the session and one of the
+table. Both run in one transaction, and after commit a single
+``table_occupancy_changed`` signal is sent; the table is not saved, so its
+``post_save`` broadcasts do not fire on top of it.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Table, TableSession
+from .signals import table_occupancy_changed
+
+
+class TableOccupied(Exception):
+    """Столик уже занят."""
+
+
+class NoActiveSession(Exception):
+    """У столика нет открытой сессии."""
+
+
+def _announce(table, session, opened):
+    transaction.on_commit(
+        lambda: table_occupancy_changed.send(
+            sender=Table, table=table, session=session, opened=opened
+        )
+    )
+
+
+def open_session(table, **fields):
+    """
+    Занять столик и открыть сессию.
+
+    Столик занимается условным UPDATE, поэтому из двух одновременных
+    запросов сессию откроет только один; второй получит TableOccupied.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = Table.objects.filter(pk=table.pk, is_occupied=False).update(
+            is_occupied=True, updated_at=now
+        )
+        if not claimed:
+            raise TableOccupied('Столик уже занят')
+        session = TableSession.objects.create(table=table, **fields)
+        table.is_occupied = True
+        table.updated_at = now
+        _announce(table, session, opened=True)
+    return session
+
+
+def close_session(session):
+    """
+    Закрыть сессию и освободить столик.
+
+    Сессию закрывает условный UPDATE (closed_at еще пуст), так что повторное
+    закрытие не пишет в базу и поднимает NoActiveSession.
+    """
+    now = timezone.now()
+    table = session.table
+    with transaction.atomic():
+        closed = TableSession.objects.filter(pk=session.pk, closed_at__isnull=True).update(
+            closed_at=now
+        )
+        if not closed:
+            raise NoActiveSession('Нет активной сессии')
+        Table.objects.filter(pk=table.pk, is_occupied=True).update(
+            is_occupied=False, updated_at=now
+        )
+        session.closed_at = now
+        table.is_occupied = False
+        table.updated_at = now
+        _announce(table, session, opened=False)
+    return session
+
+
+def close_table(table):
+    """Закрыть открытую сессию столика (NoActiveSession, если ее нет)."""
+    session = table.current_session
+    if session is None:
+        raise NoActiveSession('Нет активной сессии')
+    session.table = table
+    return close_session(session)
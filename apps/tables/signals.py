@@ -0,0 +1,9 @@
+"""
+Signals for tables app.
+"""
+from django.dispatch import Signal
+
+
+# Отправляется после коммита открытия или закрытия сессии столика
+# (см. apps.tables.occupancy). Аргументы: table, session, opened.
+table_occupancy_changed = Signal()
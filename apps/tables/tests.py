@@ -0,0 +1,71 @@
+"""
+Tests for table occupancy.
+Run: python manage.py test apps (or pytest)
+"""
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.orders.tests import LOCAL_BACKENDS
+from apps.restaurants.models import Restaurant
+from . import occupancy
+from .models import Table, TableSession
+from .signals import table_occupancy_changed
+
+
+@LOCAL_BACKENDS
+class TableOccupancyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='owner', role=User.Role.OWNER)
+        restaurant = Restaurant.objects.create(
+            name='Test', slug='test', owner=cls.owner, phone='0', address='-', city='-'
+        )
+        # Готовый qr_code: QR-картинка не генерируется
+        cls.table = Table.objects.create(restaurant=restaurant, number='1', qr_code='qr.png')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.announced = []
+        receiver = lambda sender, opened, **kwargs: self.announced.append(opened)  # noqa: E731
+        table_occupancy_changed.connect(receiver, weak=False)
+        self.addCleanup(table_occupancy_changed.disconnect, receiver)
+
+    def post(self, action):
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/tables/{self.table.pk}/{action}/')
+        writes = [q['sql'] for q in queries if q['sql'].split()[0] in ('INSERT', 'UPDATE')]
+        return response, writes
+
+    def test_open_and_close_write_once(self):
+        response, writes = self.post('open_session')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(writes), 2)
+        self.table.refresh_from_db()
+        self.assertTrue(self.table.is_occupied)
+
+        response, writes = self.post('open_session')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TableSession.objects.filter(table=self.table).count(), 1)
+
+        response, writes = self.post('close_session')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['closed_at'])
+        self.assertEqual(len(writes), 2)
+        self.table.refresh_from_db()
+        self.assertFalse(self.table.is_occupied)
+
+        self.assertEqual(self.post('close_session')[0].status_code, 404)
+        self.assertEqual(self.announced, [True, False])
+
+    def test_stale_copy_cannot_open_second_session(self):
+        stale = Table.objects.get(pk=self.table.pk)
+        occupancy.open_session(self.table)
+        with self.assertRaises(occupancy.TableOccupied):
+            occupancy.open_session(stale)
+        self.assertEqual(TableSession.objects.filter(table=self.table).count(), 1)
@@ -6,8 +6,9 @@ from rest_framework.routers import DefaultRouter
 from . import views
 
 router = DefaultRouter()
-router.register(r'', views.TableViewSet, basename='table')
+# sessions/ регистрируется первым, иначе его перехватывает маршрут <pk>/ столиков
 router.register(r'sessions', views.TableSessionViewSet, basename='table-session')
+router.register(r'', views.TableViewSet, basename='table')
 
 urlpatterns = [
     path('', include(router.urls)),
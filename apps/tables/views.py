@@ -7,6 +7,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
+from config.pagination import KeysetPagination
+from . import occupancy
 from .models import Table, TableSession
 from .serializers import (
     TableListSerializer, TableDetailSerializer,
@@ -48,18 +50,15 @@ class TableViewSet(viewsets.ModelViewSet):
         """Open new table session"""
         table = self.get_object()
         
-        if table.is_occupied:
+        try:
+            session = occupancy.open_session(table)
+        except occupancy.TableOccupied as exc:
             return Response(
-                {'error': 'Столик уже занят'},
+                {'error': str(exc)},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        session = TableSession.objects.create(table=table)
         serializer = TableSessionSerializer(session)
-        
-        table.is_occupied = True
-        table.save()
-        
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['get'])
@@ -81,21 +80,15 @@ class TableViewSet(viewsets.ModelViewSet):
     def close_session(self, request, pk=None):
         """Close table session"""
         table = self.get_object()
-        session = table.current_session
         
-        if not session:
+        try:
+            session = occupancy.close_table(table)
+        except occupancy.NoActiveSession as exc:
             return Response(
-                {'error': 'Нет активной сессии'},
+                {'error': str(exc)},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        from django.utils import timezone
-        session.closed_at = timezone.now()
-        session.save()
-        
-        table.is_occupied = False
-        table.save()
-        
         serializer = TableSessionSerializer(session)
         return Response(serializer.data)
     
@@ -118,10 +111,11 @@ class TableSessionViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet for table sessions (read-only).
     """
-    queryset = TableSession.objects.all()
+    queryset = TableSession.objects.select_related('table__restaurant')
     serializer_class = TableSessionSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['table', 'table__restaurant']
-    ordering_fields = ['opened_at']
-    ordering = ['-opened_at']
+    ordering_fields = ['started_at']
+    ordering = ['-started_at']
@@ -9,7 +9,6 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
@@ -21,14 +20,18 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django_asgi_app = get_asgi_application()
 
 from config.asgi_routing import websocket_urlpatterns
+from config.broadcaster import BroadcasterMiddleware
+from config.ws_auth import TokenAuthMiddleware
 
-application = ProtocolTypeRouter({
+# WebSocket события отправляются задачей в цикле событий сервера;
+# подключения авторизуются по токену из query string без запросов к базе
+application = BroadcasterMiddleware(ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        TokenAuthMiddleware(
             URLRouter(
                 websocket_urlpatterns
             )
         )
     ),
-})
+}))
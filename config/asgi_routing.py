@@ -2,7 +2,7 @@
 WebSocket URL routing configuration for the entire project.
 """
 from django.urls import re_path
-from apps.orders.consumers import OrderConsumer, OrderItemConsumer
+from apps.orders.consumers import OrderConsumer, OrderItemConsumer, KitchenConsumer
 from apps.tables.consumers import TableConsumer, TableSessionConsumer
 from apps.accounts.consumers import WaiterConsumer, RestaurantNotificationConsumer
 
@@ -19,6 +19,9 @@ websocket_urlpatterns = [
     re_path(r'ws/waiters/(?P<waiter_id>\w+)/$', WaiterConsumer.as_asgi()),
     re_path(r'ws/restaurants/(?P<restaurant_id>\w+)/notifications/$', WaiterConsumer.as_asgi()),
     
+    # Kitchen display queue
+    re_path(r'ws/restaurants/(?P<restaurant_id>\w+)/kitchen/$', KitchenConsumer.as_asgi()),
+    
     # Restaurant-wide notifications
     re_path(r'ws/restaurants/(?P<restaurant_id>\w+)/$', RestaurantNotificationConsumer.as_asgi()),
 ]
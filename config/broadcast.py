@@ -0,0 +1,265 @@
+"""
+Transaction-aware WebSocket event dispatcher.
+
+``send()`` never talks to the channel layer while a transaction is open.
+Events raised inside ``transaction.atomic`` are buffered per savepoint level
+and released on commit; the events of a rolled back savepoint or transaction
+are dropped with it. Inside a request (``BroadcastMiddleware``) or a
+``batch()`` block everything is held until the block ends.
+
+Before sending, events for the same group, type and ``key`` (usually the
+object they describe) collapse into the latest one, and each group gets a
+single message: the event itself, or a ``broadcast.batch`` message with all
+of its events in order, unpacked by ``BroadcastConsumerMixin``. Messages are
+handed to ``config.broadcaster``, which sends them off the request thread.
+Each event is encoded for the clients here, once per group rather than once
+per connection (``config.ws_codec.with_frames``).
+
+Events sent with ``restaurant_id`` are numbered and kept in the restaurant's
+event log (``config.event_log``) when they are released, so clients can
+resume after a reconnect.
+"""
+import itertools
+import logging
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import transaction
+
+from config.broadcaster import get_broadcaster
+from config import ws_codec
+from config.event_log import get_event_log
+
+logger = logging.getLogger(__name__)
+
+BATCH_TYPE = 'broadcast.batch'
+
+_state = Local()
+
+# Порядок добавления событий во всех уровнях транзакции
+_stamps = itertools.count()
+
+
+class _Unkeyed:
+    """Уникальная заглушка ключа для событий, которые не схлопываются."""
+
+
+def _is_keyed(slot):
+    return not isinstance(slot[2], _Unkeyed)
+
+
+class EventBuffer:
+    """
+    Отложенные события, сгруппированные по группе каналов.
+    """
+
+    def __init__(self):
+        self.events = OrderedDict()
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, group, message, key=None, restaurant_id=None):
+        # Событие без ключа не схлопывается с другими
+        slot = (group, message['type'], key if key is not None else _Unkeyed())
+        self.events.pop(slot, None)
+        self.events[slot] = (message, restaurant_id)
+        return slot
+
+    def merge(self, other):
+        for slot, event in other.events.items():
+            self.events.pop(slot, None)
+            self.events[slot] = event
+
+    def sequence(self):
+        """Пронумеровать события ресторанов и записать их в журнал."""
+        pending = [
+            (slot, message, restaurant_id)
+            for slot, (message, restaurant_id) in self.events.items()
+            if restaurant_id is not None
+        ]
+        if not pending:
+            return
+        try:
+            seqs = get_event_log().append([
+                (restaurant_id, slot[0], message) for slot, message, restaurant_id in pending
+            ])
+        except Exception:
+            # Без журнала события уходят без номера: клиент восстановится снимком
+            logger.exception('Failed to write %d events to the event log', len(pending))
+            return
+        for (slot, message, restaurant_id), seq in zip(pending, seqs):
+            self.events[slot] = (dict(message, seq=seq), restaurant_id)
+
+    def by_group(self):
+        groups = OrderedDict()
+        for slot, (message, _) in self.events.items():
+            groups.setdefault(slot[0], []).append((slot, message))
+        return groups
+
+
+class TransactionBuffer(EventBuffer):
+    """
+    События одного уровня транзакции (самой транзакции или savepoint).
+
+    Буфер отправляется обработчиком on_commit. При откате уровня Django
+    забывает этот обработчик, и буфер исчезает вместе с ним: словарь
+    уровней (_transaction_levels) держит только слабые ссылки.
+    """
+
+    def __init__(self, alias):
+        super().__init__()
+        self.alias = alias
+        self.stamps = {}
+        self.done = False
+
+    def add(self, group, message, key=None, restaurant_id=None):
+        slot = super().add(group, message, key, restaurant_id)
+        self.stamps[slot] = next(_stamps)
+        return slot
+
+    def committed(self):
+        """Транзакция зафиксирована: отправить события всех ее уровней вместе."""
+        if self.done:
+            return
+        levels = [self] + [
+            level for level in list(_transaction_levels().values())
+            if level is not self and level.alias == self.alias and not level.done
+        ]
+        # Уровни сливаются в порядке добавления: событие, добавленное позже
+        # в любом уровне, заменяет более раннее
+        entries = sorted(
+            (level.stamps[slot], slot, event)
+            for level in levels
+            for slot, event in level.events.items()
+        )
+        for level in levels:
+            level.done = True
+            level.events.clear()
+        buffer = EventBuffer()
+        for _, slot, event in entries:
+            buffer.events.pop(slot, None)
+            buffer.events[slot] = event
+
+        outer = getattr(_state, 'batch', None)
+        if outer is not None:
+            outer.merge(buffer)
+        else:
+            flush(buffer)
+
+
+def frame_formats():
+    return getattr(settings, 'BROADCAST_FRAMES', (ws_codec.JSON, ws_codec.MSGPACK))
+
+
+def group_message(messages):
+    """Одно сообщение для группы: само событие или пакет событий."""
+    if len(messages) == 1:
+        return messages[0]
+    return {'type': BATCH_TYPE, 'events': messages}
+
+
+def flush(buffer):
+    """Передать события буфера отправителю, по одному сообщению на группу."""
+    if not buffer:
+        return
+    buffer.sequence()
+    groups = buffer.by_group()
+    buffer.events.clear()
+    broadcaster = get_broadcaster()
+    formats = frame_formats()
+    for group, entries in groups.items():
+        slots = [slot for slot, _ in entries]
+        messages = [ws_codec.with_frames(message, formats) for _, message in entries]
+        # Одиночное событие с ключом может заменить еще не отправленное такое же;
+        # пронумерованное - нет: клиент увидел бы пропуск seq и запросил resync
+        coalesce_key = (
+            slots[0]
+            if len(slots) == 1 and _is_keyed(slots[0]) and 'seq' not in messages[0]
+            else None
+        )
+        broadcaster.submit(group, group_message(messages), coalesce_key)
+
+
+def _transaction_levels():
+    levels = getattr(_state, 'transactions', None)
+    if levels is None:
+        levels = _state.transactions = weakref.WeakValueDictionary()
+    return levels
+
+
+def _transaction_buffer(connection):
+    """Буфер текущего уровня транзакции соединения."""
+    levels = _transaction_levels()
+    # id savepoint уникальны в пределах транзакции
+    key = (connection.alias, tuple(connection.savepoint_ids))
+    buffer = levels.get(key)
+    if buffer is None or buffer.done:
+        buffer = levels[key] = TransactionBuffer(connection.alias)
+        transaction.on_commit(buffer.committed, using=connection.alias)
+    return buffer
+
+
+def send(group, message, key=None, using=None, restaurant_id=None):
+    """
+    Отправить событие в группу каналов после коммита.
+
+    ``key`` - идентификатор объекта: события с одинаковыми группой, типом и
+    ключом схлопываются в последнее. С ``restaurant_id`` событие получает
+    номер ``seq`` и попадает в журнал ресторана.
+    """
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block:
+        _transaction_buffer(connection).add(group, message, key, restaurant_id)
+        return
+    outer = getattr(_state, 'batch', None)
+    if outer is not None:
+        outer.add(group, message, key, restaurant_id)
+        return
+    buffer = EventBuffer()
+    buffer.add(group, message, key, restaurant_id)
+    flush(buffer)
+
+
+@contextmanager
+def batch():
+    """Собрать события внутри блока и отправить их в конце одним сообщением на группу."""
+    if getattr(_state, 'batch', None) is not None:
+        yield _state.batch
+        return
+    buffer = _state.batch = EventBuffer()
+    try:
+        yield buffer
+    finally:
+        _state.batch = None
+        flush(buffer)
+
+
+class BroadcastMiddleware:
+    """
+    Send the WebSocket events of a request once, after the response is built.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with batch():
+            return self.get_response(request)
+
+
+class BroadcastConsumerMixin:
+    """
+    Unpack ``broadcast.batch`` messages into the consumer's event handlers.
+    """
+
+    async def broadcast_batch(self, event):
+        for message in event['events']:
+            handler = getattr(self, message['type'].replace('.', '_'), None)
+            if handler is None:
+                logger.debug('%s has no handler for %s', type(self).__name__, message['type'])
+                continue
+            await handler(message)
@@ -0,0 +1,283 @@
+"""
+Background sender for channel-layer messages.
+
+``config.broadcast`` hands finished group messages to ``Broadcaster.submit``,
+which only appends them to a bounded in-memory queue and returns; a sender
+coroutine takes them from the queue and calls ``group_send``. A slow channel
+layer therefore fills the queue instead of holding up HTTP workers.
+
+The sender runs as an asyncio task on the server's event loop under ASGI
+(``BroadcasterMiddleware`` attaches it on the first call) and in a daemon
+thread with its own event loop everywhere else (WSGI, Celery, management
+commands). ``BROADCAST_MODE = 'inline'`` sends synchronously instead.
+
+When the queue is full, ``BROADCAST_OVERFLOW`` decides what is lost:
+``'drop_oldest'`` (default) or ``'drop_newest'``. A message with a coalesce
+key replaces a queued message with the same key instead of taking a new
+slot (``BROADCAST_COALESCE``); the replacement moves to the tail of the
+queue, so it is still sent after every message queued before it. Events
+numbered by the event log (``seq``) are submitted without a coalesce key.
+"""
+import asyncio
+import atexit
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class LatencyStats:
+    """
+    Последнее, среднее и максимальное значение задержки (в секундах).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.last = value
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        return {
+            'last_ms': round(self.last * 1000, 3),
+            'avg_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Broadcaster:
+    """
+    Ограниченная очередь сообщений для групп и фоновый отправитель.
+    """
+
+    def __init__(self, maxsize=10000, overflow=DROP_OLDEST, coalesce=True, concurrency=100):
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.coalesce = coalesce
+        self.concurrency = concurrency
+
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._seq = itertools.count()
+        self._loop = None
+        self._wakeup = None
+        self.mode = None
+        self._idle = threading.Event()
+        self._idle.set()
+
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.in_flight = 0
+        self.send_latency = LatencyStats()
+        self.queue_latency = LatencyStats()
+
+    # Очередь
+    def submit(self, group, message, coalesce_key=None):
+        """Поставить сообщение в очередь; никогда не блокирует вызывающего."""
+        now = time.monotonic()
+        with self._lock:
+            if self.coalesce and coalesce_key is not None and coalesce_key in self._items:
+                # Замена встает в конец очереди: сообщения группы, поставленные
+                # после заменяемого, не должны уйти позже нее
+                _, _, enqueued_at = self._items[coalesce_key]
+                self._items[coalesce_key] = (group, message, enqueued_at)
+                self._items.move_to_end(coalesce_key)
+                self.coalesced += 1
+                return True
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning('Broadcast queue is full (%d), %d messages dropped', self.maxsize, self.dropped)
+                if self.overflow == DROP_NEWEST:
+                    return False
+                self._items.popitem(last=False)
+            slot = coalesce_key if self.coalesce and coalesce_key is not None else next(self._seq)
+            self._items[slot] = (group, message, now)
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._idle.clear()
+        self._wake()
+        return True
+
+    def _take(self, limit):
+        with self._lock:
+            items = []
+            while self._items and len(items) < limit:
+                items.append(self._items.popitem(last=False)[1])
+            self.in_flight = len(items)
+            if not items:
+                self._idle.set()
+            return items
+
+    @property
+    def depth(self):
+        return len(self._items)
+
+    # Отправитель
+    def _wake(self):
+        if self._loop is None:
+            self._start_thread()
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # Цикл событий уже закрыт (завершение процесса)
+            pass
+
+    def attach(self, loop):
+        """Запускать отправку задачей в цикле событий ASGI-сервера."""
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self.mode = 'asyncio'
+        loop.create_task(self._run())
+
+    def _start_thread(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._wakeup = asyncio.Event()
+                ready.set()
+                loop.run_until_complete(self._run())
+
+            self._loop = loop
+            self.mode = 'thread'
+            threading.Thread(target=run, name='broadcaster', daemon=True).start()
+        ready.wait()
+        atexit.register(self.drain, getattr(settings, 'BROADCAST_SHUTDOWN_TIMEOUT', 2))
+
+    async def _run(self):
+        channel_layer = get_channel_layer()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while True:
+                items = self._take(self.concurrency)
+                if not items:
+                    break
+                # Группы отправляются параллельно, сообщения одной группы - по порядку
+                by_group = OrderedDict()
+                for group, message, enqueued_at in items:
+                    by_group.setdefault(group, []).append((message, enqueued_at))
+                await asyncio.gather(*(
+                    self._send_group(channel_layer, group, messages)
+                    for group, messages in by_group.items()
+                ))
+
+    async def _send_group(self, channel_layer, group, messages):
+        for message, enqueued_at in messages:
+            started = time.monotonic()
+            self.queue_latency.add(started - enqueued_at)
+            try:
+                await channel_layer.group_send(group, message)
+            except Exception:
+                self.failed += 1
+                logger.exception('Failed to broadcast to group %s', group)
+            else:
+                self.sent += 1
+            self.send_latency.add(time.monotonic() - started)
+
+    def drain(self, timeout=None):
+        """Дождаться отправки очереди (для тестов и завершения процесса)."""
+        return self._idle.wait(timeout)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'maxsize': self.maxsize,
+            'in_flight': self.in_flight,
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'queue_latency': self.queue_latency.as_dict(),
+            'send_latency': self.send_latency.as_dict(),
+        }
+
+
+class InlineBroadcaster:
+    """
+    Синхронная отправка в потоке вызывающего (BROADCAST_MODE = 'inline').
+    """
+
+    def submit(self, group, message, coalesce_key=None):
+        channel_layer = get_channel_layer()
+        try:
+            async_to_sync(channel_layer.group_send)(group, message)
+        except Exception:
+            logger.exception('Failed to broadcast to group %s', group)
+            return False
+        return True
+
+    def attach(self, loop):
+        pass
+
+    def drain(self, timeout=None):
+        return True
+
+    def stats(self):
+        return {'mode': 'inline'}
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    """Получить отправитель сообщений процесса."""
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                if getattr(settings, 'BROADCAST_MODE', 'background') == 'inline':
+                    _broadcaster = InlineBroadcaster()
+                else:
+                    _broadcaster = Broadcaster(
+                        maxsize=getattr(settings, 'BROADCAST_QUEUE_SIZE', 10000),
+                        overflow=getattr(settings, 'BROADCAST_OVERFLOW', DROP_OLDEST),
+                        coalesce=getattr(settings, 'BROADCAST_COALESCE', True),
+                        concurrency=getattr(settings, 'BROADCAST_CONCURRENCY', 100),
+                    )
+    return _broadcaster
+
+
+class BroadcasterMiddleware:
+    """
+    ASGI middleware that runs the broadcaster on the server's event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        get_broadcaster().attach(asyncio.get_running_loop())
+        return await self.app(scope, receive, send)
@@ -0,0 +1,281 @@
+"""
+In-process channel layer for a single ASGI process.
+
+``CHANNEL_LAYER_BACKEND = 'local'`` replaces ``channels_redis`` when one
+ASGI server process serves all WebSockets (a single-box venue install,
+tests): ``group_send`` puts the message object straight into the receivers'
+queues, without serialization or a round trip to Redis. Other processes
+(Celery workers, a second server) cannot reach it, so it is only for setups
+where every event is sent from the ASGI process itself.
+
+Messages are shared by all recipients of a ``group_send`` and must not be
+modified by consumers (``CodecConsumerMixin.forward`` only reads them).
+
+- Groups and channels are split into ``shards`` registries with their own
+  locks, so sends to different restaurants do not wait for each other (the
+  broadcaster may send from its own thread).
+- Every channel has a bounded queue (``capacity``, ``channel_capacity``):
+  ``send`` to a full channel raises ``ChannelFull``, ``group_send`` skips it.
+- Messages older than ``expiry`` and group memberships older than
+  ``group_expiry`` are dropped.
+- ``stats()`` returns counters and queue depths.
+"""
+import asyncio
+import random
+import string
+import threading
+import time
+from collections import deque
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class _Channel:
+    """
+    Очередь канала и ожидающий receive() (цикл событий и future).
+    """
+
+    __slots__ = ('messages', 'waiter')
+
+    def __init__(self):
+        self.messages = deque()
+        self.waiter = None
+
+
+class _Shard:
+    """
+    Часть реестра: каналы и группы с общей блокировкой.
+    """
+
+    __slots__ = ('lock', 'channels', 'groups')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+        self.groups = {}
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    """
+    Channel layer that keeps groups and queues in process memory.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, shards=16):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.group_expiry = group_expiry
+        self._shards = [_Shard() for _ in range(shards)]
+        self._next_sweep = time.monotonic() + expiry
+
+        self.sent = 0
+        self.group_sent = 0
+        self.delivered = 0
+        self.received = 0
+        self.full = 0
+        self.expired = 0
+        self.expired_members = 0
+
+    def _shard(self, name):
+        return self._shards[hash(name) % len(self._shards)]
+
+    # Каналы
+    async def new_channel(self, prefix='specific'):
+        suffix = ''.join(random.choices(string.ascii_letters, k=12))
+        return f'{prefix}.local!{suffix}'
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+        self.sent += 1
+        if not self._deliver(channel, message, time.monotonic(), _running_loop()):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        loop = asyncio.get_running_loop()
+        shard = self._shard(channel)
+        with shard.lock:
+            queue = shard.channels.get(channel)
+            if queue is None:
+                queue = shard.channels[channel] = _Channel()
+            message = self._pop(queue, time.monotonic())
+            if message is not None:
+                if not queue.messages:
+                    del shard.channels[channel]
+                self.received += 1
+                return message
+            # У канала один получатель (так channels читает каналы consumer-ов)
+            future = loop.create_future()
+            queue.waiter = (loop, future)
+        try:
+            message = await future
+        except asyncio.CancelledError:
+            with shard.lock:
+                if queue.waiter is not None and queue.waiter[1] is future:
+                    queue.waiter = None
+                if not queue.messages and queue.waiter is None:
+                    shard.channels.pop(channel, None)
+            if future.done() and not future.cancelled():
+                # Сообщение пришло одновременно с отменой: вернуть его в очередь
+                self._requeue(channel, future.result())
+            raise
+        self.received += 1
+        return message
+
+    def _pop(self, queue, now):
+        """Первое непросроченное сообщение очереди или None."""
+        while queue.messages:
+            expires_at, message = queue.messages.popleft()
+            if expires_at >= now:
+                return message
+            self.expired += 1
+        return None
+
+    def _deliver(self, channel, message, now, current_loop):
+        """Передать сообщение ожидающему receive() или в очередь; False, если она заполнена."""
+        shard = self._shard(channel)
+        with shard.lock:
+            queue = shard.channels.get(channel)
+            if queue is None:
+                queue = shard.channels[channel] = _Channel()
+            if queue.waiter is not None:
+                loop, future = queue.waiter
+                queue.waiter = None
+                if loop is current_loop:
+                    if not future.done():
+                        future.set_result(message)
+                        self.delivered += 1
+                        return True
+                else:
+                    try:
+                        loop.call_soon_threadsafe(self._wake, channel, future, message)
+                    except RuntimeError:
+                        # Цикл получателя уже закрыт
+                        pass
+                    else:
+                        self.delivered += 1
+                        return True
+            if len(queue.messages) >= self.get_capacity(channel):
+                self.full += 1
+                return False
+            queue.messages.append((now + self.expiry, message))
+            self.delivered += 1
+            return True
+
+    def _wake(self, channel, future, message):
+        if future.done():
+            self._requeue(channel, message)
+        else:
+            future.set_result(message)
+
+    def _requeue(self, channel, message):
+        shard = self._shard(channel)
+        with shard.lock:
+            queue = shard.channels.get(channel)
+            if queue is None:
+                queue = shard.channels[channel] = _Channel()
+            queue.messages.appendleft((time.monotonic() + self.expiry, message))
+
+    # Группы
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        shard = self._shard(group)
+        with shard.lock:
+            shard.groups.setdefault(group, {})[channel] = time.monotonic()
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        shard = self._shard(group)
+        with shard.lock:
+            members = shard.groups.get(group)
+            if members is not None:
+                members.pop(channel, None)
+                if not members:
+                    del shard.groups[group]
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        now = time.monotonic()
+        shard = self._shard(group)
+        with shard.lock:
+            members = shard.groups.get(group)
+            if not members:
+                channels = []
+            else:
+                cutoff = now - self.group_expiry
+                expired = [channel for channel, added_at in members.items() if added_at < cutoff]
+                for channel in expired:
+                    del members[channel]
+                self.expired_members += len(expired)
+                channels = list(members)
+        self.group_sent += 1
+        loop = _running_loop()
+        for channel in channels:
+            # Заполненный канал пропускается, как в channels_redis
+            self._deliver(channel, message, now, loop)
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+    def _sweep(self, now):
+        """Удалить просроченные сообщения и пустые каналы без получателя."""
+        self._next_sweep = now + self.expiry
+        for shard in self._shards:
+            with shard.lock:
+                for channel, queue in list(shard.channels.items()):
+                    while queue.messages and queue.messages[0][0] < now:
+                        queue.messages.popleft()
+                        self.expired += 1
+                    if not queue.messages and queue.waiter is None:
+                        del shard.channels[channel]
+
+    # Обслуживание
+    async def flush(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.channels.clear()
+                shard.groups.clear()
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        channels = groups = members = queued = max_depth = 0
+        for shard in self._shards:
+            with shard.lock:
+                channels += len(shard.channels)
+                groups += len(shard.groups)
+                members += sum(len(group) for group in shard.groups.values())
+                for queue in shard.channels.values():
+                    queued += len(queue.messages)
+                    max_depth = max(max_depth, len(queue.messages))
+        return {
+            'backend': 'local',
+            'shards': len(self._shards),
+            'channels': channels,
+            'groups': groups,
+            'members': members,
+            'queued': queued,
+            'max_depth': max_depth,
+            'capacity': self.capacity,
+            'sent': self.sent,
+            'group_sent': self.group_sent,
+            'delivered': self.delivered,
+            'received': self.received,
+            'full': self.full,
+            'expired': self.expired,
+            'expired_members': self.expired_members,
+        }
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
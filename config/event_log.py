@@ -0,0 +1,221 @@
+"""
+Sequenced log of restaurant events for resume after reconnect.
+
+Events sent with ``broadcast.send(..., restaurant_id=...)`` (the
+``restaurant_<id>`` and ``waiter_<id>`` groups) get a per-restaurant,
+monotonically increasing ``seq`` when they are released, and the last
+``EVENT_LOG_SIZE`` of them are kept per restaurant. A client that reconnects
+sends ``{"action": "resume", "last_seq": N}`` and receives only the events
+after ``N`` for its groups; when the gap is older than the log it gets
+``resync`` and reloads its snapshot.
+
+The log is a Redis stream per restaurant whose entry ids are the sequence
+numbers (``EVENT_LOG_BACKEND = 'redis'``) or a ring buffer in process memory
+(``'local'``, single process and tests).
+"""
+import json
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def log_size():
+    return getattr(settings, 'EVENT_LOG_SIZE', 1000)
+
+
+class LocalEventLog:
+    """
+    Кольцевой буфер событий в памяти процесса.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or log_size()
+        self._lock = threading.Lock()
+        self._events = {}
+        self._seq = {}
+
+    def append(self, events):
+        """Записать события [(restaurant_id, group, message)]; вернуть их seq."""
+        seqs = []
+        with self._lock:
+            for restaurant_id, group, message in events:
+                seq = self._seq.get(restaurant_id, 0) + 1
+                self._seq[restaurant_id] = seq
+                buffer = self._events.get(restaurant_id)
+                if buffer is None:
+                    buffer = self._events[restaurant_id] = deque(maxlen=self.size)
+                buffer.append((seq, group, dict(message, seq=seq)))
+                seqs.append(seq)
+        return seqs
+
+    def last_seq(self, restaurant_id):
+        with self._lock:
+            return self._seq.get(restaurant_id, 0)
+
+    def since(self, restaurant_id, last_seq, groups):
+        """
+        События после last_seq для групп groups.
+
+        Возвращает (события [(group, message)], текущий seq) или
+        (None, текущий seq), если часть пропущенных событий уже вытеснена.
+        """
+        with self._lock:
+            current = self._seq.get(restaurant_id, 0)
+            buffer = list(self._events.get(restaurant_id, ()))
+        if last_seq > current:
+            # Журнал начат заново (перезапуск процесса)
+            return None, current
+        if last_seq < current and (not buffer or buffer[0][0] > last_seq + 1):
+            return None, current
+        return [
+            (group, message) for seq, group, message in buffer
+            if seq > last_seq and group in groups
+        ], current
+
+
+# Номер события и запись в поток - одна атомарная операция
+APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[2])
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[3], seq .. '-0', 'g', ARGV[1], 'm', ARGV[2])
+return seq
+"""
+
+
+class RedisEventLog:
+    """
+    Поток Redis на ресторан; id записи - номер события.
+    """
+
+    KEY_PREFIX = 'events'
+
+    def __init__(self, url=None, client=None, size=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.client = client
+        self.size = size or log_size()
+        self._append = client.register_script(APPEND_SCRIPT)
+
+    def _stream_key(self, restaurant_id):
+        return f'{self.KEY_PREFIX}:{restaurant_id}'
+
+    def _seq_key(self, restaurant_id):
+        return f'{self.KEY_PREFIX}:{restaurant_id}:seq'
+
+    def append(self, events):
+        pipe = self.client.pipeline(transaction=False)
+        for restaurant_id, group, message in events:
+            self._append(
+                keys=[self._stream_key(restaurant_id), self._seq_key(restaurant_id)],
+                args=[group, json.dumps(message, cls=DjangoJSONEncoder), self.size],
+                client=pipe
+            )
+        return [int(seq) for seq in pipe.execute()]
+
+    def last_seq(self, restaurant_id):
+        return int(self.client.get(self._seq_key(restaurant_id)) or 0)
+
+    def since(self, restaurant_id, last_seq, groups):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self._seq_key(restaurant_id))
+        pipe.xrange(self._stream_key(restaurant_id), min=f'{last_seq}-0', count=1)
+        pipe.xrange(self._stream_key(restaurant_id), min=f'({last_seq}-0')
+        current, first, entries = pipe.execute()
+        current = int(current or 0)
+        if last_seq > current:
+            return None, current
+        # Событие last_seq (или следующее за ним) должно еще быть в потоке
+        if last_seq < current and not first:
+            return None, current
+        if first and int(first[0][0].split(b'-')[0]) > last_seq + 1:
+            return None, current
+        groups = {group.encode() for group in groups}
+        return [
+            (fields[b'g'].decode(), dict(json.loads(fields[b'm']), seq=int(entry_id.split(b'-')[0])))
+            for entry_id, fields in entries if fields[b'g'] in groups
+        ], current
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """Получить журнал событий ресторанов."""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                if getattr(settings, 'EVENT_LOG_BACKEND', 'redis') == 'local':
+                    _log = LocalEventLog()
+                else:
+                    _log = RedisEventLog()
+    return _log
+
+
+def parse_seq(value):
+    """Номер события от клиента (целое >= 0, число или строка) или None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value >= 0 else None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+class ResumableConsumerMixin:
+    """
+    Replay missed restaurant events on ``{"action": "resume", "last_seq": N}``.
+
+    Consumers set ``restaurant_id`` and ``group_name`` (or override
+    ``resume_groups``); sequenced events carry ``seq`` and are forwarded
+    with it.
+    """
+
+    def resume_restaurant_id(self):
+        return getattr(self, 'restaurant_id', None)
+
+    def resume_groups(self):
+        return [self.group_name]
+
+    async def current_seq(self):
+        restaurant_id = self.resume_restaurant_id()
+        if restaurant_id is None:
+            return 0
+        return await sync_to_async(get_event_log().last_seq)(int(restaurant_id))
+
+    async def resume(self, last_seq=None):
+        """
+        Send the events after ``last_seq``, or ``resync`` if they are gone
+        or ``last_seq`` is not a valid sequence number.
+        """
+        restaurant_id = self.resume_restaurant_id()
+        if restaurant_id is None:
+            await self.send_message({'type': 'resync', 'seq': 0})
+            return
+        log = get_event_log()
+        seq = parse_seq(last_seq)
+        if last_seq is None:
+            # Клиент без состояния узнает только текущий номер
+            current = await sync_to_async(log.last_seq)(int(restaurant_id))
+            events = []
+        elif seq is None:
+            # Номер не разобран: клиент пересобирает состояние
+            current = await sync_to_async(log.last_seq)(int(restaurant_id))
+            events = None
+        else:
+            events, current = await sync_to_async(log.since)(
+                int(restaurant_id), seq, self.resume_groups()
+            )
+        if events is None:
+            await self.send_message({'type': 'resync', 'seq': current})
+            return
+        for _, message in events:
+            handler = getattr(self, message['type'].replace('.', '_'), None)
+            if handler is not None:
+                await handler(message)
+        await self.send_message({'type': 'resumed', 'seq': current, 'replayed': len(events)})
@@ -0,0 +1,185 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with ``WHERE (key, id) < (:key, :id) ORDER BY key, id``
+instead of ``OFFSET``, so the cost of a page does not grow with the size of
+the table, and no ``COUNT(*)`` is run unless the client asks for it with
+``?include_count=true``.
+
+The key is the first field of the ordering chosen by the view's
+``OrderingFilter`` (or ``KeysetPagination.ordering`` for plain views); the
+primary key is always added as a tie-breaker. Key fields must be non-null.
+"""
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(<ordering field>, id)``.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'include_count'
+    ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        self.key, self.descending = self.get_ordering(request, queryset, view)
+        self.count = queryset.count() if self.wants_count(request) else None
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        if cursor:
+            queryset = queryset.filter(self._after(cursor['v'], cursor['i'], reverse))
+
+        # Для предыдущей страницы идем в обратную сторону и разворачиваем результат
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.key}', f'{prefix}pk')
+
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        self.page = page
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return page
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['previous'] = self.get_previous_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'example': 123,
+                    'description': f'Only present with ?{self.count_query_param}=true',
+                },
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Include the exact total count (runs COUNT(*)).',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', None) or []:
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        field = (ordering or [self.ordering])[0]
+        if field.lstrip('-') in ('id', 'pk'):
+            field = self.ordering
+        return field.lstrip('-'), field.startswith('-')
+
+    def _after(self, value, pk, reverse):
+        lookup = 'lt' if self.descending != reverse else 'gt'
+        return Q(**{f'{self.key}__{lookup}': value}) | Q(**{self.key: value, f'pk__{lookup}': pk})
+
+    # Курсор
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_'))
+            field = self.key_field()
+            return {
+                'v': field.to_python(cursor['v']),
+                'i': int(cursor['i']),
+                'r': bool(cursor.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse=False):
+        value = self.key_field().value_to_string(obj)
+        cursor = {'v': value, 'i': obj.pk}
+        if reverse:
+            cursor['r'] = 1
+        encoded = b64encode(json.dumps(cursor, separators=(',', ':')).encode(), altchars=b'-_')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def key_field(self):
+        return self.model._meta.get_field(self.key)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
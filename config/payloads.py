@@ -0,0 +1,169 @@
+"""
+Payloads of WebSocket events.
+
+Builders work on already loaded objects and never follow a relation that
+is not cached: ``load_order_context`` / ``payment_context`` fetch what is
+missing with one query. Every payload carries ``v`` (``PAYLOAD_VERSION``);
+bump it when a field changes meaning or is removed, adding fields does not
+need a new version.
+"""
+PAYLOAD_VERSION = 1
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _is_cached(instance, field_name):
+    return instance._meta.get_field(field_name).is_cached(instance)
+
+
+# Заказы
+def load_order_context(orders):
+    """
+    Подгрузить сессию и столик заказов, которых еще нет в памяти.
+
+    Не больше одного запроса на весь список.
+    """
+    from apps.tables.models import TableSession
+
+    missing = [
+        order for order in orders
+        if not _is_cached(order, 'table_session') or not _is_cached(order.table_session, 'table')
+    ]
+    if missing:
+        sessions = TableSession.objects.select_related('table').in_bulk(
+            {order.table_session_id for order in missing}
+        )
+        for order in missing:
+            order.table_session = sessions[order.table_session_id]
+    return orders
+
+
+def order_payload(order):
+    """Состояние заказа (только поля самого заказа)."""
+    return {
+        'v': PAYLOAD_VERSION,
+        'id': order.pk,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'total_amount': str(order.total_amount),
+        'items_count': order.items_count,
+        'waiter_id': order.waiter_id,
+        'created_at': _isoformat(order.created_at),
+        'confirmed_at': _isoformat(order.confirmed_at),
+        'ready_at': _isoformat(order.ready_at),
+        'delivered_at': _isoformat(order.delivered_at),
+        'updated_at': _isoformat(order.updated_at),
+    }
+
+
+def new_order_payload(order):
+    """Новый заказ для ресторана (нужен load_order_context)."""
+    return {
+        'v': PAYLOAD_VERSION,
+        'order_id': order.pk,
+        'table_number': order.table_session.table.number,
+        'items_count': order.items_count,
+        'created_at': _isoformat(order.created_at),
+    }
+
+
+def order_notification_payload(order):
+    """Уведомление официанта о новом заказе (нужен load_order_context)."""
+    table_number = order.table_session.table.number
+    return {
+        'v': PAYLOAD_VERSION,
+        'order_id': order.pk,
+        'table_number': table_number,
+        'items_count': order.items_count,
+        'message': f'New order for table {table_number}',
+    }
+
+
+def order_ready_payload(order):
+    """Заказ готов (нужен load_order_context)."""
+    table_number = order.table_session.table.number
+    return {
+        'v': PAYLOAD_VERSION,
+        'order_id': order.pk,
+        'table_number': table_number,
+        'message': f'Order ready for table {table_number}',
+    }
+
+
+# Столики
+def table_status_payload(table, updated_at):
+    return {
+        'v': PAYLOAD_VERSION,
+        'is_occupied': table.is_occupied,
+        'is_active': table.is_active,
+        'updated_at': _isoformat(updated_at),
+    }
+
+
+def table_update_payload(table):
+    return {
+        'v': PAYLOAD_VERSION,
+        'table_id': table.pk,
+        'table_number': table.number,
+        'is_occupied': table.is_occupied,
+    }
+
+
+def session_payload(session, guests_count):
+    """Сессия столика; guests_count передается вызывающим (это запрос)."""
+    return {
+        'v': PAYLOAD_VERSION,
+        'id': session.pk,
+        'session_code': session.session_code,
+        'guests_count': guests_count,
+        'started_at': _isoformat(session.started_at),
+        'closed_at': _isoformat(session.closed_at),
+    }
+
+
+# Платежи
+def payment_context(payment):
+    """
+    Официант заказа и ресторан платежа одним запросом.
+
+    Возвращает (waiter_id, restaurant_id); waiter_id - None для платежей без
+    заказа или заказов без официанта.
+    """
+    from apps.orders.models import Order
+    from apps.tables.models import TableSession
+
+    if payment.order_id:
+        row = Order.objects.filter(pk=payment.order_id).values_list(
+            'waiter_id', 'table_session__table__restaurant_id'
+        ).first()
+        return row or (None, None)
+    if payment.table_session_id:
+        restaurant_id = TableSession.objects.filter(pk=payment.table_session_id).values_list(
+            'table__restaurant_id', flat=True
+        ).first()
+        return None, restaurant_id
+    return None, None
+
+
+def payment_payload(payment):
+    return {
+        'v': PAYLOAD_VERSION,
+        'id': payment.pk,
+        'payment_id': payment.payment_id,
+        'order_id': payment.order_id,
+        'status': payment.status,
+        'amount': str(payment.amount),
+        'created_at': _isoformat(payment.created_at),
+    }
+
+
+def payment_notification_payload(payment):
+    return {
+        'v': PAYLOAD_VERSION,
+        'payment_id': payment.pk,
+        'order_id': payment.order_id,
+        'amount': str(payment.amount),
+        'message': f'Payment of {payment.amount} {payment.currency} received',
+    }
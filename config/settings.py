@@ -5,6 +5,8 @@ Django settings for restaurant_qr_project.
 from pathlib import Path
 import environ
 import os
+from celery.schedules import crontab
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -73,6 +75,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.broadcast.BroadcastMiddleware',  # WebSocket events sent once per request
 ]
 
 # Security middleware (only in production)
@@ -186,6 +189,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Adds role/restaurant_id claims used to authorize WebSocket connections
+    'TOKEN_OBTAIN_SERIALIZER': 'apps.accounts.serializers.TokenObtainPairSerializer',
 }
 
 # API Documentation
@@ -205,17 +210,139 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:9000",
     "http://127.0.0.1:9000",
 ]
-
-# Channels configuration for WebSockets
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
-        'CONFIG': {
-            "hosts": [env('REDIS_URL', default='redis://localhost:6379/0')],
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
+
+# Redis
+REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
+
+# Channels configuration for WebSockets: 'redis' or 'local' - in-process
+# layer (config.channel_layer) for a single ASGI process that sends all events
+CHANNEL_LAYER_BACKEND = env('CHANNEL_LAYER_BACKEND', default='redis')
+if CHANNEL_LAYER_BACKEND == 'local':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'config.channel_layer.LocalChannelLayer',
+            'CONFIG': {
+                'expiry': env.int('CHANNEL_LAYER_EXPIRY', default=60),
+                'capacity': env.int('CHANNEL_LAYER_CAPACITY', default=100),
+                'shards': env.int('CHANNEL_LAYER_SHARDS', default=16),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                "hosts": [REDIS_URL],
+            },
         },
+    }
+
+# Celery
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default=REDIS_URL)
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    'flush-stock-counters': {
+        'task': 'apps.menu.tasks.flush_stock_counters',
+        'schedule': env.int('STOCK_FLUSH_INTERVAL', default=10),
+    },
+    'archive-settled-orders': {
+        'task': 'apps.orders.tasks.archive_settled_orders',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'purge-idempotency-keys': {
+        'task': 'apps.orders.tasks.purge_idempotency_keys',
+        'schedule': crontab(minute=15),
     },
 }
 
+# Order archival: paid/cancelled orders untouched for this many days are
+# moved to the archive tables in batches by archive_settled_orders
+ORDER_ARCHIVE_AFTER_DAYS = env.int('ORDER_ARCHIVE_AFTER_DAYS', default=90)
+ORDER_ARCHIVE_BATCH_SIZE = env.int('ORDER_ARCHIVE_BATCH_SIZE', default=500)
+ORDER_ARCHIVE_MAX_BATCHES = env.int('ORDER_ARCHIVE_MAX_BATCHES', default=200)
+
+# Idempotency-Key storage for order/payment creation: 'cache' (shared Django
+# cache) or 'database'; unset picks 'database' unless a shared cache is configured
+IDEMPOTENCY_BACKEND = env('IDEMPOTENCY_BACKEND', default=None)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=60 * 60)
+
+# Stock reservation: 'database' (conditional UPDATE per item),
+# 'redis' (hot counters in Redis) or 'local' (in-process counters)
+STOCK_RESERVATION_BACKEND = env('STOCK_RESERVATION_BACKEND', default='database')
+
+# Kitchen display queue storage: 'redis' (shared by all processes) or 'local'
+KITCHEN_QUEUE_BACKEND = env('KITCHEN_QUEUE_BACKEND', default='redis')
+# Seconds between re-reads of a restaurant's kitchen queue from the database
+# (drops orders whose events were lost) and lifetime of an idle queue in Redis
+KITCHEN_QUEUE_RESYNC_INTERVAL = env.int('KITCHEN_QUEUE_RESYNC_INTERVAL', default=60 * 60)
+KITCHEN_QUEUE_TTL = env.int('KITCHEN_QUEUE_TTL', default=24 * 60 * 60)
+
+# WebSocket sends: 'background' (bounded in-process queue drained by an
+# asyncio task / daemon thread) or 'inline' (send on the calling thread)
+BROADCAST_MODE = env('BROADCAST_MODE', default='background')
+BROADCAST_QUEUE_SIZE = env.int('BROADCAST_QUEUE_SIZE', default=10000)
+# When the queue is full: 'drop_oldest' or 'drop_newest'
+BROADCAST_OVERFLOW = env('BROADCAST_OVERFLOW', default='drop_oldest')
+# Replace a queued update of the same object instead of queueing another one
+BROADCAST_COALESCE = env.bool('BROADCAST_COALESCE', default=True)
+
+# Client frames encoded once per broadcast and forwarded by consumers as is:
+# 'json' (text sockets) and 'msgpack' (binary sockets); empty - encode per socket
+BROADCAST_FRAMES = env.list('BROADCAST_FRAMES', default=['json', 'msgpack'])
+
+# Restaurant event log for resume after reconnect: 'redis' (stream per
+# restaurant) or 'local'; EVENT_LOG_SIZE events are kept per restaurant
+EVENT_LOG_BACKEND = env('EVENT_LOG_BACKEND', default='redis')
+EVENT_LOG_SIZE = env.int('EVENT_LOG_SIZE', default=1000)
+
+# WebSocket authentication (config.ws_auth): lifetime of signed guest tokens
+# and of the cached restaurant of tables/sessions/orders used for group checks
+WS_GUEST_TOKEN_MAX_AGE = env.int('WS_GUEST_TOKEN_MAX_AGE', default=12 * 60 * 60)
+WS_AUTH_CACHE_TTL = env.int('WS_AUTH_CACHE_TTL', default=60 * 60)
+
+# Order ingestion: 'sync' (order written inside POST /api/orders/) or 'queue'
+# (validated against cached menu data, queued and answered with 202; the
+# drain_order_queue task writes queued orders in batches)
+ORDER_INGESTION_MODE = env('ORDER_INGESTION_MODE', default='sync')
+# Queue storage: 'redis' (Redis stream) or 'database' (OrderIntent table)
+ORDER_INGEST_QUEUE_BACKEND = env('ORDER_INGEST_QUEUE_BACKEND', default='redis')
+ORDER_INGEST_BATCH_SIZE = env.int('ORDER_INGEST_BATCH_SIZE', default=200)
+ORDER_INGEST_MAX_BATCHES = env.int('ORDER_INGEST_MAX_BATCHES', default=50)
+ORDER_INGEST_CACHE_TTL = env.int('ORDER_INGEST_CACHE_TTL', default=60)
+# Deliveries of a queued order before it is rejected and moved aside
+# (orders:ingest:dead stream, or OrderIntent rows with attempts at the limit)
+ORDER_INGEST_MAX_DELIVERIES = env.int('ORDER_INGEST_MAX_DELIVERIES', default=5)
+if ORDER_INGESTION_MODE == 'queue':
+    CELERY_BEAT_SCHEDULE['drain-order-queue'] = {
+        'task': 'apps.orders.tasks.drain_order_queue',
+        'schedule': env.float('ORDER_INGEST_DRAIN_INTERVAL', default=1.0),
+    }
+
+# Cached menu documents (/api/menu/snapshot/<slug>/); a menu change switches
+# to a new version, so the TTL only bounds how long unused versions stay cached
+MENU_SNAPSHOT_TTL = env.int('MENU_SNAPSHOT_TTL', default=24 * 60 * 60)
+
+# Menu search (/api/menu/items/search/): minimal trigram word similarity of
+# a match (0..1); lower finds more misspellings and more noise
+MENU_SEARCH_SIMILARITY = env.float('MENU_SEARCH_SIMILARITY', default=0.4)
+
+# Resized WebP/JPEG copies of menu photos, logos and covers (apps.menu.images):
+# 'celery' (generate_image_variants task), 'local' (thread pool of
+# IMAGE_PIPELINE_WORKERS in the web process) or 'inline' (after commit)
+IMAGE_PIPELINE = env('IMAGE_PIPELINE', default='celery')
+IMAGE_PIPELINE_WORKERS = env.int('IMAGE_PIPELINE_WORKERS', default=2)
+
+# Single-flight rebuilds of cached documents (config.single_flight): one
+# worker rebuilds a missing or old entry, others wait up to the lock timeout
+# (empty cache) or get the old value for up to the grace period (default
+# half the entry's TTL); BETA scales probabilistic refresh before expiry
+SINGLE_FLIGHT_LOCK_TIMEOUT = env.int('SINGLE_FLIGHT_LOCK_TIMEOUT', default=10)
+SINGLE_FLIGHT_GRACE = env.int('SINGLE_FLIGHT_GRACE', default=None)
+SINGLE_FLIGHT_BETA = env.float('SINGLE_FLIGHT_BETA', default=1.0)
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -0,0 +1,186 @@
+"""
+Single-flight rebuilds of expensive cached documents.
+
+``get_or_build(key, build, ttl)`` returns the cached value of ``key`` and
+calls ``build()`` when it is missing or old, so that many requests missing
+the same key at once cause one rebuild instead of one each:
+
+- One rebuild per key. The worker that takes the lock key (``cache.add``)
+  builds; threads of the same process join its build in memory, other
+  processes wait for the value to appear (up to ``SINGLE_FLIGHT_LOCK_TIMEOUT``)
+  and build themselves only if it never does.
+- Stale-while-revalidate. An entry is kept ``grace`` seconds past its
+  ``ttl``; while one worker rebuilds it, the others get the stale value.
+  ``fresh(value)`` can mark a value stale before its ttl (an older version).
+- Probabilistic early refresh. Before the ttl runs out a request may rebuild
+  ahead of time, more likely the closer the expiry and the longer the last
+  build took (XFetch, ``SINGLE_FLIGHT_BETA``), so hot keys are usually
+  refreshed before they expire at all.
+
+Entries are stored through Django's cache; if the cache backend fails, a
+process-local memory cache is used instead. ``build()`` returning None is
+not cached. ``cache.delete(key)`` still drops an entry outright.
+"""
+import logging
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+_BUSY = object()
+
+_local_cache = LocMemCache('single-flight', {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 10000}})
+
+
+def lock_timeout():
+    return getattr(settings, 'SINGLE_FLIGHT_LOCK_TIMEOUT', 10)
+
+
+def default_grace(ttl):
+    grace = getattr(settings, 'SINGLE_FLIGHT_GRACE', None)
+    return grace if grace is not None else max(ttl // 2, 1)
+
+
+def default_beta():
+    return getattr(settings, 'SINGLE_FLIGHT_BETA', 1.0)
+
+
+def lock_key(key):
+    return f'{key}:rebuild'
+
+
+def _call(method, *args, **kwargs):
+    """Операция с кэшем Django или, если он недоступен, с локальным кэшем."""
+    try:
+        return getattr(cache, method)(*args, **kwargs)
+    except Exception:
+        logger.warning('Cache %s failed, using the local cache', method, exc_info=True)
+        return getattr(_local_cache, method)(*args, **kwargs)
+
+
+class _Flight:
+    """
+    Пересборка ключа, к которой присоединяются потоки процесса.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.ok = False
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _join(key):
+    """(сборка, True для ведущего потока)."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+
+def _leave(key, flight):
+    with _flights_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    flight.done.set()
+
+
+def _should_refresh_early(expires, delta, now, beta):
+    """XFetch: обновить раньше срока с вероятностью, растущей к концу ttl."""
+    if not delta or not beta:
+        return False
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires
+
+
+def _store(key, build, ttl, grace):
+    started = time.monotonic()
+    value = build()
+    if value is not None:
+        delta = time.monotonic() - started
+        _call('set', key, (value, time.time() + ttl, delta), ttl + grace)
+    return value
+
+
+def _usable(entry, fresh):
+    if entry is None:
+        return False
+    value, expires, _ = entry
+    return time.time() < expires and (fresh is None or fresh(value))
+
+
+def _wait_for(key, fresh, timeout):
+    """Дождаться значения, которое собирает другой процесс; None по таймауту."""
+    deadline = time.monotonic() + timeout
+    pause = 0.01
+    while time.monotonic() < deadline:
+        time.sleep(pause)
+        pause = min(pause * 2, 0.25)
+        entry = _call('get', key)
+        if _usable(entry, fresh):
+            return entry
+        if _call('get', lock_key(key)) is None:
+            # Сборщик закончил (или упал), не оставив годного значения
+            return None
+    return None
+
+
+def _rebuild(key, build, ttl, grace, fresh, wait):
+    """Пересобрать значение одним сборщиком; _BUSY, если его собирает другой и wait=False."""
+    flight, leader = _join(key)
+    if not leader:
+        if not wait:
+            return _BUSY
+        flight.done.wait(lock_timeout())
+        if flight.ok:
+            return flight.value
+        return _store(key, build, ttl, grace)
+    try:
+        if _call('add', lock_key(key), 1, lock_timeout()):
+            try:
+                value = _store(key, build, ttl, grace)
+            finally:
+                _call('delete', lock_key(key))
+        elif not wait:
+            return _BUSY
+        else:
+            entry = _wait_for(key, fresh, lock_timeout())
+            value = entry[0] if entry is not None else _store(key, build, ttl, grace)
+        flight.value = value
+        flight.ok = True
+        return value
+    finally:
+        _leave(key, flight)
+
+
+def get_or_build(key, build, ttl, grace=None, fresh=None, beta=None):
+    """
+    Значение ключа из кэша или от build() - одна пересборка на ключ.
+
+    ttl - срок свежести (с), grace - сколько еще отдавать устаревшее значение,
+    пока его пересобирает другой запрос; fresh(value) -> False считает
+    значение устаревшим раньше срока.
+    """
+    grace = default_grace(ttl) if grace is None else grace
+    beta = default_beta() if beta is None else beta
+    now = time.time()
+    entry = _call('get', key)
+    if entry is not None:
+        value, expires, delta = entry
+        stale = now >= expires or (fresh is not None and not fresh(value))
+        if not stale and not _should_refresh_early(expires, delta, now, beta):
+            return value
+        # Пересобирает один запрос, остальные получают имеющееся значение
+        result = _rebuild(key, build, ttl, grace, fresh, wait=False)
+        return value if result is _BUSY else result
+    return _rebuild(key, build, ttl, grace, fresh, wait=True)
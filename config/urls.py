@@ -6,6 +6,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from config.views import broadcast_stats, channel_layer_stats
 urlpatterns = [
     # Admin panel
     path('admin/', admin.site.urls),
@@ -21,6 +22,8 @@ urlpatterns = [
     path('api/menu/', include('apps.menu.urls')),
     path('api/orders/', include('apps.orders.urls')),
     path('api/payments/', include('apps.payments.urls')),
+    path('api/broadcast/stats/', broadcast_stats, name='broadcast-stats'),
+    path('api/channel-layer/stats/', channel_layer_stats, name='channel-layer-stats'),
     
     # Main application views
     path('', include('apps.restaurants.urls_web')),  # Landing page
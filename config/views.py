@@ -0,0 +1,27 @@
+"""
+Project-level API views.
+"""
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from channels.layers import get_channel_layer
+
+from config.broadcaster import get_broadcaster
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def broadcast_stats(request):
+    """Queue depth, drops and send latency of this process's broadcaster."""
+    return Response(get_broadcaster().stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def channel_layer_stats(request):
+    """Groups, queue depths and drops of the in-process channel layer."""
+    layer = get_channel_layer()
+    if not hasattr(layer, 'stats'):
+        return Response({'backend': type(layer).__name__})
+    return Response(layer.stats())
@@ -1,13 +1,17 @@
 """
 Django signals for broadcasting events via WebSockets.
-These signals trigger WebSocket group messages when model changes occur.
+These signals trigger WebSocket group messages when model changes occur;
+messages go through config.broadcast, so they are sent after commit and
+repeated updates of one object within a request are collapsed. Payloads
+come from config.payloads and are built from already loaded objects.
 """
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-import json
+from apps.orders.models import Order
+from apps.orders.signals import order_placed, order_transitioned
+from apps.tables.signals import table_occupancy_changed
+from config import broadcast, payloads
 
 
 @receiver(post_save, sender='orders.Order')
@@ -16,102 +20,107 @@ def order_status_changed(sender, instance, created, **kwargs):
     Signal handler for Order model changes.
     Broadcasts order updates to WebSocket consumers.
     """
-    channel_layer = get_channel_layer()
-    
-    order_data = {
-        'id': instance.id,
-        'status': instance.status,
-        'status_display': instance.get_status_display(),
-        'total_amount': str(instance.total_amount),
-        'items_count': instance.items.count(),
-        'created_at': instance.created_at.isoformat(),
-    }
-    
+    broadcast_order_update(instance, created)
+
+
+@receiver(order_placed)
+def order_placed_committed(sender, order, **kwargs):
+    """
+    Signal handler for orders created together with their items.
+    """
+    broadcast_order_update(order, created=True)
+
+
+@receiver(order_transitioned)
+def order_transition_committed(sender, order_ids, **kwargs):
+    """
+    Signal handler for committed order status transitions.
+    Transitions are written with UPDATE, so post_save does not fire for them.
+    """
+    orders = sender.objects.filter(pk__in=order_ids).select_related('table_session__table')
+    for order in orders:
+        broadcast_order_update(order)
+
+
+def broadcast_order_update(instance, created=False):
+    """
+    Broadcast order state to order, restaurant and waiter groups.
+    Reads the table at most once (payloads.load_order_context).
+    """
     # Broadcast to order consumers
-    async_to_sync(channel_layer.group_send)(
+    broadcast.send(
         f'order_{instance.id}',
         {
             'type': 'order_update',
-            'data': order_data
-        }
+            'data': payloads.order_payload(instance)
+        },
+        key=instance.id
     )
     
+    if created or instance.status == Order.Status.READY:
+        payloads.load_order_context([instance])
+        restaurant_id = instance.table_session.table.restaurant_id
+        restaurant_group = f'restaurant_{restaurant_id}'
+    
     # Broadcast to restaurant consumers if order is new
     if created:
-        async_to_sync(channel_layer.group_send)(
-            f'restaurant_{instance.restaurant.id}',
+        broadcast.send(
+            restaurant_group,
             {
                 'type': 'new_order',
-                'data': {
-                    'order_id': instance.id,
-                    'table_number': instance.table_session.table.number,
-                    'items_count': instance.items.count(),
-                    'created_at': instance.created_at.isoformat(),
-                }
-            }
+                'data': payloads.new_order_payload(instance)
+            },
+            restaurant_id=restaurant_id
         )
         
         # Notify waiter if assigned
-        if instance.waiter:
-            async_to_sync(channel_layer.group_send)(
-                f'waiter_{instance.waiter.id}',
+        if instance.waiter_id:
+            broadcast.send(
+                f'waiter_{instance.waiter_id}',
                 {
                     'type': 'order_notification',
-                    'data': {
-                        'order_id': instance.id,
-                        'table_number': instance.table_session.table.number,
-                        'items_count': instance.items.count(),
-                        'message': f'New order for table {instance.table_session.table.number}'
-                    }
-                }
+                    'data': payloads.order_notification_payload(instance)
+                },
+                restaurant_id=restaurant_id
             )
     
     # Notify when order is ready
-    if instance.status == 'ready':
-        async_to_sync(channel_layer.group_send)(
-            f'restaurant_{instance.restaurant.id}',
+    if instance.status == Order.Status.READY:
+        broadcast.send(
+            restaurant_group,
             {
                 'type': 'order_ready',
-                'data': {
-                    'order_id': instance.id,
-                    'table_number': instance.table_session.table.number,
-                    'message': f'Order ready for table {instance.table_session.table.number}'
-                }
-            }
+                'data': payloads.order_ready_payload(instance)
+            },
+            key=instance.id,
+            restaurant_id=restaurant_id
         )
 
 
 @receiver(post_save, sender='tables.Table')
-def table_status_changed(sender, instance, **kwargs):
+def table_status_changed(sender, instance, updated_at=None, **kwargs):
     """
     Signal handler for Table model changes.
     Broadcasts table status updates.
     """
-    channel_layer = get_channel_layer()
-    
-    async_to_sync(channel_layer.group_send)(
+    broadcast.send(
         f'table_{instance.id}',
         {
             'type': 'table_status',
-            'data': {
-                'is_occupied': instance.is_occupied,
-                'is_active': instance.is_active,
-                'updated_at': timezone.now().isoformat(),
-            }
-        }
+            'data': payloads.table_status_payload(instance, updated_at or timezone.now())
+        },
+        key=instance.id
     )
     
     # Broadcast to restaurant consumers
-    async_to_sync(channel_layer.group_send)(
-        f'restaurant_{instance.restaurant.id}',
+    broadcast.send(
+        f'restaurant_{instance.restaurant_id}',
         {
             'type': 'table_update',
-            'data': {
-                'table_id': instance.id,
-                'table_number': instance.number,
-                'is_occupied': instance.is_occupied,
-            }
-        }
+            'data': payloads.table_update_payload(instance)
+        },
+        key=instance.id,
+        restaurant_id=instance.restaurant_id
     )
 
 
@@ -120,32 +129,45 @@ def table_session_changed(sender, instance, created, **kwargs):
     """
     Signal handler for TableSession model changes.
     """
-    channel_layer = get_channel_layer()
-    
+    # Новую сессию открывает apps.tables.occupancy, он же и сообщает о ней
     if created:
-        # Mark table as occupied
-        instance.table.is_occupied = True
-        instance.table.save(update_fields=['is_occupied'])
-        
-        # Notify about new session
-        async_to_sync(channel_layer.group_send)(
-            f'restaurant_{instance.table.restaurant.id}',
-            {
-                'type': 'restaurant_broadcast',
-                'message': f'Guest arrived at table {instance.table.number}'
-            }
-        )
-    
-    # Broadcast session status
-    async_to_sync(channel_layer.group_send)(
-        f'table_session_{instance.id}',
+        return
+    broadcast_session_update(instance, instance.guests_count)
+
+
+@receiver(table_occupancy_changed)
+def table_occupancy_committed(sender, table, session, opened, **kwargs):
+    """
+    Signal handler for committed session open/close.
+    The table is written with UPDATE, so its post_save does not fire;
+    every group gets one message for the whole change.
+    """
+    with broadcast.batch():
+        table_status_changed(sender, table, updated_at=table.updated_at)
+        if opened:
+            broadcast.send(
+                f'restaurant_{table.restaurant_id}',
+                {
+                    'type': 'restaurant_broadcast',
+                    'message': f'Guest arrived at table {table.number}'
+                },
+                restaurant_id=table.restaurant_id
+            )
+        else:
+            broadcast_session_update(session, session.guests_count)
+
+
+def broadcast_session_update(session, guests_count):
+    """Broadcast session status to the session's guests."""
+    data = payloads.session_payload(session, guests_count)
+    data['updated_at'] = timezone.now().isoformat()
+    broadcast.send(
+        f'table_session_{session.id}',
         {
             'type': 'session_update',
-            'data': {
-                'guests_count': instance.guests_count,
-                'updated_at': timezone.now().isoformat(),
-            }
-        }
+            'data': data
+        },
+        key=session.id
     )
 
 
@@ -155,40 +177,32 @@ def payment_status_changed(sender, instance, created, **kwargs):
     Signal handler for Payment model changes.
     Broadcasts payment notifications.
     """
-    channel_layer = get_channel_layer()
+    completed = instance.status == 'completed'
+    if not (created and instance.order_id) and not completed:
+        return
+    waiter_id, restaurant_id = payloads.payment_context(instance)
     
-    payment_data = {
-        'id': instance.id,
-        'payment_id': instance.payment_id,
-        'status': instance.status,
-        'amount': str(instance.amount),
-        'created_at': instance.created_at.isoformat(),
-    }
-    
-    if created:
-        # Notify about new payment
-        if instance.order:
-            async_to_sync(channel_layer.group_send)(
-                f'waiter_{instance.order.waiter.id}',
-                {
-                    'type': 'payment_notification',
-                    'data': {
-                        'payment_id': instance.id,
-                        'order_id': instance.order.id,
-                        'amount': str(instance.amount),
-                        'message': f'Payment of {instance.amount} {instance.currency} received'
-                    }
-                }
-            )
+    # Notify the order's waiter about new payment
+    if created and waiter_id:
+        broadcast.send(
+            f'waiter_{waiter_id}',
+            {
+                'type': 'payment_notification',
+                'data': payloads.payment_notification_payload(instance)
+            },
+            restaurant_id=restaurant_id
+        )
     
-    if instance.status == 'completed':
+    if completed and restaurant_id:
         # Broadcast payment completion
-        async_to_sync(channel_layer.group_send)(
-            f'restaurant_{instance.table_session.table.restaurant.id if instance.table_session else instance.order.restaurant.id}',
+        broadcast.send(
+            f'restaurant_{restaurant_id}',
             {
                 'type': 'payment_completed',
-                'data': payment_data
-            }
+                'data': payloads.payment_payload(instance)
+            },
+            key=instance.id,
+            restaurant_id=restaurant_id
         )
 
 
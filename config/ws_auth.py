@@ -0,0 +1,247 @@
+"""
+Token authentication and group authorization for WebSocket connections.
+
+``TokenAuthMiddleware`` replaces ``AuthMiddlewareStack``: it reads
+``?token=`` from the query string and verifies it without touching the
+database. Staff send a SimpleJWT access token (``/api/auth/token/`` adds the
+``role`` and ``restaurant_id`` claims, ``staff_token()`` issues one for a
+session-authenticated page); guests send the signed token returned when
+they join a table session (``guest_token()``). The result is stored in
+``scope``: ``role``, ``user_id``, ``restaurant_id`` and, for guests,
+``table_session_id`` / ``table_id``.
+
+Consumers check group joins against these scope values. The restaurant of
+a table, session or order is needed only for guest/staff checks on object
+groups; it never changes and is cached (``WS_AUTH_CACHE_TTL``).
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import cache
+
+GUEST_ROLE = 'GUEST'
+SUPERADMIN_ROLE = 'SUPERADMIN'
+STAFF_ROLES = ('SUPERADMIN', 'OWNER', 'WAITER')
+
+GUEST_TOKEN_SALT = 'ws.guest'
+
+# Код закрытия для отклоненного подключения (до accept() - HTTP 403)
+FORBIDDEN = 4403
+
+ANONYMOUS = {
+    'role': None,
+    'user_id': None,
+    'restaurant_id': None,
+    'table_session_id': None,
+    'table_id': None,
+}
+
+
+def cache_ttl():
+    return getattr(settings, 'WS_AUTH_CACHE_TTL', 60 * 60)
+
+
+def guest_token_max_age():
+    return getattr(settings, 'WS_GUEST_TOKEN_MAX_AGE', 12 * 60 * 60)
+
+
+# Выпуск токенов
+def identity_claims(user):
+    """Клеймы роли и ресторана для JWT пользователя."""
+    return {
+        'role': SUPERADMIN_ROLE if user.is_superuser else user.role,
+        'restaurant_id': user.restaurant_id,
+    }
+
+
+def staff_token(user):
+    """Access-токен с клеймами роли для страниц с сессионной авторизацией."""
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    token = AccessToken.for_user(user)
+    for claim, value in identity_claims(user).items():
+        token[claim] = value
+    return token
+
+
+def guest_token(table_session):
+    """Подписанный токен гостя сессии столика."""
+    return signing.dumps(
+        {
+            's': table_session.pk,
+            't': table_session.table_id,
+            'r': table_session.table.restaurant_id,
+        },
+        salt=GUEST_TOKEN_SALT,
+    )
+
+
+# Проверка токенов
+def _user_claims(user_id):
+    """Роль и ресторан для токена без клеймов (выпущенного раньше) из кэша."""
+    from django.contrib.auth import get_user_model
+
+    key = f'ws:user:{user_id}'
+    claims = cache.get(key)
+    if claims is None:
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).only(
+            'pk', 'role', 'is_superuser', 'restaurant_id'
+        ).first()
+        if user is None:
+            return None
+        claims = identity_claims(user)
+        cache.set(key, claims, cache_ttl())
+    return claims
+
+
+def _jwt_identity(raw):
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    try:
+        token = AccessToken(raw)
+    except TokenError:
+        return None
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+    # SimpleJWT хранит id строкой
+    user_id = get_user_model()._meta.pk.to_python(user_id)
+    if 'role' in token:
+        claims = {'role': token['role'], 'restaurant_id': token.get('restaurant_id')}
+    else:
+        claims = _user_claims(user_id)
+        if claims is None:
+            return None
+    return dict(ANONYMOUS, user_id=user_id, **claims)
+
+
+def _guest_identity(raw):
+    try:
+        data = signing.loads(raw, salt=GUEST_TOKEN_SALT, max_age=guest_token_max_age())
+    except signing.BadSignature:
+        return None
+    return dict(
+        ANONYMOUS, role=GUEST_ROLE, restaurant_id=data['r'],
+        table_session_id=data['s'], table_id=data['t']
+    )
+
+
+def authenticate(raw):
+    """Значения scope для токена (ANONYMOUS, если он недействителен)."""
+    if not raw:
+        return dict(ANONYMOUS)
+    # JWT состоит из трех частей через точку, подпись гостя - через двоеточие
+    identity = _jwt_identity(raw) if raw.count('.') == 2 else _guest_identity(raw)
+    return identity or dict(ANONYMOUS)
+
+
+def scope_user(scope):
+    """Пользователь из scope без запроса к базе (для changed_by и т.п.)."""
+    from django.contrib.auth import get_user_model
+
+    if scope.get('user_id') is None:
+        return AnonymousUser()
+    return get_user_model()(pk=scope['user_id'], role=scope['role'])
+
+
+class TokenAuthMiddleware:
+    """
+    Authenticate WebSocket connections by the ``token`` query parameter.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode('latin1'))
+        identity = authenticate(query.get('token', [''])[0])
+        scope = dict(scope, **identity)
+        scope['user'] = scope_user(scope)
+        return await self.inner(scope, receive, send)
+
+
+# Права на подключение к группам
+def is_staff(scope):
+    return scope.get('role') in STAFF_ROLES
+
+
+def is_staff_of(scope, restaurant_id):
+    """Сотрудник ресторана (или суперадминистратор)."""
+    if scope.get('role') == SUPERADMIN_ROLE:
+        return True
+    return is_staff(scope) and str(scope.get('restaurant_id')) == str(restaurant_id)
+
+
+def can_join_waiter(scope, waiter_id):
+    if scope.get('role') == SUPERADMIN_ROLE:
+        return True
+    return is_staff(scope) and str(scope.get('user_id')) == str(waiter_id)
+
+
+def _owner(kind, pk):
+    """(restaurant_id, table_session_id или table_id) объекта из кэша."""
+    from apps.orders.models import Order
+    from apps.tables.models import Table, TableSession
+
+    key = f'ws:owner:{kind}:{pk}'
+    owner = cache.get(key)
+    if owner is None:
+        if kind == 'order':
+            queryset = Order.objects.filter(pk=pk).values_list(
+                'table_session__table__restaurant_id', 'table_session_id'
+            )
+        elif kind == 'session':
+            queryset = TableSession.objects.filter(pk=pk).values_list(
+                'table__restaurant_id', 'table_id'
+            )
+        else:
+            queryset = Table.objects.filter(pk=pk).values_list('restaurant_id', 'pk')
+        try:
+            owner = queryset.first()
+        except (TypeError, ValueError):
+            owner = None
+        if owner is None:
+            return None
+        cache.set(key, tuple(owner), cache_ttl())
+    return owner
+
+
+@database_sync_to_async
+def _owner_async(kind, pk):
+    return _owner(kind, pk)
+
+
+async def _can_join(scope, kind, pk, guest_field):
+    """Гость своего объекта или сотрудник ресторана, которому объект принадлежит."""
+    role = scope.get('role')
+    if role == SUPERADMIN_ROLE:
+        return True
+    if role == GUEST_ROLE and kind != 'order':
+        return str(scope.get(guest_field)) == str(pk)
+    if role != GUEST_ROLE and not is_staff(scope):
+        return False
+    owner = await _owner_async(kind, pk)
+    if owner is None:
+        return False
+    restaurant_id, guest_key = owner
+    if role == GUEST_ROLE:
+        return str(scope.get(guest_field)) == str(guest_key)
+    return str(scope.get('restaurant_id')) == str(restaurant_id)
+
+
+async def can_join_order(scope, order_id):
+    return await _can_join(scope, 'order', order_id, 'table_session_id')
+
+
+async def can_join_session(scope, session_id):
+    return await _can_join(scope, 'session', session_id, 'table_session_id')
+
+
+async def can_join_table(scope, table_id):
+    return await _can_join(scope, 'table', table_id, 'table_id')
@@ -0,0 +1,181 @@
+"""
+Wire formats of WebSocket messages.
+
+JSON text frames are the default. A client that offers the ``msgpack``
+subprotocol (``new WebSocket(url, ['msgpack'])``) gets binary msgpack frames
+in a compact form instead: ``status`` values are small integers, ``*_at``
+timestamps are epoch milliseconds and ``*_display`` labels are dropped. The
+first frame of such a connection is ``{type: 'codec', enums: {...}}`` with
+the tables for turning the integers back into strings.
+
+Incoming frames may be JSON text or msgpack binary in either mode.
+
+Group events are encoded once for all of their recipients:
+``config.broadcast`` attaches the ready frames (``frames``: JSON text and
+msgpack bytes, see ``BROADCAST_FRAMES``) to the channel message, and
+``CodecConsumerMixin.forward`` sends the frame of the connection's format
+unchanged. The client message of an event is the event itself
+(``client_message``), so a message without frames is encoded the same way
+on the consumer.
+"""
+import datetime
+import decimal
+import json
+import uuid
+
+import msgpack
+from django.core.serializers.json import DjangoJSONEncoder
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+CODEC_VERSION = 1
+
+FRAMES_KEY = 'frames'
+
+# Тип сообщения клиента, если он отличается от типа события группы
+CLIENT_TYPES = {
+    'restaurant_broadcast': 'broadcast',
+}
+
+_enums = None
+_codes = None
+
+
+def enums():
+    """Таблицы целочисленных значений перечислений (индекс = код)."""
+    global _enums
+    if _enums is None:
+        from apps.orders.models import Order
+        from apps.payments.models import Payment
+
+        # Статусы заказов и платежей в одной таблице: поле одно - status
+        _enums = {
+            'status': list(dict.fromkeys([*Order.Status.values, *Payment.Status.values])),
+        }
+    return _enums
+
+
+def codes():
+    """Обратные таблицы: {поле: {значение: код}}."""
+    global _codes
+    if _codes is None:
+        _codes = {
+            field: {value: code for code, value in enumerate(values)}
+            for field, values in enums().items()
+        }
+    return _codes
+
+
+def _epoch_ms(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp() * 1000)
+    return value
+
+
+def compact(content, table=None):
+    """Компактная форма сообщения для msgpack."""
+    table = table if table is not None else codes()
+    if isinstance(content, dict):
+        result = {}
+        for key, value in content.items():
+            if key.endswith('_display'):
+                continue
+            if key in table and isinstance(value, str) and value in table[key]:
+                value = table[key][value]
+            elif key.endswith('_at'):
+                value = _epoch_ms(value)
+            else:
+                value = compact(value, table)
+            result[key] = value
+        return result
+    if isinstance(content, (list, tuple)):
+        return [compact(value, table) for value in content]
+    return content
+
+
+def _msgpack_default(value):
+    if isinstance(value, datetime.datetime):
+        return _epoch_ms(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f'Cannot pack {type(value).__name__}')
+
+
+def dumps_json(content):
+    return json.dumps(content, cls=DjangoJSONEncoder)
+
+
+def dumps_msgpack(content):
+    return msgpack.packb(compact(content), default=_msgpack_default)
+
+
+def client_message(event):
+    """Сообщение клиенту из события группы."""
+    content = {key: value for key, value in event.items() if key != FRAMES_KEY}
+    content['type'] = CLIENT_TYPES.get(event['type'], event['type'])
+    return content
+
+
+def with_frames(event, formats=(JSON, MSGPACK)):
+    """Событие с готовыми кадрами для клиентов (кодируется один раз на группу)."""
+    if not formats:
+        return event
+    content = client_message(event)
+    frames = {}
+    if JSON in formats:
+        frames[JSON] = dumps_json(content)
+    if MSGPACK in formats:
+        frames[MSGPACK] = dumps_msgpack(content)
+    return dict(event, **{FRAMES_KEY: frames})
+
+
+def loads(text_data=None, bytes_data=None):
+    """Разобрать входящий кадр; ValueError, если он не JSON и не msgpack."""
+    if text_data is not None:
+        return json.loads(text_data)
+    try:
+        return msgpack.unpackb(bytes_data)
+    except (ValueError, TypeError, msgpack.UnpackException) as exc:
+        raise ValueError('Invalid msgpack frame') from exc
+
+
+class CodecConsumerMixin:
+    """
+    Negotiate the ``msgpack`` subprotocol and encode outgoing messages.
+    """
+
+    binary = False
+
+    async def accept(self, subprotocol=None, headers=None):
+        if subprotocol is None and MSGPACK in self.scope.get('subprotocols', ()):
+            subprotocol = MSGPACK
+        self.binary = subprotocol == MSGPACK
+        await super().accept(subprotocol=subprotocol, headers=headers)
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb({
+                'type': 'codec', 'version': CODEC_VERSION, 'enums': enums()
+            }))
+
+    async def send_message(self, content):
+        """Send a message in the connection's format."""
+        if self.binary:
+            await self.send(bytes_data=dumps_msgpack(content))
+        else:
+            await self.send(text_data=dumps_json(content))
+
+    async def forward(self, event):
+        """Send a group event to the client, reusing its pre-encoded frame."""
+        frame = event.get(FRAMES_KEY, {}).get(MSGPACK if self.binary else JSON)
+        if frame is None:
+            await self.send_message(client_message(event))
+        elif self.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
@@ -0,0 +1,196 @@
+"""
+Benchmark of channel layers on the project's event mix.
+Usage: python scripts/bench_channel_layers.py [--layers local,redis] [--restaurants 10]
+       [--staff 30] [--orders 20] [--json results.json]
+
+Every restaurant has `staff` sockets in its restaurant group, a kitchen
+socket, one socket per waiter and a guest socket per order. The events of
+an order's life are sent with the same payloads, groups and pre-encoded
+frames as ``config.websocket_signals``: new order, waiter notification,
+status updates, kitchen deltas, ready, table status and payment. The
+report shows group_send time, delivery latency and messages per second.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils import timezone
+
+from apps.orders.models import Order
+from apps.payments.models import Payment
+from apps.tables.models import Table, TableSession
+from config import payloads, ws_codec
+
+LAYERS = {
+    'local': {
+        'BACKEND': 'config.channel_layer.LocalChannelLayer',
+        'CONFIG': {'capacity': 10000},
+    },
+    'redis': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [settings.REDIS_URL], 'capacity': 10000},
+    },
+}
+
+WAITERS_PER_RESTAURANT = 5
+
+
+def order_events(restaurant_id, order_id):
+    """(группа, сообщение) всех событий одного заказа."""
+    table = Table(pk=order_id, restaurant_id=restaurant_id, number=str(order_id % 40 + 1))
+    session = TableSession(pk=order_id, table=table)
+    waiter_id = restaurant_id * 100 + order_id % WAITERS_PER_RESTAURANT
+    now = timezone.now()
+    order = Order(
+        pk=order_id, table_session=session, waiter_id=waiter_id, status=Order.Status.PENDING,
+        total_amount=Decimal('2450.00'), items_count=4, created_at=now, updated_at=now
+    )
+    payment = Payment(
+        pk=order_id, order_id=order_id, payment_id=f'pay_{order_id}', amount=order.total_amount,
+        currency='KGS', status=Payment.Status.COMPLETED, created_at=now
+    )
+    restaurant_group = f'restaurant_{restaurant_id}'
+    order_group = f'order_{order_id}'
+    kitchen_group = f'restaurant_{restaurant_id}_kitchen'
+    events = [
+        (restaurant_group, {'type': 'new_order', 'data': payloads.new_order_payload(order)}),
+        (f'waiter_{waiter_id}', {'type': 'order_notification', 'data': payloads.order_notification_payload(order)}),
+        (kitchen_group, {'type': 'kitchen_delta', 'seq': 1, 'action': 'upsert', 'order': payloads.order_payload(order)}),
+    ]
+    for status in (Order.Status.CONFIRMED, Order.Status.PREPARING, Order.Status.READY, Order.Status.DELIVERED):
+        order.status = status
+        events.append((order_group, {'type': 'order_update', 'data': payloads.order_payload(order)}))
+    events += [
+        (restaurant_group, {'type': 'order_ready', 'data': payloads.order_ready_payload(order)}),
+        (kitchen_group, {'type': 'kitchen_delta', 'seq': 2, 'action': 'remove', 'order': {'id': order_id}}),
+        (f'table_{table.pk}', {'type': 'table_status', 'data': payloads.table_status_payload(table, now)}),
+        (restaurant_group, {'type': 'payment_completed', 'data': payloads.payment_payload(payment)}),
+        (f'waiter_{waiter_id}', {'type': 'payment_notification', 'data': payloads.payment_notification_payload(payment)}),
+    ]
+    return events
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_layer(name, options):
+    config = LAYERS[name]
+    layer = import_string(config['BACKEND'])(**config['CONFIG'])
+    members = {}
+    for r in range(1, options.restaurants + 1):
+        groups = [f'restaurant_{r}'] * options.staff + [f'restaurant_{r}_kitchen']
+        groups += [f'waiter_{r * 100 + w}' for w in range(WAITERS_PER_RESTAURANT)]
+        for o in range(options.orders):
+            order_id = r * 100000 + o
+            groups += [f'order_{order_id}', f'table_{order_id}']
+        for group in groups:
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            members.setdefault(group, []).append(channel)
+
+    events = []
+    for r in range(1, options.restaurants + 1):
+        for o in range(options.orders):
+            events += order_events(r, r * 100000 + o)
+    expected = sum(len(members.get(group, ())) for group, _ in events)
+
+    latencies = []
+    received = 0
+    done = asyncio.Event()
+
+    async def reader(channel):
+        nonlocal received
+        while True:
+            message = await layer.receive(channel)
+            latencies.append(time.perf_counter() - message['sent_at'])
+            received += 1
+            if received >= expected:
+                done.set()
+
+    readers = [
+        asyncio.create_task(reader(channel))
+        for channels in members.values() for channel in channels
+    ]
+    send_times = []
+    started = time.perf_counter()
+    for group, message in events:
+        message = ws_codec.with_frames(message)
+        sent_at = time.perf_counter()
+        message['sent_at'] = sent_at
+        await layer.group_send(group, message)
+        send_times.append(time.perf_counter() - sent_at)
+        # Дать получателям прочитать событие, как между запросами
+        await asyncio.sleep(0)
+    try:
+        await asyncio.wait_for(done.wait(), options.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    await layer.flush()
+
+    return {
+        'layer': name,
+        'sockets': len(readers),
+        'events': len(events),
+        'expected': expected,
+        'received': received,
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(received / elapsed) if elapsed else 0,
+        'group_send_ms': {
+            'p50': round(percentile(send_times, 0.5) * 1000, 3),
+            'p99': round(percentile(send_times, 0.99) * 1000, 3),
+        },
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'mean': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--layers', default='local', help='local,redis')
+    parser.add_argument('--restaurants', type=int, default=10)
+    parser.add_argument('--staff', type=int, default=30, help='Сокеты сотрудников в группе ресторана')
+    parser.add_argument('--orders', type=int, default=20, help='Заказы на ресторан')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--json', help='Записать результаты в файл')
+    options = parser.parse_args()
+
+    results = []
+    for name in options.layers.split(','):
+        try:
+            result = asyncio.run(run_layer(name.strip(), options))
+        except Exception as exc:
+            result = {'layer': name, 'error': f'{type(exc).__name__}: {exc}'}
+        results.append(result)
+        print(json.dumps(result, indent=2))
+    if options.json:
+        with open(options.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+WebSocket fan-out load test.
+Usage: python scripts/ws_load_test.py [--restaurants 5] [--waiters 4] [--guests 10]
+       [--url ws://127.0.0.1:8000] [--server-pid PID] [--json results.json] [--keep]
+
+Creates `restaurants` restaurants with `waiters` waiters and `guests` tables
+each (in the configured database, usernames and slugs start with
+``loadtest-``). Every waiter opens a waiter socket and a restaurant socket.
+An order is then placed at every table, its guest opens an order socket, and
+all orders go through confirm -> start_preparing -> mark_ready ->
+mark_delivered. Orders are created with the ORM and moved with
+``Order.transition``, so events go through the real signals, broadcaster,
+channel layer and consumers.
+
+Latency is measured from the database call to the message arriving on the
+socket, per event type. The report gives percentiles, messages per second
+and resident memory per connection, printed and written with ``--json``.
+
+By default the sockets are ``channels.testing.WebsocketCommunicator``
+instances talking to ``config.asgi.application`` in this process. Channel
+layer, event log and kitchen queue are then in-process (``*_BACKEND=local``
+unless set in the environment). With ``--url`` the sockets connect to a
+running server (``daphne config.asgi:application``) through the
+``websockets`` package; the server and this script must share the Redis
+channel layer. Pass ``--server-pid`` to measure the server's memory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PREFIX = 'loadtest-'
+ORIGIN = 'http://localhost'
+STEPS = ('confirm', 'start_preparing', 'mark_ready', 'mark_delivered')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='WebSocket fan-out load test')
+    parser.add_argument('--restaurants', type=int, default=5)
+    parser.add_argument('--waiters', type=int, default=4, help='Официантов на ресторан')
+    parser.add_argument('--guests', type=int, default=10, help='Столиков с заказом на ресторан')
+    parser.add_argument('--url', help='ws://host:port запущенного сервера')
+    parser.add_argument('--server-pid', type=int, help='PID сервера для замера памяти')
+    parser.add_argument('--timeout', type=float, default=30, help='Ожидание событий после шага (с)')
+    parser.add_argument('--json', help='Записать результаты в файл')
+    parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+    return parser.parse_args()
+
+
+def rss_bytes(pid='self'):
+    """Резидентная память процесса (Linux) или None."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(len(values) * fraction))] * 1000, 3)
+
+    return {
+        'count': len(values),
+        'p50': at(0.5),
+        'p90': at(0.9),
+        'p99': at(0.99),
+        'max': round(values[-1] * 1000, 3),
+        'mean': round(statistics.fmean(values) * 1000, 3),
+    }
+
+
+# Данные
+def create_world(options):
+    """Рестораны, официанты и столики с открытыми сессиями."""
+    from apps.accounts.models import User
+    from apps.restaurants.models import Restaurant
+    from apps.tables.models import Table
+    from apps.tables.occupancy import open_session
+
+    run = str(int(time.time()))
+    world = []
+    for r in range(options.restaurants):
+        owner = User.objects.create(username=f'{PREFIX}{run}-owner-{r}', role=User.Role.OWNER)
+        restaurant = Restaurant.objects.create(
+            name=f'Load test {r}', slug=f'{PREFIX}{run}-{r}', owner=owner,
+            phone='0', address='-', city='-'
+        )
+        waiters = [
+            User.objects.create(
+                username=f'{PREFIX}{run}-waiter-{r}-{w}', role=User.Role.WAITER, restaurant=restaurant
+            )
+            for w in range(options.waiters)
+        ]
+        sessions = [
+            open_session(Table.objects.create(
+                restaurant=restaurant, number=str(t + 1), qr_code=f'{PREFIX}{t}.png'
+            ))
+            for t in range(options.guests)
+        ]
+        world.append({'restaurant': restaurant, 'waiters': waiters, 'sessions': sessions})
+    return world
+
+
+def delete_world():
+    from apps.accounts.models import User
+    from apps.restaurants.models import Restaurant
+
+    Restaurant.objects.filter(slug__startswith=PREFIX).delete()
+    User.objects.filter(username__startswith=PREFIX).delete()
+
+
+# Сокеты
+class CommunicatorSocket:
+    """
+    Сокет к приложению в этом процессе.
+    """
+
+    def __init__(self, path):
+        from channels.testing import WebsocketCommunicator
+        from config.asgi import application
+
+        self.communicator = WebsocketCommunicator(
+            application, path, headers=[(b'origin', ORIGIN.encode())]
+        )
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect()
+        if not connected:
+            raise ConnectionError('WebSocket rejected')
+
+    async def receive(self):
+        return await self.communicator.receive_from(timeout=3600)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class RealSocket:
+    """
+    Сокет к запущенному серверу (нужен пакет websockets).
+    """
+
+    def __init__(self, path, base_url):
+        self.url = f'{base_url.rstrip("/")}/{path.lstrip("/")}'
+        self.connection = None
+
+    async def connect(self):
+        try:
+            import websockets
+        except ImportError:
+            raise SystemExit('pip install websockets to use --url')
+        self.connection = await websockets.connect(self.url, origin=ORIGIN, max_queue=None)
+
+    async def receive(self):
+        return await self.connection.recv()
+
+    async def close(self):
+        await self.connection.close()
+
+
+class Recorder:
+    """
+    Время отправки действий и задержки полученных событий.
+    """
+
+    def __init__(self):
+        self.sent = {}
+        self.early = {}
+        self.latencies = {}
+        self.received = 0
+        self.matched = 0
+        self.expected = 0
+        self.changed = asyncio.Event()
+
+    def mark(self, key, count, sent_at=None):
+        sent_at = sent_at or time.perf_counter()
+        self.sent[key] = sent_at
+        self.expected += count
+        # События, пришедшие раньше, чем стал известен их ключ
+        for received_at in self.early.pop(key, ()):
+            self._add(key, received_at - sent_at)
+
+    def key(self, message):
+        event = message.get('type')
+        data = message.get('data') or {}
+        if event in ('new_order', 'order_notification', 'order_ready'):
+            return (event, data.get('order_id'))
+        if event == 'order_update':
+            return (event, data.get('id'), data.get('status'))
+        return None
+
+    def record(self, raw):
+        now = time.perf_counter()
+        self.received += 1
+        message = json.loads(raw)
+        key = self.key(message)
+        if key is None:
+            return
+        sent_at = self.sent.get(key)
+        if sent_at is None:
+            self.early.setdefault(key, []).append(now)
+        else:
+            self._add(key, now - sent_at)
+
+    def _add(self, key, latency):
+        self.latencies.setdefault(key[0], []).append(latency)
+        self.matched += 1
+        self.changed.set()
+
+    async def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.matched < self.expected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+
+async def run(options, world):
+    from asgiref.sync import sync_to_async
+    from apps.orders.models import Order
+    from config.ws_auth import guest_token, staff_token
+
+    def open_socket(path, token):
+        path = f'{path}?token={quote(str(token))}'
+        if options.url:
+            return RealSocket(path, options.url)
+        return CommunicatorSocket(path)
+
+    recorder = Recorder()
+    sockets = []
+    readers = []
+
+    async def attach(socket):
+        await socket.connect()
+        sockets.append(socket)
+
+        async def read():
+            while True:
+                recorder.record(await socket.receive())
+
+        readers.append(asyncio.create_task(read()))
+
+    server_pid = options.server_pid if options.url else 'self'
+    memory_before = rss_bytes(server_pid) if server_pid else None
+    started = time.perf_counter()
+
+    # Сотрудники
+    for entry in world:
+        restaurant = entry['restaurant']
+        for waiter in entry['waiters']:
+            token = staff_token(waiter)
+            await attach(open_socket(f'/ws/waiters/{waiter.pk}/', token))
+            await attach(open_socket(f'/ws/restaurants/{restaurant.pk}/', token))
+
+    # Новые заказы и сокеты гостей
+    orders = []
+    for entry in world:
+        staff = len(entry['waiters'])
+        for index, session in enumerate(entry['sessions']):
+            waiter = entry['waiters'][index % staff] if staff else None
+            sent_at = time.perf_counter()
+            order = await sync_to_async(Order.objects.create)(table_session=session, waiter=waiter)
+            # id заказа известен только после INSERT; события могли прийти раньше
+            recorder.mark(('new_order', order.pk), staff, sent_at)
+            if waiter is not None:
+                recorder.mark(('order_notification', order.pk), 1, sent_at)
+            orders.append((order, waiter, staff))
+            await attach(open_socket(f'/ws/orders/{order.pk}/', guest_token(session)))
+    connect_seconds = time.perf_counter() - started
+    memory_after = rss_bytes(server_pid) if server_pid else None
+    complete = await recorder.wait(options.timeout)
+
+    # Переходы статусов
+    for step in STEPS:
+        status = Order.TRANSITIONS[step].target
+        for order, waiter, staff in orders:
+            recorder.mark(('order_update', order.pk, status), 1)
+            if status == Order.Status.READY:
+                recorder.mark(('order_ready', order.pk), staff)
+            await sync_to_async(order.transition)(step, changed_by=waiter)
+        complete = await recorder.wait(options.timeout) and complete
+
+    elapsed = time.perf_counter() - started
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    for socket in sockets:
+        try:
+            await socket.close()
+        except Exception:
+            pass
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    memory = None
+    if memory_before is not None and memory_after is not None and sockets:
+        memory = (memory_after - memory_before) // len(sockets)
+    return {
+        'mode': 'server' if options.url else 'communicator',
+        'restaurants': options.restaurants,
+        'waiters_per_restaurant': options.waiters,
+        'guests_per_restaurant': options.guests,
+        'connections': len(sockets),
+        'orders': len(orders),
+        'complete': complete,
+        'expected_events': recorder.expected,
+        'matched_events': recorder.matched,
+        'received_messages': recorder.received,
+        'seconds': round(elapsed, 3),
+        'connect_seconds': round(connect_seconds, 3),
+        'messages_per_second': round(recorder.received / elapsed, 1) if elapsed else 0,
+        'latency_ms': percentiles(all_latencies),
+        'latency_ms_by_event': {
+            event: percentiles(values) for event, values in sorted(recorder.latencies.items())
+        },
+        'memory_per_connection_bytes': memory,
+    }
+
+
+def main():
+    options = parse_args()
+    if not options.url:
+        # Все в одном процессе: слой каналов, журнал событий и очередь кухни в памяти
+        for name in ('CHANNEL_LAYER_BACKEND', 'EVENT_LOG_BACKEND', 'KITCHEN_QUEUE_BACKEND'):
+            os.environ.setdefault(name, 'local')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+    world = create_world(options)
+    try:
+        result = asyncio.run(run(options, world))
+    finally:
+        if not options.keep:
+            delete_world()
+    print(json.dumps(result, indent=2))
+    if options.json:
+        with open(options.json, 'w') as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,106 @@
  * Waiter Panel - WebSocket and Real-time Updates
  */
 
+/**
+ * Minimal msgpack decoder for binary WebSocket frames (``msgpack`` subprotocol)
+ */
+function decodeMsgpack(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    const utf8 = new TextDecoder();
+    let offset = 0;
+
+    function str(length) {
+        const value = utf8.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return value;
+    }
+
+    function bin(length) {
+        const value = bytes.slice(offset, offset + length);
+        offset += length;
+        return value;
+    }
+
+    function array(length) {
+        const value = [];
+        for (let i = 0; i < length; i++) value.push(read());
+        return value;
+    }
+
+    function map(length) {
+        const value = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            value[key] = read();
+        }
+        return value;
+    }
+
+    function read() {
+        const byte = bytes[offset++];
+        let value;
+        if (byte <= 0x7f) return byte;
+        if (byte <= 0x8f) return map(byte & 0x0f);
+        if (byte <= 0x9f) return array(byte & 0x0f);
+        if (byte <= 0xbf) return str(byte & 0x1f);
+        if (byte >= 0xe0) return byte - 0x100;
+        switch (byte) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: value = view.getUint8(offset); offset += 1; return bin(value);
+            case 0xc5: value = view.getUint16(offset); offset += 2; return bin(value);
+            case 0xc6: value = view.getUint32(offset); offset += 4; return bin(value);
+            case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+            case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+            case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+            case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+            case 0xce: value = view.getUint32(offset); offset += 4; return value;
+            case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+            case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+            case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+            case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+            case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+            case 0xd9: value = view.getUint8(offset); offset += 1; return str(value);
+            case 0xda: value = view.getUint16(offset); offset += 2; return str(value);
+            case 0xdb: value = view.getUint32(offset); offset += 4; return str(value);
+            case 0xdc: value = view.getUint16(offset); offset += 2; return array(value);
+            case 0xdd: value = view.getUint32(offset); offset += 4; return array(value);
+            case 0xde: value = view.getUint16(offset); offset += 2; return map(value);
+            case 0xdf: value = view.getUint32(offset); offset += 4; return map(value);
+            default: throw new Error(`Unsupported msgpack type 0x${byte.toString(16)}`);
+        }
+    }
+
+    return read();
+}
+
+/**
+ * Turn a compact msgpack message back into the JSON shape:
+ * integer enums to strings, epoch milliseconds (*_at) to ISO strings
+ */
+function expandMessage(value, enums) {
+    if (Array.isArray(value)) {
+        return value.map(item => expandMessage(item, enums));
+    }
+    if (value === null || typeof value !== 'object') {
+        return value;
+    }
+    const result = {};
+    Object.keys(value).forEach(key => {
+        const item = value[key];
+        if (enums[key] && typeof item === 'number') {
+            result[key] = enums[key][item];
+        } else if (key.endsWith('_at') && typeof item === 'number') {
+            result[key] = new Date(item).toISOString();
+        } else {
+            result[key] = expandMessage(item, enums);
+        }
+    });
+    return result;
+}
+
 class WaiterPanel {
     constructor() {
         this.ws = null;
@@ -9,17 +109,34 @@ class WaiterPanel {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.reconnectDelay = 3000;
+        // Binary msgpack frames when the browser can decode them
+        this.useMsgpack = typeof TextDecoder !== 'undefined';
+        this.enums = {};
     }
 
     /**
      * Initialize WebSocket connection
      */
     connect() {
+        this.getWsToken()
+            .then(token => this.openWebSocket(token))
+            .catch(error => {
+                console.error('Error getting WebSocket token:', error);
+                this.scheduleReconnect();
+            });
+    }
+
+    /**
+     * Open the WebSocket with a token
+     */
+    openWebSocket(token) {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const url = `${protocol}//${window.location.host}/ws/waiters/${this.waiterId}/`;
+        const query = token ? `?token=${encodeURIComponent(token)}` : '';
+        const url = `${protocol}//${window.location.host}/ws/waiters/${this.waiterId}/${query}`;
         
         try {
-            this.ws = new WebSocket(url);
+            this.ws = this.useMsgpack ? new WebSocket(url, ['msgpack']) : new WebSocket(url);
+            this.ws.binaryType = 'arraybuffer';
             
             this.ws.onopen = () => this.handleOpen();
             this.ws.onmessage = (event) => this.handleMessage(event);
@@ -50,7 +167,8 @@ class WaiterPanel {
      */
     handleMessage(event) {
         try {
-            const data = JSON.parse(event.data);
+            const data = this.decode(event.data);
+            if (data === null) return;
             console.log('Received message:', data);
             
             // Dispatch to appropriate handler
@@ -66,6 +184,22 @@ class WaiterPanel {
         }
     }
 
+    /**
+     * Decode a text (JSON) or binary (msgpack) frame; null for codec frames
+     */
+    decode(raw) {
+        if (typeof raw === 'string') {
+            return JSON.parse(raw);
+        }
+        const data = decodeMsgpack(raw);
+        if (data.type === 'codec') {
+            // Tables for integer enums, sent once after connect
+            this.enums = data.enums || {};
+            return null;
+        }
+        return expandMessage(data, this.enums);
+    }
+
     /**
      * Handle task updates
      */
@@ -203,6 +337,27 @@ class WaiterPanel {
         }, 3000);
     }
 
+    /**
+     * Get WebSocket token (JWT access token) rendered into the page;
+     * renewed from the API a minute before it expires
+     */
+    getWsToken() {
+        const page = document.body.dataset;
+        if (page.wsToken && Date.now() / 1000 < Number(page.wsTokenExpires) - 60) {
+            return Promise.resolve(page.wsToken);
+        }
+        return fetch('/waiter/api/ws-token/', {credentials: 'same-origin'})
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then(data => {
+                page.wsToken = data.token;
+                page.wsTokenExpires = data.expires_at;
+                return data.token;
+            });
+    }
+
     /**
      * Get waiter ID from page context
      */